@@ -1,56 +1,63 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Dict, Any, Literal
+from uuid import uuid4
+from contextlib import aclosing
+import anyio
 import asyncio
+import hashlib
 import json
-import os
-import re
+import logging
 import requests
 
+from app.config import settings
+from app.core.admission import AdmissionController, AdmissionLease, AdmissionRejected
 from app.core.agentkit_client import AgentKitClient
-from app.repositories.messages_repo import MessagesRepo
-from app.repositories.sessions_repo import SessionsRepo
-from app.core.db import get_engine
+from app.repositories.messages_repo import AsyncMessagesRepo, MessagesRepo
+from app.repositories.sessions_repo import AsyncSessionsRepo, SessionsRepo
+from app.core.db import call_repo
+from app.api.deps import get_messages_repo, get_sessions_repo
+from app.services.answer_cache import AnswerCache, answer_cache_key
+from app.services.chat_turns import ChatTurn, TurnRegistry
+from app.services.chunker import StreamChunker
+from app.services.pacing import PACING_OFF, Pacer, PacingConfig
+from app.services.sse import accepts_gzip, dumps, event_stream, gzip_stream, negotiate_format
 from app.services.session_title import async_generate
+from app.services.write_behind import get_write_behind
 
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 agent = AgentKitClient()
-
-def split_text(text: str, max_chars: int) -> List[str]:
-    if max_chars <= 0 or len(text) <= max_chars:
-        return [text]
-
-    tokens = re.findall(r"\S+\s*", text)
-    if not tokens:
-        return [text[i : i + max_chars] for i in range(0, len(text), max_chars)]
-
-    parts: List[str] = []
-    buf = ""
-    for token in tokens:
-        if not buf:
-            buf = token
-            continue
-
-        if len(buf) + len(token) <= max_chars:
-            buf += token
-        else:
-            parts.append(buf)
-            buf = token
-
-    if buf:
-        parts.append(buf)
-
-    final_parts: List[str] = []
-    for part in parts:
-        if len(part) <= max_chars:
-            final_parts.append(part)
-            continue
-        final_parts.extend(part[i : i + max_chars] for i in range(0, len(part), max_chars))
-
-    return final_parts
-
+admission = AdmissionController(
+    max_concurrent=settings.chat_max_concurrent_streams,
+    max_per_user=settings.chat_max_streams_per_user,
+    queue_size=settings.chat_admission_queue_size,
+    wait_timeout=settings.chat_admission_wait_seconds,
+)
+turns = TurnRegistry(
+    buffer_size=settings.chat_resume_buffer_events,
+    ttl_seconds=settings.chat_resume_ttl_seconds,
+    dedup_window_seconds=settings.chat_dedup_window_seconds,
+    abandon_grace_seconds=settings.chat_abandon_grace_seconds,
+    max_lag_events=settings.chat_stream_max_lag_events,
+)
+answer_cache: AnswerCache | None = (
+    AnswerCache(
+        max_entries=settings.chat_answer_cache_max_entries,
+        ttl_seconds=settings.chat_answer_cache_ttl_seconds,
+        max_bytes=settings.chat_answer_cache_max_mb * 1024 * 1024,
+    )
+    if settings.chat_answer_cache_enabled
+    else None
+)
+stream_pacing = PacingConfig(
+    chunk_size=settings.chat_stream_chunk_size,
+    chunk_delay_ms=settings.chat_stream_chunk_delay_ms,
+    punct_delay_ms=settings.chat_stream_punct_delay_ms,
+    max_delay_ms=settings.chat_stream_max_delay_ms,
+)
 
 # ---------- request / response models ----------
 
@@ -58,6 +65,8 @@ class ChatRequest(BaseModel):
     session_id: str
     text: str
     use_public_paper: bool = False
+    # default：按 CHAT_STREAM_* 分块限速输出（打字机效果）；off：原样转发上游，不分块不等待
+    pacing: Literal["default", "off"] = "default"
 
 
 class ChatResponse(BaseModel):
@@ -65,14 +74,16 @@ class ChatResponse(BaseModel):
     parts: List[Dict[str, Any]]
 
 
-# ---------- dependencies ----------
-
-def get_messages_repo() -> MessagesRepo:
-    return MessagesRepo(get_engine())
+class ChatBatchItem(BaseModel):
+    session_id: str
+    text: str
+    use_public_paper: bool = False
 
 
-def get_sessions_repo() -> SessionsRepo:
-    return SessionsRepo(get_engine())
+class ChatBatchRequest(BaseModel):
+    items: List[ChatBatchItem] = Field(min_length=1)
+    # 不传则使用 CHAT_BATCH_MAX_CONCURRENCY；传入更大的值同样会被截断到该上限
+    concurrency: int | None = Field(default=None, ge=1)
 
 
 # ---------- api ----------
@@ -80,90 +91,761 @@ def get_sessions_repo() -> SessionsRepo:
 @router.post("/chat")
 async def chat(
     payload: ChatRequest,
-    messages_repo: MessagesRepo = Depends(get_messages_repo),
-    sessions_repo: SessionsRepo = Depends(get_sessions_repo),
+    stream: bool = Query(default=True),
+    idempotency_key: str | None = Header(default=None),
+    x_answer_cache: str | None = Header(default=None),
+    accept: str | None = Header(default=None),
+    accept_encoding: str | None = Header(default=None),
+    messages_repo: MessagesRepo | AsyncMessagesRepo = Depends(get_messages_repo),
+    sessions_repo: SessionsRepo | AsyncSessionsRepo = Depends(get_sessions_repo),
+):
+    turn, coalesced, extra_headers = await _start_turn(
+        payload,
+        messages_repo,
+        sessions_repo,
+        idempotency_key=idempotency_key,
+        x_answer_cache=x_answer_cache,
+        stream=stream,
+    )
+    if not stream:
+        return await _collect_response(turn, coalesced=coalesced, extra_headers=extra_headers)
+    return _stream_response(
+        turn,
+        last_event_id=0,
+        coalesced=coalesced,
+        extra_headers=extra_headers,
+        accept=accept,
+        accept_encoding=accept_encoding,
+    )
+
+
+@router.post("/chat/batch")
+async def chat_batch(
+    payload: ChatBatchRequest,
+    messages_repo: MessagesRepo | AsyncMessagesRepo = Depends(get_messages_repo),
+    sessions_repo: SessionsRepo | AsyncSessionsRepo = Depends(get_sessions_repo),
+):
+    """
+    批量对话：并发执行多条提问，按完成顺序输出 NDJSON（每行带条目下标 index）。
+    不分块、不限速；同一时间完成的条目合并为一次数据库写入。
+    """
+    if len(payload.items) > settings.chat_batch_max_items:
+        raise HTTPException(
+            status_code=422,
+            detail=f"too many items: {len(payload.items)} > {settings.chat_batch_max_items}",
+        )
+    concurrency = min(payload.concurrency or settings.chat_batch_max_concurrency, settings.chat_batch_max_concurrency)
+
+    return TurnStreamingResponse(
+        _run_batch(payload.items, max(1, concurrency), messages_repo, sessions_repo),
+        media_type="application/x-ndjson; charset=utf-8",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/chat/ws")
+async def chat_ws(
+    websocket: WebSocket,
+    messages_repo: MessagesRepo | AsyncMessagesRepo = Depends(get_messages_repo),
+    sessions_repo: SessionsRepo | AsyncSessionsRepo = Depends(get_sessions_repo),
+):
+    """
+    一条 WebSocket 连接上复用多个会话的对话轮次。客户端消息：
+    - {"type": "chat", "request_id"?, "session_id", "text", "use_public_paper"?, "pacing"?, "idempotency_key"?}
+    - {"type": "resume", "request_id"?, "turn_id", "last_event_id"?}
+    - {"type": "cancel", "request_id" | "turn_id"}
+    服务端帧都带 request_id / session_id / turn_id，事件类型与 SSE 相同（text / thought / error），
+    轮次开始时发 {"type": "turn"}，结束时发 {"type": "done"}。
+    """
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    # request_id -> 负责该请求的任务（启动轮次 + 转发事件）
+    requests_in_flight: Dict[str, asyncio.Task[None]] = {}
+    turn_of_request: Dict[str, ChatTurn] = {}
+
+    async def send(frames: List[Dict[str, Any]]) -> None:
+        # 多个轮次共用一个连接：一次只有一个任务在写，写不动时各自的转发任务停在这里（背压传回轮次）
+        async with send_lock:
+            for frame in frames:
+                await websocket.send_text(dumps(frame))
+
+    async def forward(request_id: str, turn: ChatTurn, last_event_id: int) -> None:
+        tags = {"request_id": request_id, "session_id": turn.session_id, "turn_id": turn.turn_id}
+        turn_of_request[request_id] = turn
+        async with aclosing(turn.subscribe_batches(last_event_id, settings.chat_sse_max_batch_events)) as batches:
+            async for batch in batches:
+                await send([{**tags, "id": event_id, **event} for event_id, event in batch])
+        await send([{**tags, "type": "done"}])
+
+    async def run_chat(request_id: str, message: Dict[str, Any]) -> None:
+        try:
+            payload = ChatRequest.model_validate(message)
+            turn, coalesced, _ = await _start_turn(
+                payload,
+                messages_repo,
+                sessions_repo,
+                idempotency_key=message.get("idempotency_key"),
+            )
+        except ValidationError as e:
+            await send([_ws_error(request_id, 422, e.errors(include_url=False, include_context=False))])
+            return
+        except HTTPException as e:
+            await send([_ws_error(request_id, e.status_code, e.detail)])
+            return
+        except Exception as e:
+            await send([_ws_error(request_id, 500, f"Stream error: {str(e)}")])
+            return
+        # 轮次一启动就登记：在 "turn" 帧写出、开始转发之前到达的 cancel 也能找到并取消它
+        turn_of_request[request_id] = turn
+        await send(
+            [
+                {
+                    "type": "turn",
+                    "request_id": request_id,
+                    "session_id": turn.session_id,
+                    "turn_id": turn.turn_id,
+                    "coalesced": coalesced,
+                }
+            ]
+        )
+        await forward(request_id, turn, 0)
+
+    async def run_resume(request_id: str, message: Dict[str, Any]) -> None:
+        turn = turns.get(str(message.get("turn_id")))
+        if turn is None:
+            await send([_ws_error(request_id, 404, "turn not found")])
+            return
+        try:
+            after = int(message.get("last_event_id") or 0)
+        except (TypeError, ValueError):
+            await send([_ws_error(request_id, 400, "invalid last_event_id")])
+            return
+        await forward(request_id, turn, after)
+
+    async def cancel(message: Dict[str, Any]) -> None:
+        request_id = message.get("request_id")
+        if request_id is None and message.get("turn_id"):
+            request_id = next(
+                (rid for rid, t in turn_of_request.items() if t.turn_id == message["turn_id"]), None
+            )
+        task = requests_in_flight.pop(request_id, None) if request_id is not None else None
+        if task is None:
+            await send([_ws_error(request_id, 404, "request not found")])
+            return
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        turn = turn_of_request.pop(request_id, None)
+        # 其它连接（或本连接的其它请求）仍在收这一轮时只停止本请求的转发
+        if turn is not None and turn.subscribers == 0:
+            turns.abort(turn, "client_cancelled")
+        await send(
+            [
+                {
+                    "type": "cancelled",
+                    "request_id": request_id,
+                    "session_id": turn.session_id if turn else None,
+                    "turn_id": turn.turn_id if turn else None,
+                }
+            ]
+        )
+
+    def spawn(request_id: str, coro) -> None:
+        task = asyncio.create_task(coro)
+        requests_in_flight[request_id] = task
+
+        def cleanup(t: asyncio.Task[None]) -> None:
+            if requests_in_flight.get(request_id) is t:
+                del requests_in_flight[request_id]
+                turn_of_request.pop(request_id, None)
+
+        task.add_done_callback(cleanup)
+
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                await send([_ws_error(None, 400, "invalid JSON")])
+                continue
+            if not isinstance(message, dict):
+                await send([_ws_error(None, 400, "message must be a JSON object")])
+                continue
+
+            message_type = message.get("type")
+            request_id = str(message.get("request_id") or uuid4())
+            if message_type in ("chat", "resume"):
+                if request_id in requests_in_flight:
+                    await send([_ws_error(request_id, 409, "duplicate request_id")])
+                    continue
+                spawn(request_id, (run_chat if message_type == "chat" else run_resume)(request_id, message))
+            elif message_type == "cancel":
+                await cancel(message)
+            else:
+                await send([_ws_error(request_id, 400, f"unknown message type: {message_type}")])
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # 连接断开：只停止转发，轮次按 CHAT_ABANDON_GRACE_SECONDS 处理（可通过 SSE / 新连接续传）
+        tasks = list(requests_in_flight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@router.get("/chat/turns/{turn_id}/stream")
+async def resume_chat(
+    turn_id: str,
+    last_event_id: str | None = Header(default=None),
+    accept: str | None = Header(default=None),
+    accept_encoding: str | None = Header(default=None),
 ):
+    """
+    断线续传：先重放 Last-Event-ID 之后的缓冲事件，再接上仍在进行的输出。
+    """
+    turn = turns.get(turn_id)
+    if turn is None:
+        raise HTTPException(status_code=404, detail="turn not found")
+
+    try:
+        after = int(last_event_id) if last_event_id else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid Last-Event-ID")
+
+    return _stream_response(turn, last_event_id=after, accept=accept, accept_encoding=accept_encoding)
+
+
+# ---------- streaming ----------
+
+async def _start_turn(
+    payload: ChatRequest,
+    messages_repo: MessagesRepo | AsyncMessagesRepo,
+    sessions_repo: SessionsRepo | AsyncSessionsRepo,
+    idempotency_key: str | None = None,
+    x_answer_cache: str | None = None,
+    stream: bool = True,
+) -> tuple[ChatTurn, bool, Dict[str, str]]:
+    """
+    校验会话、合并重复提交、查回答缓存、准入控制、保存用户消息并启动生产者任务。
+    HTTP 与 WebSocket 共用；失败时抛出 HTTPException。返回 (轮次, 是否合并到已有轮次, 额外响应头)。
+    """
     session_id = payload.session_id
     user_text = payload.text
 
-    session = sessions_repo.get_session(session_id)
+    session = await call_repo(sessions_repo.get_session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="session not found")
     if session.get("status") != "active":
         raise HTTPException(status_code=409, detail="session is not active")
 
-    # 1️⃣ save user message
-    messages_repo.save_message(
-        session_id=session_id,
-        role="user",
-        parts=[
-            {
-                "type": "text",
-                "content": user_text,
-            }
-        ],
-    )
+    # 重复提交（双击 / 客户端重试）直接订阅已在进行的轮次，不再重复落库、不再调用上游
+    dedup_key = _dedup_key(session_id, payload, idempotency_key)
+    existing = turns.find_duplicate(dedup_key)
+    if existing is not None:
+        return existing, True, {}
 
-    sessions_repo.touch_session(session_id)
+    # 先占住去重 key（中间没有 await），保证并发的重复请求也能合并到这一轮
+    turn = turns.create(session_id, dedup_key=dedup_key)
 
-    async def event_generator():
-        full_answer = ""
-        max_chars = int(os.getenv("CHAT_STREAM_CHUNK_SIZE", "16"))
-        base_delay_ms = int(os.getenv("CHAT_STREAM_CHUNK_DELAY_MS", "25"))
-        punct_delay_ms = int(os.getenv("CHAT_STREAM_PUNCT_DELAY_MS", "80"))
-        punct_chars = set("。！？!?；;.\n")
+    # 公开论文库问答缓存（可选）：命中时按原事件序列重放，不调用上游
+    cache_key: str | None = None
+    cached_events: list[Dict[str, Any]] | None = None
+    extra_headers: Dict[str, str] = {}
+    if answer_cache is not None and payload.use_public_paper:
+        cache_key = answer_cache_key(user_text, payload.use_public_paper)
+        if (x_answer_cache or "").strip().lower() == "bypass":
+            answer_cache.record_bypass()
+            extra_headers["X-Answer-Cache"] = "bypass"
+        else:
+            cached_events = answer_cache.get(cache_key)
+            extra_headers["X-Answer-Cache"] = "hit" if cached_events is not None else "miss"
+
+    # 准入控制：超出并发与等待队列时快速返回 429，不保存用户消息、不占用上游
+    # 缓存命中不占用上游，不需要名额
+    lease: AdmissionLease | None = None
+    if cached_events is None:
         try:
-            async for chunk in agent.astream_chat(
-                session_id=session_id,
-                text=user_text,
-                use_public_paper=payload.use_public_paper,
-            ):
-                if chunk.get("type") == "text":
-                    content = chunk.get("content", "")
-                    for part in split_text(content, max_chars):
-                        out_chunk = dict(chunk)
-                        out_chunk["content"] = part
-                        yield f"data: {json.dumps(out_chunk)}\n\n"
-                        full_answer += part
-                        if base_delay_ms > 0:
-                            delay_seconds = base_delay_ms / 1000.0
-                            if punct_delay_ms > 0 and part and part[-1] in punct_chars:
-                                delay_seconds += punct_delay_ms / 1000.0
-                            delay_seconds = min(delay_seconds, 0.2)
-                            await asyncio.sleep(delay_seconds)
-                elif chunk.get("type") == "error":
-                    yield f"data: {json.dumps(chunk)}\n\n"
-                    full_answer += f"\n[Error: {chunk.get('content')}]"
-                else:
-                    yield f"data: {json.dumps(chunk)}\n\n"
-
-            # Save assistant message after stream ends
-            if full_answer:
-                assistant_parts = [
+            lease = await admission.acquire(session.get("user_id") or "")
+        except AdmissionRejected as e:
+            detail = f"too many concurrent chats: {e.reason}"
+            _abort_turn(turn, detail)
+            raise HTTPException(
+                status_code=429,
+                detail=detail,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except asyncio.CancelledError:
+            # 排队期间调用方被取消（例如 WebSocket 发来 cancel）：释放去重 key，不留下永远进行中的轮次
+            _abort_turn(turn, "Stream aborted: cancelled")
+            raise
+
+    try:
+        # 1️⃣ save user message
+        await _persist_message(
+            messages_repo,
+            sessions_repo,
+            session_id,
+            "user",
+            [
+                {
+                    "type": "text",
+                    "content": user_text,
+                }
+            ],
+        )
+    except BaseException as e:
+        if lease is not None:
+            lease.release()
+        _abort_turn(turn, f"Stream error: {str(e)}")
+        raise
+
+    turn.task = asyncio.create_task(
+        _run_turn(
+            turn,
+            user_text=user_text,
+            use_public_paper=payload.use_public_paper,
+            messages_repo=messages_repo,
+            sessions_repo=sessions_repo,
+            lease=lease,
+            cache_key=cache_key,
+            cached_events=cached_events,
+            # stream=false 时没有打字机效果可言，不分块不等待
+            pacing=PACING_OFF if payload.pacing == "off" or not stream else stream_pacing,
+        )
+    )
+    return turn, False, extra_headers
+
+
+
+def _dedup_key(session_id: str, payload: ChatRequest, idempotency_key: str | None) -> str:
+    if idempotency_key:
+        return f"idem:{session_id}:{idempotency_key}"
+    digest = hashlib.sha256(payload.text.encode("utf-8")).hexdigest()
+    return f"auto:{session_id}:{int(payload.use_public_paper)}:{digest}"
+
+
+def _ws_error(request_id: str | None, status: int, detail: Any) -> Dict[str, Any]:
+    return {"type": "error", "request_id": request_id, "status": status, "content": detail}
+
+
+def _abort_turn(turn: ChatTurn, message: str) -> None:
+    # 轮次没能启动：已合并进来的订阅者收到错误后结束，key 释放给后续请求
+    turn.publish({"type": "error", "content": message})
+    turn.finish()
+    turns.discard(turn)
+
+
+async def _collect_response(
+    turn: ChatTurn,
+    coalesced: bool = False,
+    extra_headers: Dict[str, str] | None = None,
+) -> JSONResponse:
+    """
+    stream=false：在进程内读完本轮事件后一次性返回。
+    answer 与落库的助手消息内容一致（错误同样以 "[Error: ...]" 追加），error 事件另外附在 parts 中。
+    响应头与流式模式相同（X-Chat-Turn-Id、X-Chat-Coalesced、X-Answer-Cache）。
+    """
+    answer_parts: list[str] = []
+    errors: list[Dict[str, Any]] = []
+    async with aclosing(turn.subscribe()) as events:
+        async for _, event in events:
+            event_type = event.get("type")
+            if event_type == "text":
+                answer_parts.append(event.get("content", ""))
+            elif event_type == "error":
+                answer_parts.append(f"\n[Error: {event.get('content')}]")
+                errors.append(event)
+
+    answer = "".join(answer_parts)
+    body = ChatResponse(answer=answer, parts=_response_parts(answer, errors))
+    headers = {
+        "X-Chat-Turn-Id": turn.turn_id,
+        "X-Chat-Coalesced": "true" if coalesced else "false",
+        **(extra_headers or {}),
+    }
+    return JSONResponse(content=body.model_dump(), headers=headers)
+
+
+def _response_parts(answer: str, errors: list[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # error 与 text 同样是 {"type", "content", "metadata"}
+    parts: List[Dict[str, Any]] = []
+    if answer:
+        parts.append({"type": "text", "content": answer, "metadata": None})
+    parts.extend({"type": "error", "content": e.get("content"), "metadata": None} for e in errors)
+    return parts
+
+
+class TurnStreamingResponse(StreamingResponse):
+    """
+    ASGI spec 2.4 下 Starlette 只在写出失败时才发现客户端断开，上游长时间没有输出时断开无从察觉。
+    这里始终并行监听 http.disconnect：断开即取消输出协程，订阅数及时归零，触发放弃计时。
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        async with anyio.create_task_group() as task_group:
+
+            async def stream() -> None:
+                try:
+                    await self.stream_response(send)
+                except OSError:
+                    pass
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(stream)
+            await self.listen_for_disconnect(receive)
+            task_group.cancel_scope.cancel()
+
+
+def _stream_response(
+    turn: ChatTurn,
+    last_event_id: int,
+    coalesced: bool = False,
+    extra_headers: Dict[str, str] | None = None,
+    accept: str | None = None,
+    accept_encoding: str | None = None,
+) -> TurnStreamingResponse:
+    # Accept 选择 SSE / NDJSON；开启 CHAT_STREAM_GZIP 且客户端接受 gzip 时整条流压缩
+    fmt = negotiate_format(accept)
+    body = event_stream(
+        turn,
+        last_event_id,
+        heartbeat_seconds=settings.chat_sse_heartbeat_seconds,
+        max_batch_events=settings.chat_sse_max_batch_events,
+        fmt=fmt,
+    )
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        "Connection": "keep-alive",
+        "X-Chat-Turn-Id": turn.turn_id,
+        "X-Chat-Coalesced": "true" if coalesced else "false",
+        "Vary": "Accept, Accept-Encoding",
+        **(extra_headers or {}),
+    }
+    if settings.chat_stream_gzip and accepts_gzip(accept_encoding):
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+
+    return TurnStreamingResponse(body, media_type=fmt.media_type, headers=headers)
+
+
+async def _run_turn(
+    turn: ChatTurn,
+    user_text: str,
+    use_public_paper: bool,
+    messages_repo: MessagesRepo | AsyncMessagesRepo,
+    sessions_repo: SessionsRepo | AsyncSessionsRepo,
+    lease: AdmissionLease | None,
+    cache_key: str | None = None,
+    cached_events: list[Dict[str, Any]] | None = None,
+    pacing: PacingConfig | None = None,
+) -> None:
+    """
+    一轮对话的生产者：独立于 HTTP 连接运行，客户端短暂断开后仍会把回答写入缓冲并落库，
+    以便通过 /chat/turns/{turn_id}/stream 续传。所有订阅者断开超过 CHAT_ABANDON_GRACE_SECONDS
+    时本任务被取消：关闭上游流（释放 HTTP 连接），已输出的部分带 truncated 标记落库。
+
+    cached_events 不为空时重放缓存的上游事件（分块、节奏、落库与实时调用完全一致）；
+    否则调用上游，并在 cache_key 不为空且本轮无错误时写入回答缓存。
+    """
+    session_id = turn.session_id
+    if cached_events is not None:
+        source = _replay_events(cached_events)
+        recorded: list[Dict[str, Any]] | None = None
+    else:
+        source = agent.astream_chat(
+            session_id=session_id,
+            text=user_text,
+            use_public_paper=use_public_paper,
+        )
+        recorded = [] if cache_key is not None and answer_cache is not None else None
+    failed = False
+    # 最终回答已交给落库：之后再被取消（放弃计时 / WebSocket cancel）不能再按截断保存一遍
+    persisted = False
+    # 回答按块收集，结束时只 join 一次
+    answer_parts: list[str] = []
+    pacing = pacing or stream_pacing
+    chunker = StreamChunker(pacing.chunk_size)
+    pacer = Pacer(pacing)
+
+    async def emit(pieces: list[str]) -> None:
+        for part in pieces:
+            await pacer.pace(part)
+            await turn.drain()
+            turn.publish({"type": "text", "content": part})
+            answer_parts.append(part)
+
+    try:
+        async for chunk in source:
+            if recorded is not None:
+                recorded.append(chunk)
+            chunk_type = chunk.get("type")
+            if chunk_type == "text":
+                await emit(chunker.feed(chunk.get("content", "")))
+            elif chunk_type == "error":
+                failed = True
+                await emit(chunker.flush())
+                turn.publish(chunk)
+                answer_parts.append(f"\n[Error: {chunk.get('content')}]")
+            else:
+                turn.publish(chunk)
+        await emit(chunker.flush())
+        full_answer = "".join(answer_parts)
+
+        # Save assistant message after stream ends
+        if full_answer:
+            assistant_parts = [
+                {
+                    "type": "text",
+                    "content": full_answer,
+                    "metadata": None,
+                }
+            ]
+            persisted = True
+            # shield：取消只打断等待，保存 / 刷新会话 / 标题生成照常完成
+            await asyncio.shield(
+                _persist_message(
+                    messages_repo,
+                    sessions_repo,
+                    session_id,
+                    "assistant",
+                    assistant_parts,
+                    generate_title=True,
+                )
+            )
+
+        if recorded is not None and not failed and full_answer:
+            answer_cache.put(cache_key, recorded)
+
+    except asyncio.CancelledError:
+        if persisted:
+            raise
+        reason = turn.abort_reason or "cancelled"
+        for part in chunker.flush():
+            turn.publish({"type": "text", "content": part})
+            answer_parts.append(part)
+        turn.publish({"type": "error", "content": f"Stream aborted: {reason}"})
+        partial_answer = "".join(answer_parts)
+        if partial_answer:
+            await _persist_message(
+                messages_repo,
+                sessions_repo,
+                session_id,
+                "assistant",
+                [
                     {
                         "type": "text",
-                        "content": full_answer,
-                        "metadata": None,
+                        "content": partial_answer,
+                        "metadata": {"truncated": True, "reason": reason},
                     }
-                ]
-                messages_repo.save_message(
-                    session_id=session_id,
-                    role="assistant",
-                    parts=assistant_parts,
-                )
-                sessions_repo.touch_session(session_id)
-                async_generate(session_id)
+                ],
+            )
+        raise
+    except Exception as e:
+        for part in chunker.flush():
+            turn.publish({"type": "text", "content": part})
+        error_msg = f"Stream error: {str(e)}"
+        turn.publish({"type": "error", "content": error_msg})
+    finally:
+        try:
+            # 取消发生在分块等待 / 落库期间时上游生成器停在 yield 处，显式关闭以释放上游连接
+            await source.aclose()
+        finally:
+            if lease is not None:
+                lease.release()
+            turn.finish()
+            turns.record_finished(turn)
 
-        except Exception as e:
-            error_msg = f"Stream error: {str(e)}"
-            yield f"data: {json.dumps({'type': 'error', 'content': error_msg})}\n\n"
-
-    return StreamingResponse(
-        event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive",
-        },
-    )
+
+async def _persist_message(
+    messages_repo: MessagesRepo | AsyncMessagesRepo,
+    sessions_repo: SessionsRepo | AsyncSessionsRepo,
+    session_id: str,
+    role: str,
+    parts: List[Dict[str, Any]],
+    generate_title: bool = False,
+) -> None:
+    # 写后缓冲打开时只入队，由写线程批量提交（提交后再触发标题生成）；队列满时在线程池中同步写入
+    writer = get_write_behind()
+    if writer is not None:
+        if not writer.put(session_id, role, parts, generate_title):
+            await call_repo(writer.write_through, session_id, role, parts, generate_title)
+        return
+
+    # 保存消息并刷新会话时间；助手回复后触发标题生成（TITLE_GENERATION_SYNC 时会同步调用 LLM，同样放进线程池）
+    await call_repo(messages_repo.save_message, session_id=session_id, role=role, parts=parts)
+    await call_repo(sessions_repo.touch_session, session_id)
+    if generate_title:
+        await call_repo(async_generate, session_id)
+
+
+async def _replay_events(events: list[Dict[str, Any]]):
+    for event in events:
+        yield event
+
+
+# ---------- batch ----------
+
+BatchOutcome = tuple[Dict[str, Any], List[Dict[str, Any]]]
+
+
+async def _run_batch(
+    items: List[ChatBatchItem],
+    concurrency: int,
+    messages_repo: MessagesRepo | AsyncMessagesRepo,
+    sessions_repo: SessionsRepo | AsyncSessionsRepo,
+):
+    """
+    每个条目产出 (结果行, 待保存消息)。输出循环每次取走当前已完成的全部条目（最多
+    CHAT_BATCH_WRITE_GROUP_SIZE 个）一起落库，写库成功后再输出这些结果行。
+    客户端断开时生成器被关闭，未完成的条目随之取消。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    completed: asyncio.Queue[BatchOutcome] = asyncio.Queue()
+
+    async def worker(index: int, item: ChatBatchItem) -> None:
+        async with semaphore:
+            try:
+                outcome = await _batch_item(index, item, sessions_repo)
+            except Exception as e:
+                outcome = (_batch_result(index, item, error=f"Stream error: {str(e)}"), [])
+        await completed.put(outcome)
+
+    tasks = [asyncio.create_task(worker(i, item)) for i, item in enumerate(items)]
+    try:
+        remaining = len(tasks)
+        group_size = max(1, settings.chat_batch_write_group_size)
+        while remaining:
+            group = [await completed.get()]
+            while len(group) < group_size and not completed.empty():
+                group.append(completed.get_nowait())
+            remaining -= len(group)
+
+            await _persist_batch_group(group, messages_repo, sessions_repo)
+            yield "".join(dumps(result) + "\n" for result, _ in group)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # 等待取消完成并收走异常，避免遗留挂起任务和 "Task exception was never retrieved"
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _batch_item(
+    index: int,
+    item: ChatBatchItem,
+    sessions_repo: SessionsRepo | AsyncSessionsRepo,
+) -> BatchOutcome:
+    session = await call_repo(sessions_repo.get_session, item.session_id)
+    if not session:
+        return _batch_result(index, item, error="session not found"), []
+    if session.get("status") != "active":
+        return _batch_result(index, item, error="session is not active"), []
+
+    try:
+        answer, errors = await _collect_answer(item, session.get("user_id") or "")
+    except AdmissionRejected as e:
+        # 与 /paperapi/chat 的 429 一致：不保存用户消息
+        return _batch_result(index, item, error=f"too many concurrent chats: {e.reason}"), []
+
+    messages = [
+        {"session_id": item.session_id, "role": "user", "parts": [{"type": "text", "content": item.text}]}
+    ]
+    if answer:
+        messages.append(
+            {
+                "session_id": item.session_id,
+                "role": "assistant",
+                "parts": [{"type": "text", "content": answer, "metadata": None}],
+            }
+        )
+    error = errors[0].get("content") if errors else None
+    return _batch_result(index, item, answer, _response_parts(answer, errors), error), messages
+
+
+async def _collect_answer(item: ChatBatchItem, user_id: str) -> tuple[str, list[Dict[str, Any]]]:
+    """
+    不经过轮次缓冲直接读完上游（或回答缓存），返回与流式落库内容一致的 answer 和 error 事件。
+    调用上游前与 /paperapi/chat 一样按 user_id 申请准入名额，超限时抛出 AdmissionRejected。
+    """
+    cache_key: str | None = None
+    cached_events: list[Dict[str, Any]] | None = None
+    if answer_cache is not None and item.use_public_paper:
+        cache_key = answer_cache_key(item.text, item.use_public_paper)
+        cached_events = answer_cache.get(cache_key)
+
+    # 缓存命中不占用上游，不需要名额
+    lease: AdmissionLease | None = None
+    if cached_events is not None:
+        source = _replay_events(cached_events)
+        recorded: list[Dict[str, Any]] | None = None
+    else:
+        lease = await admission.acquire(user_id)
+        source = agent.astream_chat(
+            session_id=item.session_id,
+            text=item.text,
+            use_public_paper=item.use_public_paper,
+        )
+        recorded = [] if cache_key is not None else None
+
+    answer_parts: list[str] = []
+    errors: list[Dict[str, Any]] = []
+    try:
+        async with aclosing(source) as events:
+            async for chunk in events:
+                if recorded is not None:
+                    recorded.append(chunk)
+                chunk_type = chunk.get("type")
+                if chunk_type == "text":
+                    answer_parts.append(chunk.get("content", ""))
+                elif chunk_type == "error":
+                    answer_parts.append(f"\n[Error: {chunk.get('content')}]")
+                    errors.append(chunk)
+    finally:
+        if lease is not None:
+            lease.release()
+
+    answer = "".join(answer_parts)
+    if recorded is not None and not errors and answer:
+        answer_cache.put(cache_key, recorded)
+    return answer, errors
+
+
+def _batch_result(
+    index: int,
+    item: ChatBatchItem,
+    answer: str = "",
+    parts: List[Dict[str, Any]] | None = None,
+    error: str | None = None,
+) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "session_id": item.session_id,
+        "status": "error" if error else "ok",
+        "answer": answer,
+        "parts": parts or [],
+        "error": error,
+    }
+
+
+async def _persist_batch_group(
+    group: List[BatchOutcome],
+    messages_repo: MessagesRepo | AsyncMessagesRepo,
+    sessions_repo: SessionsRepo | AsyncSessionsRepo,
+) -> None:
+    messages = [message for _, pending in group for message in pending]
+    if not messages:
+        return
+    try:
+        await call_repo(messages_repo.save_messages, messages)
+    except Exception as e:
+        for result, pending in group:
+            if pending:
+                result.update(status="error", error=f"persist failed: {str(e)}")
+        return
+    try:
+        await call_repo(sessions_repo.touch_sessions, list(dict.fromkeys(m["session_id"] for m in messages)))
+    except Exception:
+        # 消息已经提交，条目仍按成功返回；updated_at 在该会话下次写入时再刷新
+        logger.exception("batch session touch failed")
+
+    for session_id in dict.fromkeys(m["session_id"] for m in messages if m["role"] == "assistant"):
+        await call_repo(async_generate, session_id)
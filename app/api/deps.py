@@ -0,0 +1,20 @@
+from app.repositories.messages_repo import AsyncMessagesRepo, MessagesRepo
+from app.repositories.sessions_repo import AsyncSessionsRepo, SessionsRepo
+from app.core.db import get_async_engine, get_engine
+from app.core.session_cache import get_session_cache
+
+
+# 配置了 ASYNC_DATABASE_URL 时使用异步仓储，否则同步仓储经 call_repo 线程池执行
+
+def get_messages_repo() -> MessagesRepo | AsyncMessagesRepo:
+    async_engine = get_async_engine()
+    if async_engine is not None:
+        return AsyncMessagesRepo(async_engine)
+    return MessagesRepo(get_engine())
+
+
+def get_sessions_repo() -> SessionsRepo | AsyncSessionsRepo:
+    async_engine = get_async_engine()
+    if async_engine is not None:
+        return AsyncSessionsRepo(async_engine, cache=get_session_cache())
+    return SessionsRepo(get_engine(), cache=get_session_cache())
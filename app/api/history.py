@@ -1,27 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal
 
-from app.repositories.messages_repo import MessagesRepo
-from app.repositories.sessions_repo import SessionsRepo
-from app.core.db import get_engine
+from fastapi import APIRouter, Depends, HTTPException, Query
 
-router = APIRouter()
-
-def get_messages_repo() -> MessagesRepo:
-    return MessagesRepo(get_engine())
+from app.config import settings
+from app.repositories.messages_repo import AsyncMessagesRepo, MessagesRepo
+from app.repositories.sessions_repo import AsyncSessionsRepo, SessionsRepo
+from app.core.db import call_repo
+from app.api.deps import get_messages_repo, get_sessions_repo
+from app.services.write_behind import get_write_behind
 
-def get_sessions_repo() -> SessionsRepo:
-    return SessionsRepo(get_engine())
+router = APIRouter()
 
 @router.get("/sessions/{session_id}/messages")
-def history(
+async def history(
     session_id: str,
-    messages_repo: MessagesRepo = Depends(get_messages_repo),
-    sessions_repo: SessionsRepo = Depends(get_sessions_repo),
+    limit: int | None = Query(None, ge=1, le=settings.history_max_page_size),
+    cursor: str | None = Query(None),
+    order: Literal["asc", "desc"] = Query("asc"),
+    messages_repo: MessagesRepo | AsyncMessagesRepo = Depends(get_messages_repo),
+    sessions_repo: SessionsRepo | AsyncSessionsRepo = Depends(get_sessions_repo),
 ):
-    session = sessions_repo.get_session(session_id)
+    session = await call_repo(sessions_repo.get_session, session_id)
     if not session or session.get("status") != "active":
         raise HTTPException(status_code=404, detail="session not found")
 
-    messages = messages_repo.list_messages(session_id)
+    # read-your-writes：该会话还有未提交的缓冲消息时先提交，再读历史
+    writer = get_write_behind()
+    if writer is not None and writer.has_pending(session_id):
+        await call_repo(writer.flush)
+
+    # 不分页（不传 limit / cursor 且按时间正序）时保持原行为：一次返回全部消息
+    next_cursor: str | None = None
+    if limit is None and cursor is None and order == "asc":
+        messages = await call_repo(messages_repo.list_messages, session_id)
+    else:
+        try:
+            messages, next_cursor = await call_repo(
+                messages_repo.list_messages_page,
+                session_id,
+                limit or settings.history_page_size,
+                cursor,
+                newest_first=order == "desc",
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="invalid cursor")
+
     title = session["title"]
-    return {"session_id": session_id, "title": title, "messages": messages}
+    return {"session_id": session_id, "title": title, "messages": messages, "next_cursor": next_cursor}
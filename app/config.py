@@ -11,16 +11,148 @@ env_path = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 
+# 环境变量解析：非法值回退默认值。构造时才读取配置的模块（如 AgentKitClient）也直接使用这些函数
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    return raw.strip().lower() in {"1", "true", "yes"}
+
+
+def env_optional_int(name: str) -> int | None:
+    try:
+        return int(os.getenv(name, ""))
+    except ValueError:
+        return None
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
 @dataclass(frozen=True)
 class Settings:
     project_name: str = "VeADK PaperAgent Backend"
     agentkit_base_url: str = ""
     agentkit_api_key: str = ""
     database_url: str = ""
+    # 可选：异步驱动连接串（postgresql+asyncpg:// 或 sqlite+aiosqlite:///），配置后路由使用异步仓储
+    async_database_url: str = ""
+    # async 路由中同步仓储调用使用的线程池大小
+    db_executor_workers: int = 8
+    # 连接池部署形态：faas / server / test（见 app/core/db.py POOL_PROFILES），可单独覆盖池大小
+    db_profile: str = "faas"
+    db_pool_size: int | None = None
+    db_max_overflow: int | None = None
+
+    # /paperapi/chat 准入控制（0 表示不限制）
+    chat_max_concurrent_streams: int = 64
+    chat_max_streams_per_user: int = 4
+    chat_admission_queue_size: int = 32
+    chat_admission_wait_seconds: float = 5.0
+
+    # 断线续传：每轮对话保留的事件数、结束后缓冲保留时长
+    chat_resume_buffer_events: int = 2048
+    chat_resume_ttl_seconds: float = 300.0
+    # 重复提交合并：没有 Idempotency-Key 时，同会话同文本在该窗口内视为重复
+    chat_dedup_window_seconds: float = 10.0
+    # 客户端全部断开超过该时长仍无人续传时取消上游请求，已输出部分按截断落库；小于 0 表示从不取消
+    chat_abandon_grace_seconds: float = 15.0
+
+    # SSE 输出：空闲心跳间隔（0 关闭）、单次写出合并的最大事件数、生产者最多领先最慢订阅者的事件数（0 不限制）
+    chat_sse_heartbeat_seconds: float = 15.0
+    chat_sse_max_batch_events: int = 64
+    chat_stream_max_lag_events: int = 256
+    # 客户端 Accept-Encoding 含 gzip 时压缩事件流（每次写出 Z_SYNC_FLUSH），默认关闭
+    chat_stream_gzip: bool = False
+
+    # 批量对话：单次最多条目数、并发上限（请求可以调低）、单次分组写库最多包含的条目数
+    chat_batch_max_items: int = 500
+    chat_batch_max_concurrency: int = 8
+    chat_batch_write_group_size: int = 32
+
+    # 消息写后缓冲（默认关闭）：对话只把消息放进内存队列，后台线程每 INTERVAL_MS 或攒够 MAX_BATCH 条合并为一个事务提交；
+    # 队列超过 MAX_QUEUE 时由调用方直接同步写库
+    chat_write_behind: bool = False
+    chat_write_behind_interval_ms: int = 50
+    chat_write_behind_max_batch: int = 256
+    chat_write_behind_max_queue: int = 10000
+
+    # 消息历史分页：只传 cursor / order=desc 不传 limit 时的每页条数、limit 上限
+    history_page_size: int = 50
+    history_max_page_size: int = 200
+
+    # 会话元数据缓存（get_session）：LRU 条数、TTL；跨进程失效通道 "package.module:factory"，为空时只在进程内生效。
+    # SESSION_CACHE_ENABLED 不设置时，只有配置了跨进程失效通道才开启（多实例部署下没有通道会读到其它实例改动前的会话）
+    session_cache_enabled: bool = False
+    session_cache_max_entries: int = 10000
+    session_cache_ttl_seconds: float = 30.0
+    session_cache_invalidation: str = ""
+
+    # 公开论文库（use_public_paper=True）回答缓存，默认关闭
+    chat_answer_cache_enabled: bool = False
+    chat_answer_cache_max_entries: int = 1024
+    chat_answer_cache_ttl_seconds: float = 3600.0
+    chat_answer_cache_max_mb: int = 64
+
+    # 流式输出节奏：分块大小、每块 / 句读额外延迟、单块延迟上限
+    chat_stream_chunk_size: int = 16
+    chat_stream_chunk_delay_ms: int = 25
+    chat_stream_punct_delay_ms: int = 80
+    chat_stream_max_delay_ms: int = 200
 
 
 settings = Settings(
     agentkit_base_url=os.getenv("AGENTKIT_BASE_URL", ""),
     agentkit_api_key=os.getenv("AGENTKIT_API_KEY", ""),
     database_url=os.getenv("DATABASE_URL", ""),
+    async_database_url=os.getenv("ASYNC_DATABASE_URL", ""),
+    db_executor_workers=env_int("DB_EXECUTOR_WORKERS", 8),
+    db_profile=os.getenv("DB_PROFILE", "faas"),
+    db_pool_size=env_optional_int("DB_POOL_SIZE"),
+    db_max_overflow=env_optional_int("DB_MAX_OVERFLOW"),
+    chat_max_concurrent_streams=env_int("CHAT_MAX_CONCURRENT_STREAMS", 64),
+    chat_max_streams_per_user=env_int("CHAT_MAX_STREAMS_PER_USER", 4),
+    chat_admission_queue_size=env_int("CHAT_ADMISSION_QUEUE_SIZE", 32),
+    chat_admission_wait_seconds=env_float("CHAT_ADMISSION_WAIT_SECONDS", 5.0),
+    chat_resume_buffer_events=env_int("CHAT_RESUME_BUFFER_EVENTS", 2048),
+    chat_resume_ttl_seconds=env_float("CHAT_RESUME_TTL_SECONDS", 300.0),
+    chat_dedup_window_seconds=env_float("CHAT_DEDUP_WINDOW_SECONDS", 10.0),
+    chat_abandon_grace_seconds=env_float("CHAT_ABANDON_GRACE_SECONDS", 15.0),
+    chat_sse_heartbeat_seconds=env_float("CHAT_SSE_HEARTBEAT_SECONDS", 15.0),
+    chat_sse_max_batch_events=env_int("CHAT_SSE_MAX_BATCH_EVENTS", 64),
+    chat_stream_max_lag_events=env_int("CHAT_STREAM_MAX_LAG_EVENTS", 256),
+    chat_stream_gzip=env_bool("CHAT_STREAM_GZIP", False),
+    chat_batch_max_items=env_int("CHAT_BATCH_MAX_ITEMS", 500),
+    chat_batch_max_concurrency=env_int("CHAT_BATCH_MAX_CONCURRENCY", 8),
+    chat_batch_write_group_size=env_int("CHAT_BATCH_WRITE_GROUP_SIZE", 32),
+    chat_write_behind=env_bool("CHAT_WRITE_BEHIND", False),
+    chat_write_behind_interval_ms=env_int("CHAT_WRITE_BEHIND_INTERVAL_MS", 50),
+    chat_write_behind_max_batch=env_int("CHAT_WRITE_BEHIND_MAX_BATCH", 256),
+    chat_write_behind_max_queue=env_int("CHAT_WRITE_BEHIND_MAX_QUEUE", 10000),
+    history_page_size=env_int("HISTORY_PAGE_SIZE", 50),
+    history_max_page_size=env_int("HISTORY_MAX_PAGE_SIZE", 200),
+    session_cache_enabled=env_bool("SESSION_CACHE_ENABLED", bool(os.getenv("SESSION_CACHE_INVALIDATION", "").strip())),
+    session_cache_max_entries=env_int("SESSION_CACHE_MAX_ENTRIES", 10000),
+    session_cache_ttl_seconds=env_float("SESSION_CACHE_TTL_SECONDS", 30.0),
+    session_cache_invalidation=os.getenv("SESSION_CACHE_INVALIDATION", ""),
+    chat_answer_cache_enabled=env_bool("CHAT_ANSWER_CACHE_ENABLED", False),
+    chat_answer_cache_max_entries=env_int("CHAT_ANSWER_CACHE_MAX_ENTRIES", 1024),
+    chat_answer_cache_ttl_seconds=env_float("CHAT_ANSWER_CACHE_TTL_SECONDS", 3600.0),
+    chat_answer_cache_max_mb=env_int("CHAT_ANSWER_CACHE_MAX_MB", 64),
+    chat_stream_chunk_size=env_int("CHAT_STREAM_CHUNK_SIZE", 16),
+    chat_stream_chunk_delay_ms=env_int("CHAT_STREAM_CHUNK_DELAY_MS", 25),
+    chat_stream_punct_delay_ms=env_int("CHAT_STREAM_PUNCT_DELAY_MS", 80),
+    chat_stream_max_delay_ms=env_int("CHAT_STREAM_MAX_DELAY_MS", 200),
 )
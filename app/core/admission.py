@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Limiter:
+    """
+    一个并发上限 + 有界 FIFO 等待队列。
+    只用计数器和按需创建的 future 实现，不持有绑定事件循环的 asyncio 原语，可以放在模块级共享。
+    """
+
+    def __init__(self, limit: int, max_waiters: int) -> None:
+        self.limit = limit
+        self.max_waiters = max_waiters
+        self.active = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for w in self._waiters if not w.done())
+
+    @property
+    def idle(self) -> bool:
+        return self.active == 0 and not self._waiters
+
+    def try_acquire(self) -> bool:
+        if self.limit <= 0:
+            self.active += 1
+            return True
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return True
+        return False
+
+    async def acquire(self, timeout: float, scope: str) -> None:
+        if self.try_acquire():
+            return
+        if self.waiting >= self.max_waiters:
+            raise AdmissionRejected(f"{scope} queue full", 0)
+
+        fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                return  # 超时的同时恰好拿到了转交的名额
+            fut.cancel()
+            self._discard(fut)
+            raise AdmissionRejected(f"{scope} wait timeout", 0)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()
+            else:
+                fut.cancel()
+                self._discard(fut)
+            raise
+
+    def release(self) -> None:
+        # 名额直接转交给队首等待者，active 不变；没有等待者才真正归还
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active = max(0, self.active - 1)
+
+    def _discard(self, fut: asyncio.Future[None]) -> None:
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+
+
+class AdmissionLease:
+    def __init__(self, controller: "AdmissionController", user_id: str) -> None:
+        self._controller = controller
+        self.user_id = user_id
+        self._released = False
+
+    def release(self) -> None:
+        # 幂等：由流结束的 finally（_run_turn，用户消息保存失败时为 _start_turn）与批量条目的 _collect_answer 调用
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self.user_id)
+
+
+class AdmissionController:
+    """
+    上游 Agent 流的准入控制：全局并发上限 + 每个 user_id 的并发上限，各自带一个短等待队列。
+    队列已满或等待超时直接拒绝（由 API 层转换为 429 + Retry-After），而不是让请求一直挂着。
+    limit 为 0 表示不限制。
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 64,
+        max_per_user: int = 4,
+        queue_size: int = 32,
+        wait_timeout: float = 5.0,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self.wait_timeout = wait_timeout
+
+        self._global = _Limiter(max_concurrent, queue_size)
+        self._users: dict[str, _Limiter] = {}
+
+        self.admitted = 0
+        self.rejected: dict[str, int] = {}
+        self.queued = 0
+        self._wait_times: deque[float] = deque(maxlen=1000)
+        self._max_wait = 0.0
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.wait_timeout))
+
+    async def acquire(self, user_id: str) -> AdmissionLease:
+        start = time.monotonic()
+        user_limiter = self._users.get(user_id)
+        if user_limiter is None:
+            user_limiter = self._users[user_id] = _Limiter(self.max_per_user, self.queue_size)
+
+        queued = False
+        try:
+            # 固定顺序：先用户、再全局，避免互相等待
+            if not user_limiter.try_acquire():
+                queued = True
+                await user_limiter.acquire(self.wait_timeout, "user")
+            remaining = max(0.0, self.wait_timeout - (time.monotonic() - start))
+            try:
+                if not self._global.try_acquire():
+                    queued = True
+                    await self._global.acquire(remaining, "global")
+            except BaseException:
+                user_limiter.release()
+                raise
+        except AdmissionRejected as e:
+            e.retry_after = self.retry_after
+            self.rejected[e.reason] = self.rejected.get(e.reason, 0) + 1
+            self._drop_idle_user(user_id)
+            raise
+        except BaseException:
+            self._drop_idle_user(user_id)
+            raise
+
+        waited = time.monotonic() - start
+        self.admitted += 1
+        if queued:
+            self.queued += 1
+            self._wait_times.append(waited)
+            self._max_wait = max(self._max_wait, waited)
+        return AdmissionLease(self, user_id)
+
+    def _release(self, user_id: str) -> None:
+        self._global.release()
+        user_limiter = self._users.get(user_id)
+        if user_limiter is not None:
+            user_limiter.release()
+            self._drop_idle_user(user_id)
+
+    def _drop_idle_user(self, user_id: str) -> None:
+        user_limiter = self._users.get(user_id)
+        if user_limiter is not None and user_limiter.idle:
+            del self._users[user_id]
+
+    def snapshot(self) -> dict[str, Any]:
+        waits = sorted(self._wait_times)
+        p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_per_user": self.max_per_user,
+            "queue_size": self.queue_size,
+            "wait_timeout_seconds": self.wait_timeout,
+            "active": self._global.active,
+            "queue_depth": self._global.waiting + sum(u.waiting for u in self._users.values()),
+            "active_users": len(self._users),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "wait_seconds": {
+                "avg": round(sum(waits) / len(waits), 4) if waits else 0.0,
+                "p95": round(p95, 4),
+                "max": round(self._max_wait, 4),
+            },
+        }
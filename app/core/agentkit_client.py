@@ -1,12 +1,35 @@
 from __future__ import annotations
 
+import asyncio
+import importlib.util
+import logging
+import time
 import os
 import uuid
-import json
 from typing import Any, AsyncGenerator
 
 import requests
 import httpx
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from app.config import env_bool, env_float, env_int
+from app.core.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+from app.core.sse_decoder import AgentStreamDecoder
+
+logger = logging.getLogger(__name__)
+
+# 建连阶段的失败：请求尚未发出，可以安全重试
+_ASYNC_CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def _is_sync_connect_error(exc: requests.RequestException) -> bool:
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.ConnectionError):
+        reason = exc.args[0] if exc.args else None
+        return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+    return False
 
 
 class AgentKitClient:
@@ -15,18 +38,96 @@ class AgentKitClient:
         base_url: str | None = None,
         api_key: str | None = None,
         timeout_seconds: float = 60.0,
+        max_connections: int | None = None,
+        max_keepalive_connections: int | None = None,
+        keepalive_expiry: float | None = None,
+        http2: bool | None = None,
+        breaker: CircuitBreaker | None = None,
+        retry_policy: RetryPolicy | None = None,
     ) -> None:
         self.base_url = (base_url or os.getenv("AGENTKIT_BASE_URL", "")).rstrip("/")
         self.api_key = api_key or os.getenv("AGENTKIT_API_KEY", "")
+        self.timeout_seconds = env_float("AGENTKIT_TIMEOUT_SECONDS", timeout_seconds)
+        # 建连超时单独收紧：AgentKit 不可达时几秒内失败，而不是等满整个 timeout
+        self.connect_timeout_seconds = min(
+            env_float("AGENTKIT_CONNECT_TIMEOUT_SECONDS", 5.0), self.timeout_seconds
+        )
 
-        timeout_env = os.getenv("AGENTKIT_TIMEOUT_SECONDS")
-        if timeout_env:
-            try:
-                self.timeout_seconds = float(timeout_env)
-            except ValueError:
-                self.timeout_seconds = timeout_seconds
-        else:
-            self.timeout_seconds = timeout_seconds
+        # 连接池：整个进程共享一个 AsyncClient，跨轮次复用 TCP/TLS 连接
+        self.limits = httpx.Limits(
+            max_connections=(
+                max_connections
+                if max_connections is not None
+                else env_int("AGENTKIT_MAX_CONNECTIONS", 100)
+            ),
+            max_keepalive_connections=(
+                max_keepalive_connections
+                if max_keepalive_connections is not None
+                else env_int("AGENTKIT_MAX_KEEPALIVE_CONNECTIONS", 20)
+            ),
+            keepalive_expiry=(
+                keepalive_expiry
+                if keepalive_expiry is not None
+                else env_float("AGENTKIT_KEEPALIVE_EXPIRY_SECONDS", 30.0)
+            ),
+        )
+        self.http2 = http2 if http2 is not None else env_bool("AGENTKIT_HTTP2", False)
+        if self.http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("AGENTKIT_HTTP2 已开启但未安装 h2（pip install httpx[http2]），回退到 HTTP/1.1")
+            self.http2 = False
+
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=env_int("AGENTKIT_BREAKER_FAILURE_THRESHOLD", 5),
+            reset_timeout=env_float("AGENTKIT_BREAKER_RESET_SECONDS", 30.0),
+        )
+        self.retry_policy = retry_policy or RetryPolicy(
+            max_attempts=env_int("AGENTKIT_RETRY_MAX_ATTEMPTS", 3),
+            base_delay=env_float("AGENTKIT_RETRY_BASE_DELAY_MS", 200.0) / 1000.0,
+            max_delay=env_float("AGENTKIT_RETRY_MAX_DELAY_MS", 2000.0) / 1000.0,
+        )
+
+        self._client: httpx.AsyncClient | None = None
+        self._session: requests.Session | None = None
+
+    # ========== 连接池生命周期 ==========
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # 正常由 app startup 打开；未打开时（脚本 / 测试直接调用）按需懒创建
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout_seconds, connect=self.connect_timeout_seconds),
+                limits=self.limits,
+                http2=self.http2,
+            )
+        return self._client
+
+    def _get_session(self) -> requests.Session:
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_maxsize=self.limits.max_keepalive_connections or 10
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    async def startup(self) -> None:
+        """
+        创建共享的 AsyncClient。只建连接池对象，不主动建连，不会拖慢 FaaS 冷启动。
+        """
+        self._get_client()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+        self.close()
+
+    def close(self) -> None:
+        if self._session is not None:
+            session, self._session = self._session, None
+            session.close()
 
     def _extract_text(self, result: Any) -> str | None:
         if not isinstance(result, dict):
@@ -84,119 +185,164 @@ class AgentKitClient:
     async def astream_chat(
         self, session_id: str, text: str, use_public_paper: bool = False
     ) -> AsyncGenerator[dict[str, Any], None]:
-        if not self.base_url:
-            yield {"type": "error", "content": "AgentKit 未配置：请设置环境变量 AGENTKIT_BASE_URL"}
+        config_error = self._config_error()
+        if config_error:
+            yield {"type": "error", "content": config_error}
             return
-        if not self.api_key:
-            yield {"type": "error", "content": "AgentKit 未配置：请设置环境变量 AGENTKIT_API_KEY"}
+
+        if not self.breaker.allow_request():
+            yield {"type": "error", "content": self._circuit_open_message()}
             return
 
-        payload: dict[str, Any] = {
-            "jsonrpc": "2.0",
-            "id": str(uuid.uuid4()),
-            "method": "message/stream",
-            "params": {
-                "configuration": {"blocking": False},  # Enable streaming
-                "metadata": {
-                    "user_id": "default_user",
-                    "session_id": session_id,
-                    "use_public_paper": use_public_paper,
-                },
-                "message": {
-                    "messageId": str(uuid.uuid4()),
-                    "role": "user",
-                    "parts": [{"type": "text", "text": text}],
-                },
-            },
-        }
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
+        payload = self._build_payload("message/stream", session_id, text, use_public_paper)
+        headers = self._headers()
 
-        async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
+        client = self._get_client()
+        attempt = 0
+        while True:
+            attempt += 1
             try:
                 async with client.stream(
                     "POST", f"{self.base_url}/", json=payload, headers=headers
                 ) as response:
                     response.raise_for_status()
+                    # 已拿到响应头，进入流式阶段：此后任何失败都不再重试
+                    decoder = AgentStreamDecoder()
                     async for line in response.aiter_lines():
-                        if not line:
-                            continue
-                        if line.startswith("data:"):
-                            data_str = line[5:].strip()
-                            if not data_str:
-                                continue
-                            try:
-                                raw_data = json.loads(data_str)
-                                # 1. Unwrap JSON-RPC result if present
-                                event = raw_data.get("result", raw_data)
-                                
-                                # 2. Handle errors in JSON-RPC
-                                if "error" in raw_data:
-                                    error_content = raw_data["error"]
-                                    if isinstance(error_content, dict):
-                                        error_msg = error_content.get("message", str(error_content))
-                                    else:
-                                        error_msg = str(error_content)
-                                    yield {"type": "error", "content": error_msg}
-                                    continue
-
-                                kind = event.get("kind")
-                                
-                                if kind == "message":
-                                    parts = event.get("parts") or []
-                                    if isinstance(parts, list):
-                                        for part in parts:
-                                            if not isinstance(part, dict):
-                                                continue
-                                            part_type = part.get("type") or part.get("kind")
-                                            if part_type != "text":
-                                                continue
-                                            content = part.get("text", "")
-                                            if content:
-                                                yield {"type": "text", "content": content}
-                                            
-                                elif kind == "thought":
-                                    # Forward thoughts
-                                    text = event.get("text", "")
-                                    if text:
-                                        yield {"type": "thought", "content": text}
-                                elif kind == "artifact-update":
-                                    artifact = event.get("artifact") or {}
-                                    artifact_parts = artifact.get("parts") or []
-                                    if isinstance(artifact_parts, list):
-                                        for part in artifact_parts:
-                                            if not isinstance(part, dict):
-                                                continue
-                                            part_type = part.get("type") or part.get("kind")
-                                            if part_type != "text":
-                                                continue
-                                            content = part.get("text", "")
-                                            if content:
-                                                yield {"type": "text", "content": content}
-                                elif kind == "status-update":
-                                    yield {"type": "thought", "content": json.dumps(event, ensure_ascii=False)}
-                                    
-                            except json.JSONDecodeError:
-                                continue
+                        for chunk in decoder.feed_line(line):
+                            yield chunk
+                    for chunk in decoder.finish():
+                        yield chunk
+                self.breaker.record_success()
+                return
+            except _ASYNC_CONNECT_ERRORS as e:
+                if attempt < self.retry_policy.max_attempts:
+                    delay = self.retry_policy.backoff(attempt)
+                    logger.warning(f"AgentKit 建连失败，{delay:.2f}s 后第 {attempt + 1} 次尝试: {e!r}")
+                    await asyncio.sleep(delay)
+                    continue
+                self.breaker.record_failure()
+                yield {"type": "error", "content": f"Agent 服务请求失败: {str(e)}"}
+                return
             except httpx.RequestError as e:
+                self.breaker.record_failure()
                 yield {"type": "error", "content": f"Agent 服务请求失败: {str(e)}"}
+                return
             except httpx.HTTPStatusError as e:
+                self._record_status(e.response.status_code)
                 yield {"type": "error", "content": f"Agent 服务响应错误: {e.response.status_code}"}
+                return
+
+    async def asend(self, session_id: str, text: str, use_public_paper: bool = False) -> str:
+        """
+        非流式调用（message/send）的异步版本：复用共享连接池，不阻塞事件循环。
+        返回值语义与 send 一致；熔断打开时抛出 CircuitOpenError。
+        """
+        config_error = self._config_error()
+        if config_error:
+            return config_error
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(self.breaker.retry_after())
+
+        client = self._get_client()
+        payload = self._build_payload("message/send", session_id, text, use_public_paper)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                resp = await client.post(f"{self.base_url}/", json=payload, headers=self._headers())
+                resp.raise_for_status()
+            except _ASYNC_CONNECT_ERRORS as e:
+                if attempt < self.retry_policy.max_attempts:
+                    delay = self.retry_policy.backoff(attempt)
+                    logger.warning(f"AgentKit 建连失败，{delay:.2f}s 后第 {attempt + 1} 次尝试: {e!r}")
+                    await asyncio.sleep(delay)
+                    continue
+                self.breaker.record_failure()
+                raise
+            except httpx.RequestError:
+                self.breaker.record_failure()
+                raise
+            except httpx.HTTPStatusError as e:
+                self._record_status(e.response.status_code)
+                raise
+            self.breaker.record_success()
+            return self._response_text(resp.json())
 
     def send(self, session_id: str, text: str, use_public_paper: bool = False) -> str:
+        """
+        同步版本，仅供脚本 / 线程中使用；async 代码请用 asend。
+        通过共享的 requests.Session 复用连接；熔断打开时抛出 CircuitOpenError。
+        """
+        config_error = self._config_error()
+        if config_error:
+            return config_error
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(self.breaker.retry_after())
+
+        session = self._get_session()
+        payload = self._build_payload("message/send", session_id, text, use_public_paper)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                resp = session.post(
+                    f"{self.base_url}/",
+                    json=payload,
+                    headers=self._headers(),
+                    timeout=(self.connect_timeout_seconds, self.timeout_seconds),
+                )
+                resp.raise_for_status()
+            except requests.HTTPError as e:
+                self._record_status(e.response.status_code)
+                raise
+            except requests.RequestException as e:
+                if _is_sync_connect_error(e) and attempt < self.retry_policy.max_attempts:
+                    time.sleep(self.retry_policy.backoff(attempt))
+                    continue
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return self._response_text(resp.json())
+
+    # ========== 熔断 ==========
+
+    def _record_status(self, status_code: int) -> None:
+        # 5xx 说明上游异常；4xx 是请求本身的问题，上游是健康的
+        if status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _circuit_open_message(self) -> str:
+        retry_after = self.breaker.retry_after()
+        return f"Agent 服务暂时不可用（熔断中），请 {max(1, round(retry_after))} 秒后重试"
+
+    # ========== 请求构造 / 响应解析 ==========
+
+    def _config_error(self) -> str | None:
         if not self.base_url:
             return "AgentKit 未配置：请设置环境变量 AGENTKIT_BASE_URL"
         if not self.api_key:
             return "AgentKit 未配置：请设置环境变量 AGENTKIT_API_KEY"
+        return None
+
+    def _headers(self) -> dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
 
-        payload: dict[str, Any] = {
+    def _build_payload(
+        self, method: str, session_id: str, text: str, use_public_paper: bool
+    ) -> dict[str, Any]:
+        return {
             "jsonrpc": "2.0",
             "id": str(uuid.uuid4()),
-            "method": "message/send",
+            "method": method,
             "params": {
-                "configuration": {"blocking": True},
+                # message/stream 走流式，message/send 阻塞直到拿到完整结果
+                "configuration": {"blocking": method != "message/stream"},
                 "metadata": {
                     "user_id": "default_user",
                     "session_id": session_id,
@@ -209,27 +355,10 @@ class AgentKitClient:
                 },
             },
         }
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        resp = requests.post(
-            f"{self.base_url}/",
-            json=payload,
-            headers=headers,
-            timeout=self.timeout_seconds,
-        )
-        resp.raise_for_status()
-        data = resp.json()
 
-        result = data.get("result")
+    def _response_text(self, data: Any) -> str:
+        result = data.get("result") if isinstance(data, dict) else None
         extracted = self._extract_text(result)
         if extracted is not None:
             return extracted
-
-        if isinstance(result, dict) and ("artifacts" in result or "history" in result):
-            extracted = self._extract_text(result)
-            if extracted is not None:
-                return extracted
-
         return str(data)
@@ -0,0 +1,238 @@
+"""
+版本化 schema 迁移与热点查询 EXPLAIN 检查。
+
+- schema_migrations 表记录已执行的迁移版本；migrate() 按版本顺序执行未执行的迁移，每个迁移一个事务，可重复调用
+- PostgreSQL 上每个迁移事务先取 advisory lock，多个实例同时调用 /admin/init-db 时串行执行、不会重复建索引
+- explain_hot_queries() 对仓储里的热点查询执行 EXPLAIN，检查执行计划用到了预期的索引（回归检查）
+
+用法（在仓库根目录，读取 DATABASE_URL）：
+    python -m app.core.migrations
+    python -m app.core.migrations --explain
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import ClauseElement
+
+from app.core.time_utils import now_bjt_naive
+from app.repositories import messages_repo, sessions_repo
+
+
+metadata = MetaData()
+
+schema_migrations_table = Table(
+    "schema_migrations",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# pg_advisory_xact_lock 的 key（任意固定值，只要本服务内唯一）
+_MIGRATION_LOCK_KEY = 0x52455F41  # "RE_A"
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+
+
+def _create_tables(conn: Connection) -> None:
+    # 已有库（早期用 create_all 建表）上是空操作；索引由下一个迁移负责
+    for table in (
+        sessions_repo.sessions_table,
+        messages_repo.messages_table,
+        messages_repo.message_parts_table,
+    ):
+        table.create(conn, checkfirst=True)
+
+
+def _create_hot_path_indexes(conn: Connection) -> None:
+    # PostgreSQL 上普通 CREATE INDEX 建索引期间会阻塞该表的写入；大表上线前可先手工 CREATE INDEX CONCURRENTLY 同名索引
+    for index in (
+        messages_repo.ix_messages_session_created_id,
+        messages_repo.ix_message_parts_message_sort,
+        sessions_repo.ix_sessions_user_status_updated,
+    ):
+        index.create(conn, checkfirst=True)
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "create_tables", _create_tables),
+    Migration(2, "hot_path_indexes", _create_hot_path_indexes),
+]
+
+
+def _lock(conn: Connection) -> None:
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+
+
+def _applied_versions(conn: Connection) -> set[int]:
+    return set(conn.execute(select(schema_migrations_table.c.version)).scalars())
+
+
+def migrate(engine: Engine) -> list[dict[str, Any]]:
+    """执行全部未执行的迁移，返回本次执行的迁移 [{"version", "name"}]"""
+    with engine.begin() as conn:
+        _lock(conn)
+        metadata.create_all(conn)
+
+    applied: list[dict[str, Any]] = []
+    for migration in MIGRATIONS:
+        with engine.begin() as conn:
+            _lock(conn)
+            # 拿到锁之后再确认一次：其它实例可能刚执行完
+            if migration.version in _applied_versions(conn):
+                continue
+            migration.upgrade(conn)
+            conn.execute(
+                insert(schema_migrations_table).values(
+                    version=migration.version,
+                    name=migration.name,
+                    applied_at=now_bjt_naive(),
+                )
+            )
+        applied.append({"version": migration.version, "name": migration.name})
+    return applied
+
+
+def migration_status(engine: Engine) -> dict[str, Any]:
+    with engine.connect() as conn:
+        versions = _applied_versions(conn) if engine.dialect.has_table(conn, "schema_migrations") else set()
+    return {
+        "version": max(versions, default=0),
+        "latest": MIGRATIONS[-1].version,
+        "pending": [{"version": m.version, "name": m.name} for m in MIGRATIONS if m.version not in versions],
+    }
+
+
+# ---------- EXPLAIN 回归检查 ----------
+
+_explain_ids = itertools.count(1)
+
+
+class _Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, stmt: ClauseElement) -> None:
+        self.stmt = stmt
+        self.explain_id = next(_explain_ids)
+
+
+@compiles(_Explain)
+def _compile_explain(element: _Explain, compiler: Any, **kw: Any) -> str:
+    return "EXPLAIN " + compiler.process(element.stmt, **kw)
+
+
+@compiles(_Explain, "sqlite")
+def _compile_explain_sqlite(element: _Explain, compiler: Any, **kw: Any) -> str:
+    # sqlite3 按 SQL 文本缓存预编译语句，缓存里的 EXPLAIN 不会因建 / 删索引重新规划；每次加一个不同的注释绕开缓存
+    return f"EXPLAIN QUERY PLAN /* check {element.explain_id} */ " + compiler.process(element.stmt, **kw)
+
+
+@dataclass(frozen=True)
+class HotQuery:
+    name: str
+    stmt: ClauseElement
+    indexes: tuple[str, ...]
+
+
+def hot_queries() -> list[HotQuery]:
+    """仓储中按会话 / 用户访问的热点查询，以及执行计划中应当出现的索引"""
+    parts_delete, messages_delete = messages_repo._delete_stmts("probe")
+    return [
+        HotQuery(
+            "list_messages",
+            messages_repo._list_stmt("probe"),
+            ("ix_messages_session_created_id", "ix_message_parts_message_sort"),
+        ),
+        HotQuery(
+            "list_messages_page",
+            messages_repo._page_stmt("probe", 50, (datetime(2026, 1, 1), 1), True),
+            ("ix_messages_session_created_id",),
+        ),
+        HotQuery(
+            "list_messages_page_parts",
+            messages_repo._page_parts_stmt([1, 2, 3]),
+            ("ix_message_parts_message_sort",),
+        ),
+        HotQuery("list_sessions", sessions_repo._list_stmt("probe"), ("ix_sessions_user_status_updated",)),
+        HotQuery(
+            "delete_by_session_id.parts",
+            parts_delete,
+            ("ix_message_parts_message_sort", "ix_messages_session_created_id"),
+        ),
+        HotQuery("delete_by_session_id.messages", messages_delete, ("ix_messages_session_created_id",)),
+    ]
+
+
+def _plan_lines(conn: Connection, stmt: ClauseElement) -> list[str]:
+    rows = conn.execute(_Explain(stmt)).all()
+    if conn.dialect.name == "sqlite":
+        # EXPLAIN QUERY PLAN: (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def explain_hot_queries(engine: Engine) -> list[dict[str, Any]]:
+    """
+    对每个热点查询执行 EXPLAIN（不会真正执行查询 / 删除），返回执行计划与是否用到了预期索引。
+    PostgreSQL 在小表上总会选择顺序扫描，因此检查时在只读事务内 SET LOCAL enable_seqscan = off，
+    只要索引可用，计划里就一定会出现它。
+    """
+    results: list[dict[str, Any]] = []
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SET LOCAL enable_seqscan = off"))
+            for query in hot_queries():
+                plan = _plan_lines(conn, query.stmt)
+                text_plan = "\n".join(plan)
+                missing = [name for name in query.indexes if name not in text_plan]
+                results.append(
+                    {
+                        "name": query.name,
+                        "ok": not missing,
+                        "expected_indexes": list(query.indexes),
+                        "missing_indexes": missing,
+                        "plan": plan,
+                    }
+                )
+        finally:
+            # 只做检查，不留下任何改动（包括 SET LOCAL）
+            trans.rollback()
+    return results
+
+
+def main() -> None:
+    from app.core.db import get_engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--explain", action="store_true", help="迁移后对热点查询执行 EXPLAIN 检查")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    report: dict[str, Any] = {"applied": migrate(engine), **migration_status(engine)}
+    if args.explain:
+        report["explain"] = explain_hot_queries(engine)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.explain and not all(r["ok"] for r in report["explain"]):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+
+class PoolWaitStats:
+    """连接池取连接（checkout）的等待时间统计：包含排队等空闲连接与新建连接的耗时"""
+
+    def __init__(self, window: int = 1000) -> None:
+        self._lock = threading.Lock()
+        self._waits: deque[float] = deque(maxlen=window)
+        self._max_wait = 0.0
+        self.checkouts = 0
+        self.timeouts = 0
+
+    def record(self, waited: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self._waits.append(waited)
+            self._max_wait = max(self._max_wait, waited)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            checkouts, timeouts, max_wait = self.checkouts, self.timeouts, self._max_wait
+        p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+        return {
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_seconds": {
+                "avg": round(sum(waits) / len(waits), 4) if waits else 0.0,
+                "p95": round(p95, 4),
+                "max": round(max_wait, 4),
+            },
+        }
+
+
+class _TimedCheckout:
+    wait_stats: PoolWaitStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - start)
+        return conn
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    """记录 checkout 等待时间的 QueuePool（dispose 重建时沿用同一份统计）"""
+
+    def __init__(self, *args: Any, wait_stats: PoolWaitStats | None = None, **kw: Any) -> None:
+        super().__init__(*args, **kw)
+        self.wait_stats = wait_stats or PoolWaitStats()
+
+    def recreate(self) -> "InstrumentedQueuePool":
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    """AsyncEngine 用的 InstrumentedQueuePool"""
+
+    def __init__(self, *args: Any, wait_stats: PoolWaitStats | None = None, **kw: Any) -> None:
+        super().__init__(*args, **kw)
+        self.wait_stats = wait_stats or PoolWaitStats()
+
+    def recreate(self) -> "InstrumentedAsyncQueuePool":
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+
+def pool_snapshot(pool: Pool) -> dict[str, Any]:
+    """连接池当前状态；NullPool / StaticPool 没有容量概念，只返回类型"""
+    snapshot: dict[str, Any] = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        snapshot.update(
+            {
+                "pool_size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                # overflow() 为负数表示连接还没建满 pool_size，这里只报告实际超出的部分
+                "overflow": max(0, pool.overflow()),
+                "timeout_seconds": pool.timeout(),
+            }
+        )
+    wait_stats = getattr(pool, "wait_stats", None)
+    if wait_stats is not None:
+        snapshot.update(wait_stats.snapshot())
+    return snapshot
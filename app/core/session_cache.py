@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import importlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Protocol
+from uuid import uuid4
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationChannel(Protocol):
+    """
+    跨进程的会话缓存失效通知。多 worker / 多实例部署时用共享的消息通道实现（例如 Redis pub/sub、PostgreSQL LISTEN/NOTIFY），
+    通过 SESSION_CACHE_INVALIDATION="包.模块:工厂函数" 接入；publish 不应阻塞请求，回调可能在任意线程执行。
+    """
+
+    def publish(self, session_id: str, origin: str) -> None: ...
+
+    def subscribe(self, callback: Callable[[str, str], None]) -> None: ...
+
+
+class LocalInvalidationChannel:
+    """进程内广播：同一进程里的多个 SessionCache 互相通知（默认实现，也用于测试模拟多个 worker）"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscribers: list[Callable[[str, str], None]] = []
+        self.published = 0
+
+    def publish(self, session_id: str, origin: str) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for callback in subscribers:
+            callback(session_id, origin)
+
+    def subscribe(self, callback: Callable[[str, str], None]) -> None:
+        with self._lock:
+            self._subscribers.append(callback)
+
+
+class SessionCache:
+    """
+    会话元数据（get_session 的结果）的进程内缓存：LRU + TTL。
+    - 写路径由 SessionsRepo 同步维护：改标题 / 归档 / 删除后本地失效并通过 channel 通知其它进程；
+      touch 只改 updated_at，本地直接写入新值（避免每轮对话都把缓存冲掉），其它进程收到通知后失效
+    - 读路径 get 未命中时先取 load_token()，查库后带着 token put：查库期间发生过失效则不写入，避免把旧行放回缓存
+    - 其它进程的改动最迟在 ttl_seconds 后可见（没有配置跨进程 channel 时）
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: float = 30.0,
+        channel: InvalidationChannel | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        # session_id -> (expires_at, row)
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        # 每次失效加一；load_token 与 put 之间变化过则放弃写入
+        self._epoch = 0
+        self.origin = uuid4().hex
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+        self.evictions = 0
+        self.publish_errors = 0
+
+        self.channel = channel
+        if channel is not None:
+            channel.subscribe(self._on_remote_invalidation)
+
+    # ---------- 读 ----------
+
+    def get(self, session_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, row = entry
+            if self._clock() >= expires_at:
+                del self._entries[session_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return dict(row)
+
+    def load_token(self) -> int:
+        with self._lock:
+            return self._epoch
+
+    def put(self, session_id: str, row: dict[str, Any], token: int | None = None) -> None:
+        with self._lock:
+            if token is not None and token != self._epoch:
+                return
+            self._entries[session_id] = (self._clock() + self.ttl_seconds, dict(row))
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # ---------- 写 ----------
+
+    def touch(self, session_ids: list[str], updated_at: str) -> None:
+        with self._lock:
+            for session_id in session_ids:
+                entry = self._entries.get(session_id)
+                if entry is not None:
+                    entry[1]["updated_at"] = updated_at
+        for session_id in session_ids:
+            self._publish(session_id)
+
+    def invalidate(self, session_id: str) -> None:
+        self._drop(session_id)
+        with self._lock:
+            self.invalidations += 1
+        self._publish(session_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._epoch += 1
+
+    def _drop(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+            self._epoch += 1
+
+    def _publish(self, session_id: str) -> None:
+        if self.channel is None:
+            return
+        try:
+            self.channel.publish(session_id, self.origin)
+        except Exception:
+            # 通知失败不影响本次写入；其它进程最迟 TTL 后看到新值
+            with self._lock:
+                self.publish_errors += 1
+            logger.exception("session cache invalidation publish failed", extra={"session_id": session_id})
+
+    def _on_remote_invalidation(self, session_id: str, origin: str) -> None:
+        if origin == self.origin:
+            return
+        self._drop(session_id)
+        with self._lock:
+            self.remote_invalidations += 1
+
+    # ---------- 统计 ----------
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "remote_invalidations": self.remote_invalidations,
+                "evictions": self.evictions,
+                "publish_errors": self.publish_errors,
+                "channel": type(self.channel).__name__ if self.channel is not None else None,
+            }
+
+
+_cache: SessionCache | None = None
+_cache_lock = threading.Lock()
+
+
+def _load_channel(spec: str) -> InvalidationChannel:
+    # "包.模块:工厂函数"，工厂函数无参数，返回 InvalidationChannel
+    module_name, _, factory_name = spec.partition(":")
+    if not module_name or not factory_name:
+        raise RuntimeError(f"SESSION_CACHE_INVALIDATION 格式应为 package.module:factory，当前为 {spec!r}")
+    return getattr(importlib.import_module(module_name), factory_name)()
+
+
+def get_session_cache() -> SessionCache | None:
+    """SESSION_CACHE_ENABLED 打开时返回进程内共享的会话缓存，否则 None（每次都查库）"""
+    global _cache
+
+    if _cache is None and settings.session_cache_enabled:
+        with _cache_lock:
+            if _cache is None:
+                spec = settings.session_cache_invalidation.strip()
+                _cache = SessionCache(
+                    max_entries=settings.session_cache_max_entries,
+                    ttl_seconds=settings.session_cache_ttl_seconds,
+                    channel=_load_channel(spec) if spec else LocalInvalidationChannel(),
+                )
+    return _cache
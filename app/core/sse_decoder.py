@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Callable
+
+try:  # 可选：装了 orjson 就用更快的 JSON 后端
+    import orjson
+except ImportError:  # pragma: no cover - 取决于部署环境
+    orjson = None
+
+
+# ---------- JSON backend ----------
+
+_std_decoder = json.JSONDecoder()
+_std_scan = _std_decoder.scan_once
+
+
+def _std_loads(data: str) -> Any:
+    # 直接调用 C scanner：省掉 JSONDecoder.decode 每次前后两次空白正则匹配与两层 Python 调用
+    try:
+        obj, end = _std_scan(data, 0)
+    except StopIteration:
+        end = -1
+    if end != len(data):
+        # 前后有空白、多余内容或不是合法 JSON：交给完整实现（抛出标准的 JSONDecodeError）
+        return _std_decoder.decode(data)
+    return obj
+
+
+# json.dumps 带非默认参数时每次都会新建一个 JSONEncoder，这里复用同一个
+_std_dumps: Callable[[Any], str] = json.JSONEncoder(ensure_ascii=False).encode
+
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+    json_loads: Callable[[str], Any] = orjson.loads
+
+    def json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+else:
+    JSON_BACKEND = "json"
+    json_loads = _std_loads
+    json_dumps = _std_dumps
+
+JSON_DECODE_ERRORS: tuple[type[Exception], ...] = (
+    (json.JSONDecodeError, orjson.JSONDecodeError) if orjson is not None else (json.JSONDecodeError,)
+)
+
+
+# ---------- SSE framing ----------
+
+class SSEEvent:
+    __slots__ = ("data", "event", "id")
+
+    def __init__(self, data: str, event: str = "message", id: str | None = None) -> None:
+        self.data = data
+        self.event = event
+        self.id = id
+
+    def __repr__(self) -> str:
+        return f"SSEEvent(data={self.data!r}, event={self.event!r}, id={self.id!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, SSEEvent):
+            return NotImplemented
+        return (self.data, self.event, self.id) == (other.data, other.event, other.id)
+
+
+class SSEDecoder:
+    """
+    增量 SSE 解码器（按 WHATWG EventSource 规则）：
+    逐行喂入，遇到空行派发一个事件；支持多行 data、event、id、retry 字段和 ':' 注释行。
+    """
+
+    def __init__(self) -> None:
+        self._data: list[str] = []
+        self._event = ""
+        self.last_event_id: str | None = None
+        self.retry_ms: int | None = None
+
+    def feed_line(self, line: str) -> SSEEvent | None:
+        if not line:
+            return self._dispatch()
+
+        # 热路径：绝大多数行都是 data:
+        if line.startswith("data:"):
+            value = line[5:]
+            self._data.append(value[1:] if value.startswith(" ") else value)
+            return None
+
+        if line[0] == ":":
+            return None
+
+        field, sep, value = line.partition(":")
+        if sep and value.startswith(" "):
+            value = value[1:]
+
+        if field == "event":
+            self._event = value
+        elif field == "id":
+            if "\0" not in value:
+                self.last_event_id = value
+        elif field == "retry":
+            if value.isdigit():
+                self.retry_ms = int(value)
+        elif field == "data":  # "data" 不带冒号
+            self._data.append(value)
+        return None
+
+    def flush(self) -> SSEEvent | None:
+        """流结束时调用：上游最后一个事件后可能没有空行"""
+        return self._dispatch()
+
+    def _dispatch(self) -> SSEEvent | None:
+        if not self._data:
+            self._event = ""
+            return None
+
+        data = self._data[0] if len(self._data) == 1 else "\n".join(self._data)
+        event = SSEEvent(data=data, event=self._event or "message", id=self.last_event_id)
+        # 原地清空：AgentStreamDecoder 直接持有这个列表
+        self._data.clear()
+        self._event = ""
+        return event
+
+
+# ---------- AgentKit event dispatch ----------
+
+_NO_CHUNKS: tuple[dict[str, Any], ...] = ()
+
+
+def _text_chunks(parts: Any) -> list[dict[str, Any]] | tuple[dict[str, Any], ...]:
+    if not isinstance(parts, list) or not parts:
+        return _NO_CHUNKS
+
+    chunks: list[dict[str, Any]] = []
+    for part in parts:
+        if not isinstance(part, dict):
+            continue
+        part_type = part.get("type") or part.get("kind")
+        if part_type != "text":
+            continue
+        content = part.get("text", "")
+        if content:
+            chunks.append({"type": "text", "content": content})
+    return chunks
+
+
+class AgentStreamDecoder:
+    """
+    把 AgentKit message/stream 的 SSE 行解码为 chat 层的 chunk
+    （{"type": "text" | "thought" | "error", "content": ...}）。
+
+    事件按 kind 查表分发；status-update 直接转发上游原始 JSON 文本，
+    只有被 JSON-RPC result 包裹时才需要重新序列化一次。
+
+    data 行与空行是每个事件都要走的热路径，在 feed_line 里直接处理（不构造 SSEEvent），
+    其它字段交给 SSEDecoder。
+    """
+
+    def __init__(
+        self,
+        loads: Callable[[str], Any] | None = None,
+        dumps: Callable[[Any], str] | None = None,
+    ) -> None:
+        self.sse = SSEDecoder()
+        self._feed_sse = self.sse.feed_line
+        self._data = self.sse._data
+        self._loads = loads or json_loads
+        self._dumps = dumps or json_dumps
+        self._handlers: dict[str, Callable[[dict[str, Any], str | None], Any]] = {
+            "message": self._on_message,
+            "artifact-update": self._on_artifact_update,
+            "thought": self._on_thought,
+            "status-update": self._on_status_update,
+        }
+
+    def feed_line(self, line: str) -> list[dict[str, Any]] | tuple[dict[str, Any], ...]:
+        if line.startswith("data:"):
+            self._data.append(line[6:] if line[5:6] == " " else line[5:])
+            return _NO_CHUNKS
+        if line:
+            # event / id / retry / 注释行不会派发事件
+            self._feed_sse(line)
+            return _NO_CHUNKS
+
+        data = self._data
+        if not data:
+            self.sse._event = ""
+            return _NO_CHUNKS
+        payload = data[0] if len(data) == 1 else "\n".join(data)
+        data.clear()
+        self.sse._event = ""
+        return self.decode(payload)
+
+    def finish(self) -> list[dict[str, Any]] | tuple[dict[str, Any], ...]:
+        event = self.sse.flush()
+        if event is None:
+            return _NO_CHUNKS
+        return self.decode(event.data)
+
+    def decode(self, data: str) -> list[dict[str, Any]] | tuple[dict[str, Any], ...]:
+        try:
+            raw_data = self._loads(data)
+        except JSON_DECODE_ERRORS:
+            if "\n" not in data:
+                return _NO_CHUNKS
+            # 兼容不规范的上游：多个 data 行之间没有空行分隔，逐行当作独立事件解析
+            chunks: list[dict[str, Any]] = []
+            for line in data.split("\n"):
+                if line.strip():
+                    chunks.extend(self.decode(line))
+            return chunks
+
+        if not isinstance(raw_data, dict):
+            return _NO_CHUNKS
+
+        # 1. Handle errors in JSON-RPC
+        error_content = raw_data.get("error")
+        if error_content is not None:
+            if isinstance(error_content, dict):
+                error_msg = error_content.get("message", str(error_content))
+            else:
+                error_msg = str(error_content)
+            return [{"type": "error", "content": error_msg}]
+
+        # 2. Unwrap JSON-RPC result if present
+        event = raw_data.get("result")
+        if event is None:
+            event = raw_data
+            raw_event: str | None = data
+        else:
+            raw_event = None
+
+        if not isinstance(event, dict):
+            return _NO_CHUNKS
+
+        handler = self._handlers.get(event.get("kind"))
+        if handler is None:
+            return _NO_CHUNKS
+        return handler(event, raw_event)
+
+    def _on_message(self, event: dict[str, Any], raw_event: str | None):
+        return _text_chunks(event.get("parts"))
+
+    def _on_artifact_update(self, event: dict[str, Any], raw_event: str | None):
+        artifact = event.get("artifact") or {}
+        return _text_chunks(artifact.get("parts") if isinstance(artifact, dict) else None)
+
+    def _on_thought(self, event: dict[str, Any], raw_event: str | None):
+        text = event.get("text", "")
+        if not text:
+            return _NO_CHUNKS
+        return [{"type": "thought", "content": text}]
+
+    def _on_status_update(self, event: dict[str, Any], raw_event: str | None):
+        content = raw_event if raw_event is not None else self._dumps(event)
+        return [{"type": "thought", "content": content}]
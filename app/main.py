@@ -1,9 +1,12 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import text
 
 from app.api import sessions, chat, history
-from app.core.db import get_engine, init_db
+from app.core.db import dispose_async_engine, get_engine, init_db, pool_status, shutdown_executor
+from app.core.migrations import explain_hot_queries, migration_status
+from app.core.session_cache import get_session_cache
+from app.services.write_behind import get_write_behind, shutdown_write_behind
 
 app = FastAPI()
 
@@ -13,13 +16,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Chat-Turn-Id", "X-Chat-Coalesced", "X-Answer-Cache", "Retry-After"],
 )
 
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     # FaaS 冷启动必须轻量化：不要在这里做 DB 连接/建表
-    pass
+    # AgentKit 连接池只创建对象、不建连，首个请求时才握手，之后跨轮次复用
+    await chat.agent.startup()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await chat.agent.aclose()
+    # 先把写后缓冲中的消息全部提交，再释放连接池与线程池
+    shutdown_write_behind()
+    await dispose_async_engine()
+    shutdown_executor()
 
 
 # ---- Health / Admin endpoints (推荐保留，用于上线后快速验证网络与DB权限) ----
@@ -38,14 +52,83 @@ def health_db():
         raise HTTPException(status_code=500, detail=f"db not ready: {e}")
 
 
+@app.get("/health/agent")
+def health_agent():
+    """
+    AgentKit 熔断器状态：closed 正常；open 表示正在快速失败；half_open 表示正在探测恢复。
+    """
+    return chat.agent.breaker.snapshot()
+
+
+@app.get("/admin/admission")
+def admin_admission():
+    """
+    /paperapi/chat 准入控制统计：当前并发、排队深度、等待时间与拒绝次数，用于容量评估。
+    """
+    return chat.admission.snapshot()
+
+
+@app.get("/admin/chat-turns")
+def admin_chat_turns():
+    """
+    对话轮次统计：进行中 / 缓冲中的轮次数，以及被合并掉的重复提交次数。
+    """
+    return chat.turns.snapshot()
+
+
+@app.get("/admin/answer-cache")
+def admin_answer_cache():
+    """
+    公开论文库回答缓存统计：命中 / 未命中 / 跳过次数、条目数与占用字节。未开启时 enabled=false。
+    """
+    if chat.answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **chat.answer_cache.snapshot()}
+
+
+@app.get("/admin/write-behind")
+def admin_write_behind():
+    """
+    消息写后缓冲统计：队列深度 / 峰值、提交批次数与条数、每批提交耗时、失败次数、队列满时的同步写入次数。未开启时 enabled=false。
+    """
+    writer = get_write_behind()
+    if writer is None:
+        return {"enabled": False}
+    return {"enabled": True, **writer.snapshot()}
+
+
+@app.get("/admin/session-cache")
+def admin_session_cache():
+    """
+    会话元数据缓存统计：条数、命中 / 未命中次数与命中率、本地 / 远端失效次数、LRU 淘汰次数。未开启时 enabled=false。
+    """
+    cache = get_session_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.snapshot()}
+
+
+@app.get("/admin/db-pool")
+def admin_db_pool():
+    """
+    数据库连接池统计：当前 profile、已借出 / 空闲 / 溢出连接数、取连接等待时间与超时次数，用于按数据调整池大小。
+    """
+    return pool_status()
+
+
 @app.post("/admin/init-db")
-def admin_init_db():
+def admin_init_db(explain: bool = Query(False)):
     """
-    仅用于首次部署初始化建表。生产建议加鉴权（例如内部 Header Token）或仅内网可达。
+    首次部署建表与后续 schema 升级（执行尚未执行的版本化迁移，可重复调用）。生产建议加鉴权（例如内部 Header Token）或仅内网可达。
+    explain=true 时迁移后对热点查询执行 EXPLAIN，检查是否用到了预期索引。
     """
     try:
-        init_db()
-        return {"ok": True}
+        applied = init_db()
+        result = {"ok": True, "applied": applied, **migration_status(get_engine())}
+        if explain:
+            result["explain"] = explain_hot_queries(get_engine())
+            result["ok"] = all(r["ok"] for r in result["explain"])
+        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"init_db failed: {e}")
 
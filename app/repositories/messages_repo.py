@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import base64
+import binascii
+from datetime import datetime
 from typing import List, Dict, Any
 
 from sqlalchemy import (
@@ -11,12 +14,19 @@ from sqlalchemy import (
     Text,
     MetaData,
     ForeignKey,
+    Index,
+    bindparam,
+    column,
+    func,
     select,
     insert,
     delete,
+    true,
+    tuple_,
 )
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
 
 from app.core.time_utils import iso_bjt, now_bjt_naive
 
@@ -51,6 +61,225 @@ message_parts_table = Table(
     Column("sort_order", Integer, nullable=False),
 )
 
+# ---------- indexes（已有库由 app/core/migrations.py 的迁移补建） ----------
+
+# list_messages / list_messages_page：WHERE session_id = ? ORDER BY created_at, id；delete_by_session_id 的子查询只用到前缀与 id
+ix_messages_session_created_id = Index(
+    "ix_messages_session_created_id",
+    messages_table.c.session_id,
+    messages_table.c.created_at,
+    messages_table.c.id,
+)
+# 按消息取 parts：WHERE message_id IN (...) ORDER BY message_id, sort_order；删除会话时按 message_id 删除
+ix_message_parts_message_sort = Index(
+    "ix_message_parts_message_sort",
+    message_parts_table.c.message_id,
+    message_parts_table.c.sort_order,
+)
+
+
+# ---------- statements（同步 / 异步仓储共用） ----------
+
+# 写入只需两条语句：messages 一次 executemany（insertmanyvalues + RETURNING，按参数顺序返回 id），
+# 所有 message_parts 一次 executemany；PostgreSQL 上单条消息用一条 CTE 语句同时写入消息与 parts
+
+_insert_messages_stmt = insert(messages_table).returning(messages_table.c.id, sort_by_parameter_order=True)
+_insert_parts_stmt = insert(message_parts_table)
+
+_PART_COLUMNS = ("type", "content", "url", "metadata", "sort_order")
+
+
+def _message_row(session_id: str, role: str, created_at: datetime | None = None) -> Dict[str, Any]:
+    return {"session_id": session_id, "role": role, "created_at": created_at or now_bjt_naive()}
+
+
+def _part_values(parts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "type": part["type"],
+            "content": part.get("content"),
+            "url": part.get("url"),
+            "metadata": part.get("metadata"),
+            "sort_order": idx,
+        }
+        for idx, part in enumerate(parts)
+    ]
+
+
+def _part_rows(message_ids: List[int], messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"message_id": message_id, **values}
+        for message_id, message in zip(message_ids, messages)
+        for values in _part_values(message["parts"])
+    ]
+
+
+def _insert_message_with_parts_stmt(session_id: str, role: str, parts: List[Dict[str, Any]]):
+    """
+    PostgreSQL：WITH new_message AS (INSERT ... RETURNING id) INSERT INTO message_parts SELECT ... FROM jsonb_to_recordset(:parts)
+    消息与全部 parts 一次往返写入。
+    """
+    new_message = (
+        insert(messages_table)
+        .values(**_message_row(session_id, role))
+        .returning(messages_table.c.id)
+        .cte("new_message")
+    )
+    rows = (
+        func.jsonb_to_recordset(bindparam("parts", value=_part_values(parts), type_=JSONB))
+        .table_valued(
+            column("type", String),
+            column("content", Text),
+            column("url", Text),
+            column("metadata", JSONB),
+            column("sort_order", Integer),
+        )
+        .render_derived(name="p", with_types=True)
+    )
+    return insert(message_parts_table).from_select(
+        ["message_id", *_PART_COLUMNS],
+        select(new_message.c.id, *(rows.c[name] for name in _PART_COLUMNS))
+        .select_from(new_message)
+        .join(rows, true()),
+    )
+
+
+def _list_stmt(session_id: str):
+    return (
+        select(
+            messages_table.c.id.label("message_id"),
+            messages_table.c.role,
+            messages_table.c.created_at,
+            message_parts_table.c.type,
+            message_parts_table.c.content,
+            message_parts_table.c.url,
+            message_parts_table.c.metadata,
+            message_parts_table.c.sort_order,
+        )
+        .join(
+            message_parts_table,
+            messages_table.c.id == message_parts_table.c.message_id,
+            isouter=True,
+        )
+        .where(messages_table.c.session_id == session_id)
+        .order_by(
+            messages_table.c.created_at.asc(),
+            messages_table.c.id.asc(),
+            message_parts_table.c.sort_order.asc(),
+        )
+    )
+
+
+# ---------- keyset 分页：按 (created_at, id) 取一页消息 id，再取这些消息的 parts ----------
+
+def encode_cursor(created_at: datetime, message_id: int) -> str:
+    """不透明游标：base64url("<created_at ISO>|<id>")，指向上一页的最后一条消息"""
+    raw = f"{created_at.isoformat()}|{message_id}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """解析 encode_cursor 生成的游标，格式不对时抛 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        created_at, message_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def _page_stmt(session_id: str, limit: int, after: tuple[datetime, int] | None, newest_first: bool):
+    key = tuple_(messages_table.c.created_at, messages_table.c.id)
+    stmt = select(
+        messages_table.c.id,
+        messages_table.c.role,
+        messages_table.c.created_at,
+    ).where(messages_table.c.session_id == session_id)
+
+    if after is not None:
+        boundary = tuple_(
+            bindparam("after_created_at", after[0], type_=DateTime),
+            bindparam("after_id", after[1], type_=Integer),
+        )
+        stmt = stmt.where(key < boundary if newest_first else key > boundary)
+
+    if newest_first:
+        stmt = stmt.order_by(messages_table.c.created_at.desc(), messages_table.c.id.desc())
+    else:
+        stmt = stmt.order_by(messages_table.c.created_at.asc(), messages_table.c.id.asc())
+    # 多取一条判断是否还有下一页
+    return stmt.limit(limit + 1)
+
+
+def _page_parts_stmt(message_ids: List[int]):
+    return (
+        select(
+            message_parts_table.c.message_id,
+            message_parts_table.c.type,
+            message_parts_table.c.content,
+            message_parts_table.c.url,
+            message_parts_table.c.metadata,
+        )
+        .where(message_parts_table.c.message_id.in_(message_ids))
+        .order_by(message_parts_table.c.message_id.asc(), message_parts_table.c.sort_order.asc())
+    )
+
+
+def _page_result(rows, part_rows, limit: int) -> tuple[List[Dict[str, Any]], str | None]:
+    page = rows[:limit]
+    parts: Dict[int, List[Dict[str, Any]]] = {r["id"]: [] for r in page}
+    for p in part_rows:
+        parts[p["message_id"]].append(
+            {
+                "type": p["type"],
+                "content": p["content"],
+                "url": p["url"],
+                "metadata": p["metadata"],
+            }
+        )
+
+    messages = [
+        {"role": r["role"], "created_at": iso_bjt(r["created_at"]), "parts": parts[r["id"]]}
+        for r in page
+    ]
+    next_cursor = encode_cursor(page[-1]["created_at"], page[-1]["id"]) if len(rows) > limit else None
+    return messages, next_cursor
+
+
+def _group_rows(rows) -> List[Dict[str, Any]]:
+    messages: Dict[int, Dict[str, Any]] = {}
+
+    for r in rows:
+        mid: int = r["message_id"]
+
+        if mid not in messages:
+            messages[mid] = {
+                "role": r["role"],
+                "created_at": iso_bjt(r["created_at"]),
+                "parts": [],
+            }
+
+        if r["type"] is not None:
+            messages[mid]["parts"].append(
+                {
+                    "type": r["type"],
+                    "content": r["content"],
+                    "url": r["url"],
+                    "metadata": r["metadata"],
+                }
+            )
+
+    return list(messages.values())
+
+
+def _delete_stmts(session_id: str):
+    msg_ids_stmt = select(messages_table.c.id).where(messages_table.c.session_id == session_id)
+    parts_del_stmt = delete(message_parts_table).where(
+        message_parts_table.c.message_id.in_(msg_ids_stmt)
+    )
+    msgs_del_stmt = delete(messages_table).where(messages_table.c.session_id == session_id)
+    return parts_del_stmt, msgs_del_stmt
+
 
 # ---------- repository ----------
 
@@ -74,95 +303,130 @@ class MessagesRepo:
         ]
         """
 
-        now = now_bjt_naive()
+        if parts and self.engine.dialect.name == "postgresql":
+            with self.engine.begin() as conn:
+                conn.execute(_insert_message_with_parts_stmt(session_id, role, parts))
+            return
+
+        self.save_messages([{"session_id": session_id, "role": role, "parts": parts}])
+
+    def save_messages(self, messages: List[Dict[str, Any]]) -> None:
+        """
+        在一个事务内按顺序保存多条消息（批量对话的分组写入 / 写后缓冲的批量提交）：
+        [{"session_id": "...", "role": "user", "parts": [...], "created_at": 可选}, ...]
+        会话 updated_at 由调用方通过 SessionsRepo.touch_sessions 刷新（同时维护会话缓存）。
+        """
+        if not messages:
+            return
 
         with self.engine.begin() as conn:
-            # 1️⃣ insert message (INT4 id)
-            result = conn.execute(
-                insert(messages_table)
-                .values(
-                    session_id=session_id,
-                    role=role,
-                    created_at=now,
-                )
-                .returning(messages_table.c.id)
-            )
+            # 1️⃣ insert messages (INT4 id)，id 与 messages 顺序一一对应
+            message_ids = conn.execute(
+                _insert_messages_stmt,
+                [_message_row(m["session_id"], m["role"], m.get("created_at")) for m in messages],
+            ).scalars().all()
 
-            message_id: int = result.scalar_one()
-
-            # 2️⃣ insert message parts (INT4 message_id)
-            for idx, part in enumerate(parts):
-                conn.execute(
-                    insert(message_parts_table).values(
-                        message_id=message_id,
-                        type=part["type"],
-                        content=part.get("content"),
-                        url=part.get("url"),
-                        metadata=part.get("metadata"),
-                        sort_order=idx,
-                    )
-                )
+            # 2️⃣ insert all message parts (INT4 message_id)
+            part_rows = _part_rows(message_ids, messages)
+            if part_rows:
+                conn.execute(_insert_parts_stmt, part_rows)
 
     # ========== 读取 ==========
 
     def list_messages(self, session_id: str) -> List[Dict[str, Any]]:
-        stmt = (
-            select(
-                messages_table.c.id.label("message_id"),
-                messages_table.c.role,
-                messages_table.c.created_at,
-                message_parts_table.c.type,
-                message_parts_table.c.content,
-                message_parts_table.c.url,
-                message_parts_table.c.metadata,
-                message_parts_table.c.sort_order,
-            )
-            .join(
-                message_parts_table,
-                messages_table.c.id == message_parts_table.c.message_id,
-                isouter=True,
-            )
-            .where(messages_table.c.session_id == session_id)
-            .order_by(
-                messages_table.c.created_at.asc(),
-                message_parts_table.c.sort_order.asc(),
-            )
-        )
-
         with self.engine.begin() as conn:
-            rows = conn.execute(stmt).mappings().all()
-
-        messages: Dict[int, Dict[str, Any]] = {}
+            rows = conn.execute(_list_stmt(session_id)).mappings().all()
 
-        for r in rows:
-            mid: int = r["message_id"]
+        return _group_rows(rows)
 
-            if mid not in messages:
-                messages[mid] = {
-                    "role": r["role"],
-                    "created_at": iso_bjt(r["created_at"]),
-                    "parts": [],
-                }
-
-            if r["type"] is not None:
-                messages[mid]["parts"].append(
-                    {
-                        "type": r["type"],
-                        "content": r["content"],
-                        "url": r["url"],
-                        "metadata": r["metadata"],
-                    }
-                )
+    def list_messages_page(
+        self,
+        session_id: str,
+        limit: int,
+        cursor: str | None = None,
+        newest_first: bool = False,
+    ) -> tuple[List[Dict[str, Any]], str | None]:
+        """
+        keyset 分页读取：一条语句取一页消息（limit 条），再一条语句取这些消息的 parts。
+        返回 (消息列表, next_cursor)；没有下一页时 next_cursor 为 None。cursor 无效时抛 ValueError。
+        """
+        after = decode_cursor(cursor) if cursor else None
+        with self.engine.begin() as conn:
+            rows = conn.execute(_page_stmt(session_id, limit, after, newest_first)).mappings().all()
+            message_ids = [r["id"] for r in rows[:limit]]
+            part_rows = conn.execute(_page_parts_stmt(message_ids)).mappings().all() if message_ids else []
 
-        return list(messages.values())
+        return _page_result(rows, part_rows, limit)
 
     def delete_by_session_id(self, session_id: str) -> None:
-        msg_ids_stmt = select(messages_table.c.id).where(messages_table.c.session_id == session_id)
-        parts_del_stmt = delete(message_parts_table).where(
-            message_parts_table.c.message_id.in_(msg_ids_stmt)
-        )
-        msgs_del_stmt = delete(messages_table).where(messages_table.c.session_id == session_id)
+        parts_del_stmt, msgs_del_stmt = _delete_stmts(session_id)
 
         with self.engine.begin() as conn:
             conn.execute(parts_del_stmt)
             conn.execute(msgs_del_stmt)
+
+
+class AsyncMessagesRepo:
+    """MessagesRepo 的 AsyncEngine 版本（asyncpg / aiosqlite），方法签名一致，均为协程"""
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+
+    async def save_message(
+        self,
+        session_id: str,
+        role: str,
+        parts: List[Dict[str, Any]],
+    ) -> None:
+        if parts and self.engine.dialect.name == "postgresql":
+            async with self.engine.begin() as conn:
+                await conn.execute(_insert_message_with_parts_stmt(session_id, role, parts))
+            return
+
+        await self.save_messages([{"session_id": session_id, "role": role, "parts": parts}])
+
+    async def save_messages(self, messages: List[Dict[str, Any]]) -> None:
+        if not messages:
+            return
+
+        async with self.engine.begin() as conn:
+            message_ids = (
+                await conn.execute(
+                    _insert_messages_stmt,
+                    [_message_row(m["session_id"], m["role"], m.get("created_at")) for m in messages],
+                )
+            ).scalars().all()
+
+            part_rows = _part_rows(message_ids, messages)
+            if part_rows:
+                await conn.execute(_insert_parts_stmt, part_rows)
+
+    async def list_messages(self, session_id: str) -> List[Dict[str, Any]]:
+        async with self.engine.begin() as conn:
+            rows = (await conn.execute(_list_stmt(session_id))).mappings().all()
+
+        return _group_rows(rows)
+
+    async def list_messages_page(
+        self,
+        session_id: str,
+        limit: int,
+        cursor: str | None = None,
+        newest_first: bool = False,
+    ) -> tuple[List[Dict[str, Any]], str | None]:
+        after = decode_cursor(cursor) if cursor else None
+        async with self.engine.begin() as conn:
+            rows = (await conn.execute(_page_stmt(session_id, limit, after, newest_first))).mappings().all()
+            message_ids = [r["id"] for r in rows[:limit]]
+            part_rows = (
+                (await conn.execute(_page_parts_stmt(message_ids))).mappings().all() if message_ids else []
+            )
+
+        return _page_result(rows, part_rows, limit)
+
+    async def delete_by_session_id(self, session_id: str) -> None:
+        parts_del_stmt, msgs_del_stmt = _delete_stmts(session_id)
+
+        async with self.engine.begin() as conn:
+            await conn.execute(parts_del_stmt)
+            await conn.execute(msgs_del_stmt)
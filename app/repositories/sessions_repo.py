@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from datetime import datetime
+from typing import TYPE_CHECKING
 from uuid import uuid4
 
 from sqlalchemy import (
@@ -10,15 +12,20 @@ from sqlalchemy import (
     DateTime,
     Text,
     MetaData,
+    Index,
     select,
     insert,
     update,
     delete,
 )
 from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
 
 from app.core.time_utils import iso_bjt, now_bjt_naive
 
+if TYPE_CHECKING:
+    from app.core.session_cache import SessionCache
+
 
 metadata = MetaData()
 
@@ -34,133 +41,241 @@ sessions_table = Table(
     Column("updated_at", DateTime, nullable=False),
 )
 
+# list_sessions：WHERE user_id = ? AND status = 'active' ORDER BY updated_at DESC（已有库由迁移补建）
+ix_sessions_user_status_updated = Index(
+    "ix_sessions_user_status_updated",
+    sessions_table.c.user_id,
+    sessions_table.c.status,
+    sessions_table.c.updated_at,
+)
+
+
+# ---------- statements（同步 / 异步仓储共用） ----------
+
+_session_columns = (
+    sessions_table.c.session_id,
+    sessions_table.c.user_id,
+    sessions_table.c.status,
+    sessions_table.c.title,
+    sessions_table.c.created_at,
+    sessions_table.c.updated_at,
+)
+
+
+def _to_dict(row) -> dict:
+    return {
+        "session_id": row["session_id"],
+        "user_id": row["user_id"],
+        "status": row["status"],
+        "title": row["title"],
+        "created_at": iso_bjt(row["created_at"]),
+        "updated_at": iso_bjt(row["updated_at"]),
+    }
+
+
+def _create_stmt(user_id: str):
+    now = now_bjt_naive()
+    session_id = str(uuid4())
+
+    stmt = insert(sessions_table).values(
+        session_id=session_id,
+        user_id=user_id,
+        status="active",
+        title="新对话",
+        created_at=now,
+        updated_at=now,
+    )
+    created = {
+        "session_id": session_id,
+        "user_id": user_id,
+        "status": "active",
+        "title": "新对话",
+        "created_at": iso_bjt(now),
+        "updated_at": iso_bjt(now),
+    }
+    return stmt, created
+
+
+def _list_stmt(user_id: str):
+    return (
+        select(*_session_columns)
+        .where(sessions_table.c.user_id == user_id)
+        .where(sessions_table.c.status == "active")
+        .order_by(sessions_table.c.updated_at.desc())
+    )
+
+
+def _get_stmt(session_id: str):
+    return select(*_session_columns).where(sessions_table.c.session_id == session_id).limit(1)
+
+
+def _update_stmt(session_id: str, **values):
+    return (
+        update(sessions_table)
+        .where(sessions_table.c.session_id == session_id)
+        .values(**{"updated_at": now_bjt_naive(), **values})
+    )
+
+
+def _touch_many_stmt(session_ids: list[str], now: datetime | None = None):
+    return (
+        update(sessions_table)
+        .where(sessions_table.c.session_id.in_(session_ids))
+        .values(updated_at=now or now_bjt_naive())
+    )
+
+
+def _delete_stmt(session_id: str):
+    return delete(sessions_table).where(sessions_table.c.session_id == session_id)
+
+
+# ---------- repository ----------
 
 class SessionsRepo:
-    def __init__(self, engine: Engine):
+    """
+    cache：可选的会话元数据缓存（app/core/session_cache.py）。get_session 先查缓存；
+    改标题 / 归档 / 删除在提交后使缓存失效，touch 把新的 updated_at 写进缓存。
+    """
+
+    def __init__(self, engine: Engine, cache: SessionCache | None = None):
         self.engine = engine
+        self.cache = cache
 
     def create_session(self, user_id: str) -> dict:
-        now = now_bjt_naive()
-        session_id = str(uuid4())
-
-        stmt = insert(sessions_table).values(
-            session_id=session_id,
-            user_id=user_id,
-            status="active",
-            title="新对话",
-            created_at=now,
-            updated_at=now,
-        )
+        stmt, created = _create_stmt(user_id)
 
         with self.engine.begin() as conn:
             conn.execute(stmt)
 
-        return {
-            "session_id": session_id,
-            "user_id": user_id,
-            "status": "active",
-            "title": "新对话",
-            "created_at": iso_bjt(now),
-            "updated_at": iso_bjt(now),
-        }
+        if self.cache is not None:
+            self.cache.put(created["session_id"], created)
+        return created
 
     def list_sessions(self, user_id: str) -> list[dict]:
-        stmt = (
-            select(
-                sessions_table.c.session_id,
-                sessions_table.c.user_id,
-                sessions_table.c.status,
-                sessions_table.c.title,
-                sessions_table.c.created_at,
-                sessions_table.c.updated_at,
-            )
-            .where(sessions_table.c.user_id == user_id)
-            .where(sessions_table.c.status == "active")
-            .order_by(sessions_table.c.updated_at.desc())
-        )
-
         with self.engine.begin() as conn:
-            rows = conn.execute(stmt).mappings().all()
-
-        return [
-            {
-                "session_id": r["session_id"],
-                "user_id": r["user_id"],
-                "status": r["status"],
-                "title": r["title"],
-                "created_at": iso_bjt(r["created_at"]),
-                "updated_at": iso_bjt(r["updated_at"]),
-            }
-            for r in rows
-        ]
+            rows = conn.execute(_list_stmt(user_id)).mappings().all()
+
+        return [_to_dict(r) for r in rows]
 
     def get_session(self, session_id: str) -> dict | None:
-        stmt = (
-            select(
-                sessions_table.c.session_id,
-                sessions_table.c.user_id,
-                sessions_table.c.status,
-                sessions_table.c.title,
-                sessions_table.c.created_at,
-                sessions_table.c.updated_at,
-            )
-            .where(sessions_table.c.session_id == session_id)
-            .limit(1)
-        )
+        token = None
+        if self.cache is not None:
+            cached = self.cache.get(session_id)
+            if cached is not None:
+                return cached
+            token = self.cache.load_token()
 
         with self.engine.begin() as conn:
-            row = conn.execute(stmt).mappings().first()
+            row = conn.execute(_get_stmt(session_id)).mappings().first()
 
         if not row:
             return None
 
-        return {
-            "session_id": row["session_id"],
-            "user_id": row["user_id"],
-            "status": row["status"],
-            "title": row["title"],
-            "created_at": iso_bjt(row["created_at"]),
-            "updated_at": iso_bjt(row["updated_at"]),
-        }
+        session = _to_dict(row)
+        if self.cache is not None:
+            self.cache.put(session_id, session, token)
+        return session
 
     def touch_session(self, session_id: str) -> None:
-        stmt = (
-            update(sessions_table)
-            .where(sessions_table.c.session_id == session_id)
-            .values(updated_at=now_bjt_naive())
-        )
+        self.touch_sessions([session_id])
 
+    def touch_sessions(self, session_ids: list[str]) -> None:
+        # 一条 UPDATE 刷新多个会话的 updated_at
+        now = now_bjt_naive()
         with self.engine.begin() as conn:
-            conn.execute(stmt)
+            conn.execute(_touch_many_stmt(session_ids, now))
 
-    def update_title(self, session_id: str, title: str) -> None:
-        stmt = (
-            update(sessions_table)
-            .where(sessions_table.c.session_id == session_id)
-            .values(
-                title=title,
-                updated_at=now_bjt_naive(),
-            )
-        )
+        if self.cache is not None:
+            self.cache.touch(session_ids, iso_bjt(now))
 
+    def update_title(self, session_id: str, title: str) -> None:
         with self.engine.begin() as conn:
-            conn.execute(stmt)
+            conn.execute(_update_stmt(session_id, title=title))
+        self._invalidate(session_id)
 
     def archive_session(self, session_id: str) -> None:
-        stmt = (
-            update(sessions_table)
-            .where(sessions_table.c.session_id == session_id)
-            .values(
-                status="archived",
-                updated_at=now_bjt_naive(),
-            )
-        )
-
         with self.engine.begin() as conn:
-            conn.execute(stmt)
+            conn.execute(_update_stmt(session_id, status="archived"))
+        self._invalidate(session_id)
 
     def delete_session(self, session_id: str) -> None:
-        stmt = delete(sessions_table).where(sessions_table.c.session_id == session_id)
-
         with self.engine.begin() as conn:
-            conn.execute(stmt)
+            conn.execute(_delete_stmt(session_id))
+        self._invalidate(session_id)
+
+    def _invalidate(self, session_id: str) -> None:
+        if self.cache is not None:
+            self.cache.invalidate(session_id)
+
+
+class AsyncSessionsRepo:
+    """SessionsRepo 的 AsyncEngine 版本（asyncpg / aiosqlite），方法签名一致，均为协程"""
+
+    def __init__(self, engine: AsyncEngine, cache: SessionCache | None = None):
+        self.engine = engine
+        self.cache = cache
+
+    async def create_session(self, user_id: str) -> dict:
+        stmt, created = _create_stmt(user_id)
+
+        async with self.engine.begin() as conn:
+            await conn.execute(stmt)
+
+        if self.cache is not None:
+            self.cache.put(created["session_id"], created)
+        return created
+
+    async def list_sessions(self, user_id: str) -> list[dict]:
+        async with self.engine.begin() as conn:
+            rows = (await conn.execute(_list_stmt(user_id))).mappings().all()
+
+        return [_to_dict(r) for r in rows]
+
+    async def get_session(self, session_id: str) -> dict | None:
+        token = None
+        if self.cache is not None:
+            cached = self.cache.get(session_id)
+            if cached is not None:
+                return cached
+            token = self.cache.load_token()
+
+        async with self.engine.begin() as conn:
+            row = (await conn.execute(_get_stmt(session_id))).mappings().first()
+
+        if not row:
+            return None
+
+        session = _to_dict(row)
+        if self.cache is not None:
+            self.cache.put(session_id, session, token)
+        return session
+
+    async def touch_session(self, session_id: str) -> None:
+        await self.touch_sessions([session_id])
+
+    async def touch_sessions(self, session_ids: list[str]) -> None:
+        now = now_bjt_naive()
+        async with self.engine.begin() as conn:
+            await conn.execute(_touch_many_stmt(session_ids, now))
+
+        if self.cache is not None:
+            self.cache.touch(session_ids, iso_bjt(now))
+
+    async def update_title(self, session_id: str, title: str) -> None:
+        async with self.engine.begin() as conn:
+            await conn.execute(_update_stmt(session_id, title=title))
+        self._invalidate(session_id)
+
+    async def archive_session(self, session_id: str) -> None:
+        async with self.engine.begin() as conn:
+            await conn.execute(_update_stmt(session_id, status="archived"))
+        self._invalidate(session_id)
+
+    async def delete_session(self, session_id: str) -> None:
+        async with self.engine.begin() as conn:
+            await conn.execute(_delete_stmt(session_id))
+        self._invalidate(session_id)
+
+    def _invalidate(self, session_id: str) -> None:
+        if self.cache is not None:
+            self.cache.invalidate(session_id)
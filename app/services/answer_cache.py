@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT = "?？。.!！~～ "
+
+
+def normalize_question(text: str) -> str:
+    """
+    归一化问题文本：全角转半角（NFKC）、忽略大小写、合并空白、去掉末尾标点，
+    让「什么是稀土？」与「什么是稀土」命中同一条缓存。
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return text.rstrip(_TRAILING_PUNCT)
+
+
+def answer_cache_key(text: str, use_public_paper: bool) -> str:
+    digest = hashlib.sha256(normalize_question(text).encode("utf-8")).hexdigest()
+    return f"{int(use_public_paper)}:{digest}"
+
+
+def _estimate_size(events: list[dict[str, Any]]) -> int:
+    # 粗略估算：内容的 UTF-8 字节数 + 每个事件固定开销
+    return sum(len(str(e.get("content") or "").encode("utf-8")) + 64 for e in events)
+
+
+class AnswerCache:
+    """
+    公开论文库问答的回答缓存：LRU + TTL + 内存预算。
+    缓存的是上游 Agent 的原始事件序列，命中后按同样的分块与节奏重放。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expires_at, size, events)
+        self._entries: OrderedDict[str, tuple[float, int, list[dict[str, Any]]]] = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> list[dict[str, Any]] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, events = entry
+            if self._clock() >= expires_at:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(events)
+
+    def put(self, key: str, events: list[dict[str, Any]]) -> None:
+        size = _estimate_size(events)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl_seconds, size, list(events))
+            self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable
+from uuid import uuid4
+
+
+class ChatTurn:
+    """
+    一轮对话的输出缓冲：生产者（上游 Agent 流）publish 事件，任意多个订阅者按 event id 读取。
+    事件 id 在本轮内从 1 开始单调递增，缓冲区是有界环形队列，旧事件会被淘汰。
+
+    max_lag > 0 时生产者通过 drain() 接受背压：任一在线订阅者落后超过 max_lag 个事件时暂停产出，
+    慢客户端不会让服务端无限制地跑在前面（0 表示不限制）。
+    """
+
+    def __init__(
+        self,
+        turn_id: str,
+        session_id: str,
+        buffer_size: int = 2048,
+        clock: Callable[[], float] = time.monotonic,
+        max_lag: int = 0,
+    ) -> None:
+        self.turn_id = turn_id
+        self.session_id = session_id
+        self._clock = clock
+        self.created_at = clock()
+        self.finished_at: float | None = None
+        self.task: asyncio.Task[Any] | None = None
+        # 当前订阅者（SSE 连接）数；变化时回调 on_subscribers_changed，由 TurnRegistry 决定是否放弃本轮
+        self.subscribers = 0
+        self.on_subscribers_changed: Callable[[ChatTurn], None] | None = None
+        # 本轮被主动取消的原因（例如 client_disconnected），正常结束为 None
+        self.abort_reason: str | None = None
+
+        self._buffer: deque[tuple[int, dict[str, Any]]] = deque(maxlen=max(1, buffer_size))
+        self._last_id = 0
+        self._waiters: list[asyncio.Future[None]] = []
+
+        self.max_lag = max(0, max_lag)
+        # 订阅者 -> 已取走的最后一个事件 id
+        self._cursors: dict[int, int] = {}
+        self._cursor_ids = itertools.count()
+        self._drain_waiters: list[asyncio.Future[None]] = []
+        self.backpressure_waits = 0
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def last_event_id(self) -> int:
+        return self._last_id
+
+    @property
+    def first_buffered_id(self) -> int:
+        return self._buffer[0][0] if self._buffer else self._last_id + 1
+
+    def publish(self, event: dict[str, Any]) -> int:
+        if self.done:
+            raise RuntimeError(f"turn {self.turn_id} already finished")
+        self._last_id += 1
+        self._buffer.append((self._last_id, event))
+        self._wake()
+        return self._last_id
+
+    def finish(self) -> None:
+        if self.done:
+            return
+        self.finished_at = self._clock()
+        self._wake()
+
+    async def drain(self) -> None:
+        """生产者在 publish 前调用：有订阅者落后超过 max_lag 时等待其追上（或断开）"""
+        if not self.max_lag:
+            return
+        while self._lagging():
+            self.backpressure_waits += 1
+            fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+            self._drain_waiters.append(fut)
+            await fut
+
+    def _lagging(self) -> bool:
+        return any(self._last_id - cursor >= self.max_lag for cursor in self._cursors.values())
+
+    def _wake(self) -> None:
+        waiters, self._waiters = self._waiters, []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
+
+    def _wake_drain(self) -> None:
+        if not self._drain_waiters or self._lagging():
+            return
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
+
+    async def _wait(self, timeout: float | None = None) -> bool:
+        """等待新事件或结束；超时返回 False"""
+        fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        done, _ = await asyncio.wait({fut}, timeout=timeout)
+        if not done:
+            fut.cancel()
+            self._waiters.remove(fut)
+        return bool(done)
+
+    async def subscribe(self, last_event_id: int = 0) -> AsyncIterator[tuple[int, dict[str, Any]]]:
+        """
+        先重放缓冲区中 id > last_event_id 的事件，再跟随实时输出，直到本轮结束。
+        已被环形缓冲淘汰的事件会被跳过（完整回答在结束后会落库，可通过历史接口获取）。
+        """
+        async with aclosing(self.subscribe_batches(last_event_id, max_events=1)) as batches:
+            async for batch in batches:
+                yield batch[0]
+
+    async def subscribe_batches(
+        self,
+        last_event_id: int = 0,
+        max_events: int = 64,
+        idle_timeout: float | None = None,
+    ) -> AsyncIterator[list[tuple[int, dict[str, Any]]]]:
+        """
+        同 subscribe，但一次取走缓冲中已就绪的多个事件（最多 max_events 个）：
+        客户端跟得上时每批通常只有一个事件，落后时积压的小块合并成一批写出。
+        idle_timeout 内没有新事件时产出空列表，供调用方发送心跳。
+        """
+        cursor = last_event_id
+        token = next(self._cursor_ids)
+        self._cursors[token] = cursor
+        self._set_subscribers(self.subscribers + 1)
+        try:
+            while True:
+                if cursor < self._last_id:
+                    first_id = self._buffer[0][0]
+                    start = max(cursor + 1, first_id) - first_id
+                    batch = list(itertools.islice(self._buffer, start, start + max(1, max_events)))
+                    cursor = batch[-1][0]
+                    self._cursors[token] = cursor
+                    self._wake_drain()
+                    yield batch
+                    continue
+                if self.done:
+                    return
+                if not await self._wait(idle_timeout):
+                    yield []
+        finally:
+            # 客户端断开时 StreamingResponse 取消 / 关闭生成器，这里同样会执行
+            del self._cursors[token]
+            self._wake_drain()
+            self._set_subscribers(self.subscribers - 1)
+
+    def _set_subscribers(self, count: int) -> None:
+        self.subscribers = count
+        if self.on_subscribers_changed is not None:
+            self.on_subscribers_changed(self)
+
+
+class TurnRegistry:
+    """
+    进程内的进行中 / 刚结束的对话轮次表。结束超过 ttl_seconds 的轮次在下次访问时被清理。
+
+    进行中的轮次失去全部订阅者超过 abandon_grace_seconds（期间没有续传 / 合并的订阅者接上）时，
+    取消生产者任务，让上游请求尽早结束；小于 0 表示从不取消（断开后仍跑完并落库）。
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = 2048,
+        ttl_seconds: float = 300.0,
+        dedup_window_seconds: float = 10.0,
+        abandon_grace_seconds: float = 15.0,
+        max_lag_events: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.buffer_size = buffer_size
+        self.max_lag_events = max_lag_events
+        self.ttl_seconds = ttl_seconds
+        self.dedup_window_seconds = dedup_window_seconds
+        self.abandon_grace_seconds = abandon_grace_seconds
+        self._clock = clock
+        self._turns: dict[str, ChatTurn] = {}
+        # 去重 key -> turn_id；key 带 "idem:" 前缀表示客户端显式传入的 Idempotency-Key
+        self._keys: dict[str, str] = {}
+        self._abandon_timers: dict[str, asyncio.TimerHandle] = {}
+        self.created = 0
+        self.coalesced = 0
+        self.aborted = 0
+        # 正常结束轮次的耗时，用于估算取消掉的上游时长
+        self._completed = 0
+        self._completed_seconds = 0.0
+        self.upstream_seconds_saved = 0.0
+        self.backpressure_waits = 0
+
+    def create(self, session_id: str, dedup_key: str | None = None) -> ChatTurn:
+        self.sweep()
+        turn = ChatTurn(str(uuid4()), session_id, self.buffer_size, self._clock, self.max_lag_events)
+        turn.on_subscribers_changed = self._on_subscribers_changed
+        self._turns[turn.turn_id] = turn
+        if dedup_key:
+            self._keys[dedup_key] = turn.turn_id
+        self.created += 1
+        return turn
+
+    def find_duplicate(self, dedup_key: str) -> ChatTurn | None:
+        """
+        查找可以合并的轮次：
+        - 显式 Idempotency-Key：轮次仍在注册表中即可复用
+        - 兜底 key（session + 文本哈希）：轮次仍在进行，或开始不超过 dedup_window_seconds
+        """
+        self.sweep()
+        turn_id = self._keys.get(dedup_key)
+        turn = self._turns.get(turn_id) if turn_id else None
+        if turn is None:
+            return None
+        explicit = dedup_key.startswith("idem:")
+        if explicit or not turn.done or self._clock() - turn.created_at <= self.dedup_window_seconds:
+            self.coalesced += 1
+            return turn
+        return None
+
+    def discard(self, turn: ChatTurn) -> None:
+        self._turns.pop(turn.turn_id, None)
+        self._drop_keys({turn.turn_id})
+        self._cancel_abandon_timer(turn.turn_id)
+
+    def record_finished(self, turn: ChatTurn) -> None:
+        """生产者结束时调用：累计正常结束轮次的耗时（被取消的轮次不计入）"""
+        self._cancel_abandon_timer(turn.turn_id)
+        self.backpressure_waits += turn.backpressure_waits
+        if turn.abort_reason is None and turn.finished_at is not None:
+            self._completed += 1
+            self._completed_seconds += turn.finished_at - turn.created_at
+
+    def _on_subscribers_changed(self, turn: ChatTurn) -> None:
+        if turn.subscribers > 0 or turn.done:
+            self._cancel_abandon_timer(turn.turn_id)
+            return
+        if self.abandon_grace_seconds < 0 or turn.turn_id in self._abandon_timers:
+            return
+        loop = asyncio.get_running_loop()
+        self._abandon_timers[turn.turn_id] = loop.call_later(
+            self.abandon_grace_seconds, self._abandon, turn
+        )
+
+    def _cancel_abandon_timer(self, turn_id: str) -> None:
+        handle = self._abandon_timers.pop(turn_id, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _abandon(self, turn: ChatTurn) -> None:
+        self._abandon_timers.pop(turn.turn_id, None)
+        if turn.subscribers == 0:
+            self.abort(turn, "client_disconnected")
+
+    def abort(self, turn: ChatTurn, reason: str) -> bool:
+        """取消进行中轮次的生产者任务（已输出部分由生产者按截断落库）；轮次已结束时返回 False"""
+        self._cancel_abandon_timer(turn.turn_id)
+        task = turn.task
+        if turn.done or task is None or task.done():
+            return False
+        turn.abort_reason = reason
+        task.cancel()
+        self.aborted += 1
+        # 上游还要跑多久无从得知，按正常结束轮次的平均耗时估算
+        if self._completed:
+            elapsed = self._clock() - turn.created_at
+            self.upstream_seconds_saved += max(0.0, self._completed_seconds / self._completed - elapsed)
+        return True
+
+    def get(self, turn_id: str) -> ChatTurn | None:
+        self.sweep()
+        return self._turns.get(turn_id)
+
+    def sweep(self) -> None:
+        now = self._clock()
+        expired = [
+            turn_id
+            for turn_id, turn in self._turns.items()
+            if turn.finished_at is not None and now - turn.finished_at >= self.ttl_seconds
+        ]
+        for turn_id in expired:
+            del self._turns[turn_id]
+        if expired:
+            self._drop_keys(set(expired))
+
+    def _drop_keys(self, turn_ids: set[str]) -> None:
+        for key in [k for k, v in self._keys.items() if v in turn_ids]:
+            del self._keys[key]
+
+    def snapshot(self) -> dict[str, Any]:
+        in_flight = sum(1 for t in self._turns.values() if not t.done)
+        return {
+            "in_flight": in_flight,
+            "buffered": len(self._turns) - in_flight,
+            "created": self.created,
+            "coalesced": self.coalesced,
+            "aborted": self.aborted,
+            "upstream_seconds_saved": round(self.upstream_seconds_saved, 3),
+            "backpressure_waits": self.backpressure_waits,
+        }
+
+    def __len__(self) -> int:
+        return len(self._turns)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import re
+
+# CJK 统一表意文字、假名、谚文、CJK 标点与全角符号：每个字符都可以作为断点
+_CJK = "\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\ufe30-\ufe4f\uff00-\uffef"
+# 不应出现在块首的收尾标点，断点不能落在它们前面
+_CLOSING = "，。、；：！？）」』》】〉”’,.;:!?)\\]}\"'"
+
+
+def _piece_pattern(max_chars: int) -> re.Pattern[str]:
+    # 贪婪取最多 max_chars 个字符，回溯到最后一个合法断点：
+    # 断点前是空白或 CJK，或断点后是 CJK（英文标点后不断开，URL、小数不会被拆散），
+    # 且断点后不是空白或收尾标点（空白跟随前一个词）。
+    # 字符串末尾同样要满足「断点前」条件，因此末尾未完成的英文单词不会被匹配，会留到下一块。
+    return re.compile(
+        rf"(?s).{{1,{max_chars}}}"
+        rf"(?:(?<=[\s{_CJK}])|(?=[{_CJK}]))"
+        rf"(?![\s{_CLOSING}])"
+    )
+
+
+class StreamChunker:
+    """
+    流式回答的增量分块器：把上游任意切分的文本增量重新切成不超过 max_chars 的块。
+
+    - 跨上游分块保留未完成的英文单词（carry），不会把 "Resp" + "onse" 拆到两个输出块；
+    - 中文按字断开，并避免块首出现「，。」等收尾标点；
+    - 找不到断点的超长片段（URL、长单词）按 max_chars 硬切；
+    - 每个字符只被正则扫描常数次，整体对回答长度线性。
+    """
+
+    def __init__(self, max_chars: int) -> None:
+        self.max_chars = max_chars
+        self._match = _piece_pattern(max_chars).match if max_chars > 0 else None
+        self._carry = ""
+
+    def feed(self, text: str) -> list[str]:
+        if not text:
+            return []
+        if self._match is None:
+            return [text]
+
+        buf = self._carry + text if self._carry else text
+        match = self._match
+        max_chars = self.max_chars
+        end = len(buf)
+        pos = 0
+        pieces: list[str] = []
+        while pos < end:
+            m = match(buf, pos)
+            if m is not None:
+                pieces.append(m.group())
+                pos = m.end()
+            elif end - pos > max_chars:
+                pieces.append(buf[pos : pos + max_chars])
+                pos += max_chars
+            else:
+                break
+        self._carry = buf[pos:] if pos < end else ""
+        return pieces
+
+    def flush(self) -> list[str]:
+        """上游结束（或插入错误事件）时输出剩余的 carry"""
+        carry, self._carry = self._carry, ""
+        return [carry] if carry else []
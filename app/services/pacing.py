@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+_PUNCT_CHARS = frozenset("。！？!?；;.\n")
+# 距离截止时间不足 1ms 时不再单独建一个定时器
+_MIN_SLEEP_SECONDS = 0.001
+
+
+@dataclass(frozen=True)
+class PacingConfig:
+    """
+    流式输出节奏：每块最多 chunk_size 个字符，每块占用 chunk_delay_ms，
+    以句读结尾的块额外占用 punct_delay_ms，单块最多 max_delay_ms。
+    chunk_size <= 0 表示不重新分块，全部延迟为 0 表示不限速。
+    """
+
+    chunk_size: int = 16
+    chunk_delay_ms: int = 25
+    punct_delay_ms: int = 80
+    max_delay_ms: int = 200
+
+    @property
+    def enabled(self) -> bool:
+        return self.chunk_delay_ms > 0 or self.punct_delay_ms > 0
+
+
+# pacing=off：原样转发上游增量，不分块、不等待（API / 批量调用）
+PACING_OFF = PacingConfig(chunk_size=0, chunk_delay_ms=0, punct_delay_ms=0, max_delay_ms=0)
+
+
+class Pacer:
+    """
+    按截止时间调度的输出节奏控制（每个连接 / 每轮对话一个）。
+
+    每块输出前等待到「上一块的截止时间」，再把截止时间推后这一块的时长；
+    按截止时间而不是按实际醒来时间累加，sleep 的误差不会逐块累积。
+    上游本身比目标速率慢时截止时间已经过去，直接输出、不建定时器，
+    并以当前时间重新起算，避免上游卡顿之后一次性补发一大段。
+    """
+
+    def __init__(
+        self,
+        config: PacingConfig,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self.config = config
+        self._clock = clock
+        self._sleep = sleep
+        self._deadline: float | None = None
+
+        self.slept = 0
+        self.skipped = 0
+
+    def interval(self, piece: str) -> float:
+        config = self.config
+        delay_ms = config.chunk_delay_ms
+        if config.punct_delay_ms > 0 and piece and piece[-1] in _PUNCT_CHARS:
+            delay_ms += config.punct_delay_ms
+        if config.max_delay_ms > 0:
+            delay_ms = min(delay_ms, config.max_delay_ms)
+        return delay_ms / 1000.0
+
+    async def pace(self, piece: str) -> None:
+        """在输出 piece 之前调用"""
+        if not self.config.enabled:
+            return
+
+        now = self._clock()
+        deadline = self._deadline
+        if deadline is not None and deadline - now >= _MIN_SLEEP_SECONDS:
+            self.slept += 1
+            await self._sleep(deadline - now)
+            start = deadline
+        else:
+            if deadline is not None:
+                self.skipped += 1
+            start = now if deadline is None or deadline < now else deadline
+        self._deadline = start + self.interval(piece)
@@ -5,6 +5,7 @@ import threading
 from app.repositories.messages_repo import MessagesRepo
 from app.repositories.sessions_repo import SessionsRepo
 from app.core.db import get_engine
+from app.core.session_cache import get_session_cache
 from app.core.title_agent_client import TitleAgentClient
 
 logger = logging.getLogger(__name__)
@@ -15,7 +16,8 @@ title_agent = TitleAgentClient()
 def _generate(session_id: str):
     engine = get_engine()
     messages_repo = MessagesRepo(engine)
-    sessions_repo = SessionsRepo(engine)
+    # 与路由共用会话缓存：标题更新后缓存随之失效
+    sessions_repo = SessionsRepo(engine, cache=get_session_cache())
 
     session = sessions_repo.get_session(session_id)
     if not session:
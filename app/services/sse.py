@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import zlib
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable
+
+# 事件 JSON 一律按 UTF-8 原样输出（中文不转成 6 字节的 \uXXXX 转义）；装了 orjson 时用 orjson
+from app.core.sse_decoder import json_dumps as dumps
+from app.services.chat_turns import ChatTurn
+
+
+@dataclass(frozen=True)
+class StreamFormat:
+    """对话事件流的线上格式：单个事件的编码方式与空闲心跳"""
+
+    name: str
+    media_type: str
+    encode: Callable[[int, dict[str, Any]], str]
+    heartbeat: str
+
+
+# SSE 注释行：浏览器 EventSource 会忽略，只用于让代理 / 负载均衡器看到连接仍有数据
+HEARTBEAT = ": ping\n\n"
+
+SSE = StreamFormat(
+    name="sse",
+    media_type="text/event-stream; charset=utf-8",
+    encode=lambda event_id, event: f"id: {event_id}\ndata: {dumps(event)}\n\n",
+    heartbeat=HEARTBEAT,
+)
+
+# 每行一个 JSON 对象，事件 id 放在 "id" 字段；心跳是空行（NDJSON 解析器按惯例跳过空行）
+NDJSON = StreamFormat(
+    name="ndjson",
+    media_type="application/x-ndjson; charset=utf-8",
+    encode=lambda event_id, event: dumps({"id": event_id, **event}) + "\n",
+    heartbeat="\n",
+)
+
+
+def format_event(event_id: int, event: dict[str, Any]) -> str:
+    return SSE.encode(event_id, event)
+
+
+def negotiate_format(accept: str | None) -> StreamFormat:
+    """Accept 中明确要求 application/x-ndjson（且不接受 text/event-stream）时用 NDJSON，否则 SSE"""
+    media_types = {part.split(";")[0].strip().lower() for part in (accept or "").split(",")}
+    if "application/x-ndjson" in media_types and "text/event-stream" not in media_types:
+        return NDJSON
+    return SSE
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() == "gzip":
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+async def event_stream(
+    turn: ChatTurn,
+    last_event_id: int = 0,
+    heartbeat_seconds: float = 15.0,
+    max_batch_events: int = 64,
+    fmt: StreamFormat = SSE,
+) -> AsyncIterator[str]:
+    """
+    把一轮对话的事件按 fmt 写成文本流：
+    - 客户端落后时，缓冲中已就绪的事件合并为一次写出（减少 send 次数）
+    - 超过 heartbeat_seconds 没有事件时写一次心跳（<= 0 表示不发心跳）
+    """
+    idle_timeout = heartbeat_seconds if heartbeat_seconds > 0 else None
+    async with aclosing(turn.subscribe_batches(last_event_id, max_batch_events, idle_timeout)) as batches:
+        async for batch in batches:
+            if not batch:
+                yield fmt.heartbeat
+                continue
+            yield "".join(fmt.encode(event_id, event) for event_id, event in batch)
+
+
+async def gzip_stream(chunks: AsyncIterator[str], level: int = 6) -> AsyncIterator[bytes]:
+    """
+    跨块共享压缩字典的 gzip 流：每次写出后 Z_SYNC_FLUSH，客户端收到即可解压出完整事件，
+    后续事件可以引用前文（同一轮回答里大量重复的 JSON 字段名与词语）。
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async with aclosing(chunks) as source:
+        async for chunk in source:
+            yield compressor.compress(chunk.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush(zlib.Z_FINISH)
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable
+
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+from app.core.db import get_engine
+from app.core.session_cache import get_session_cache
+from app.core.time_utils import now_bjt_naive
+from app.repositories.messages_repo import MessagesRepo
+from app.repositories.sessions_repo import SessionsRepo
+from app.services.session_title import async_generate
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    对话消息的写后缓冲（write-behind）：
+    - 对话路径只把消息放进有界内存队列（created_at 取入队时间），不等数据库提交
+    - 后台写线程在最早一条消息等满 interval_seconds、或攒够 max_batch 条时，把这一批消息合并进一个事务提交，
+      随后用一条 UPDATE 刷新这些会话的 updated_at（经 SessionsRepo，会话缓存同步更新并通知其它进程）
+    - 队列满时 put 返回 False，由调用方 write_through 同步写库（先提交队列里已有的消息，保持同一会话内的顺序）
+    - has_pending / flush 给读路径做 read-your-writes；close 在进程退出时把剩余消息全部提交
+
+    写线程在第一次 put 时才启动（FaaS 冷启动不建线程、不建连）。写库使用同步引擎 get_engine()。
+    """
+
+    def __init__(
+        self,
+        engine_factory: Callable[[], Engine] = get_engine,
+        interval_seconds: float = 0.05,
+        max_batch: int = 256,
+        max_queue: int = 10000,
+        on_committed: Callable[[list[str]], None] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.interval_seconds = interval_seconds
+        self.max_batch = max(1, max_batch)
+        self.max_queue = max(1, max_queue)
+        self._engine_factory = engine_factory
+        # 提交成功后回调：本批中需要生成标题的会话（助手回复）
+        self._on_committed = on_committed
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # 同一时刻只有一个批次在写库：读路径的 flush 会等正在写的批次提交，保证写入顺序与 read-your-writes
+        self._flush_lock = threading.RLock()
+        # (入队时间, 消息, 是否生成标题)
+        self._queue: deque[tuple[float, dict[str, Any], bool]] = deque()
+        # 每个会话已入队但尚未提交的消息数（包括正在写的批次）
+        self._uncommitted: Counter[str] = Counter()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+        self.enqueued = 0
+        self.write_through_count = 0
+        self.max_depth = 0
+        self.flushes = 0
+        self.flushed_messages = 0
+        self.flush_errors = 0
+        self.touch_errors = 0
+        self.last_batch_size = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self._total_flush_seconds = 0.0
+
+    # ---------- 写入 ----------
+
+    def put(self, session_id: str, role: str, parts: list[dict[str, Any]], generate_title: bool = False) -> bool:
+        """入队一条消息；队列已满或已关闭时返回 False（调用方改用 write_through）"""
+        message = {"session_id": session_id, "role": role, "parts": parts, "created_at": now_bjt_naive()}
+        with self._wakeup:
+            if self._closed or len(self._queue) >= self.max_queue:
+                return False
+            self._queue.append((self._clock(), message, generate_title))
+            self._uncommitted[session_id] += 1
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._ensure_thread()
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch:
+                self._wakeup.notify()
+        return True
+
+    def write_through(self, session_id: str, role: str, parts: list[dict[str, Any]], generate_title: bool = False) -> None:
+        """同步写入一条消息（队列满时的退路）：先提交队列中已有的消息，再在调用线程中提交这一条"""
+        message = {"session_id": session_id, "role": role, "parts": parts, "created_at": now_bjt_naive()}
+        with self._flush_lock:
+            self.flush()
+            self._write([(self._clock(), message, generate_title)])
+        with self._lock:
+            self.write_through_count += 1
+
+    # ---------- 提交 ----------
+
+    def has_pending(self, session_id: str) -> bool:
+        with self._lock:
+            return self._uncommitted.get(session_id, 0) > 0
+
+    def flush(self) -> int:
+        """
+        在调用线程中提交调用时刻已入队的全部消息（分批，每批一个事务），返回提交条数。
+        写库失败时这一批放回队首、抛出异常，由写线程下次重试。
+        """
+        with self._flush_lock:
+            with self._lock:
+                remaining = len(self._queue)
+            committed = 0
+            while remaining > 0:
+                with self._lock:
+                    size = min(remaining, self.max_batch, len(self._queue))
+                    batch = [self._queue.popleft() for _ in range(size)]
+                if not batch:
+                    break
+                try:
+                    self._write(batch)
+                except BaseException:
+                    with self._lock:
+                        self._queue.extendleft(reversed(batch))
+                        self.flush_errors += 1
+                    raise
+                with self._lock:
+                    for _, message, _ in batch:
+                        self._uncommitted[message["session_id"]] -= 1
+                        if self._uncommitted[message["session_id"]] <= 0:
+                            del self._uncommitted[message["session_id"]]
+                remaining -= len(batch)
+                committed += len(batch)
+            return committed
+
+    def _write(self, batch: list[tuple[float, dict[str, Any], bool]]) -> None:
+        started = self._clock()
+        engine = self._engine_factory()
+        messages = [message for _, message, _ in batch]
+        MessagesRepo(engine).save_messages(messages)
+        try:
+            SessionsRepo(engine, cache=get_session_cache()).touch_sessions(
+                list(dict.fromkeys(m["session_id"] for m in messages))
+            )
+        except Exception:
+            # 消息已经提交：不能抛出让整批重试（会重复写入），updated_at 在该会话下次写入时再刷新
+            logger.exception("write-behind session touch failed")
+            with self._lock:
+                self.touch_errors += 1
+        elapsed = self._clock() - started
+
+        with self._lock:
+            self.flushes += 1
+            self.flushed_messages += len(batch)
+            self.last_batch_size = len(batch)
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self._total_flush_seconds += elapsed
+
+        title_sessions = list(dict.fromkeys(m["session_id"] for _, m, generate_title in batch if generate_title))
+        if title_sessions and self._on_committed is not None:
+            try:
+                self._on_committed(title_sessions)
+            except Exception:
+                logger.exception("write-behind on_committed callback failed")
+
+    # ---------- 写线程 ----------
+
+    def _ensure_thread(self) -> None:
+        # 调用方持有 self._lock
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._wakeup:
+                while not self._closed:
+                    if len(self._queue) >= self.max_batch:
+                        break
+                    if self._queue:
+                        remaining = self._queue[0][0] + self.interval_seconds - self._clock()
+                        if remaining <= 0:
+                            break
+                        self._wakeup.wait(remaining)
+                    else:
+                        self._wakeup.wait()
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("write-behind flush failed, will retry")
+                # 数据库不可用时不要空转重试
+                time.sleep(max(self.interval_seconds, 0.5))
+
+    def close(self, timeout: float = 10.0) -> None:
+        """停止写线程并在调用线程中提交剩余消息（进程退出前调用）"""
+        with self._wakeup:
+            self._closed = True
+            self._wakeup.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("write-behind final flush failed", extra={"pending": self.depth})
+
+    # ---------- 统计 ----------
+
+    @property
+    def depth(self) -> int:
+        with self._lock:
+            return len(self._queue)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "depth": len(self._queue),
+                "max_depth": self.max_depth,
+                "max_queue": self.max_queue,
+                "pending_sessions": len(self._uncommitted),
+                "enqueued": self.enqueued,
+                "write_through": self.write_through_count,
+                "flushes": self.flushes,
+                "flushed_messages": self.flushed_messages,
+                "flush_errors": self.flush_errors,
+                "touch_errors": self.touch_errors,
+                "last_batch_size": self.last_batch_size,
+                "last_flush_seconds": round(self.last_flush_seconds, 6),
+                "max_flush_seconds": round(self.max_flush_seconds, 6),
+                "avg_flush_seconds": round(self._total_flush_seconds / self.flushes, 6) if self.flushes else 0.0,
+            }
+
+
+_writer: WriteBehindQueue | None = None
+_writer_lock = threading.Lock()
+
+
+def _generate_titles(session_ids: list[str]) -> None:
+    for session_id in session_ids:
+        async_generate(session_id)
+
+
+def get_write_behind() -> WriteBehindQueue | None:
+    """CHAT_WRITE_BEHIND 打开时返回进程内共享的写后缓冲，否则 None（消息照常逐条同步写库）"""
+    global _writer
+
+    if _writer is None and settings.chat_write_behind:
+        with _writer_lock:
+            if _writer is None:
+                _writer = WriteBehindQueue(
+                    interval_seconds=settings.chat_write_behind_interval_ms / 1000,
+                    max_batch=settings.chat_write_behind_max_batch,
+                    max_queue=settings.chat_write_behind_max_queue,
+                    on_committed=_generate_titles,
+                )
+    return _writer
+
+
+def shutdown_write_behind() -> None:
+    global _writer
+
+    if _writer is not None:
+        _writer.close()
+        _writer = None
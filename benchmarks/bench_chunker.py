@@ -0,0 +1,148 @@
+"""
+流式分块微基准：用多 MB 的长回答（中英混排、上游随机切分）对比
+旧的 split_text + `full_answer +=` + 每块 dict 拷贝，与 StreamChunker + list join。
+
+只测分块与拼接本身（不含 SSE 序列化与 sleep 节奏）。
+
+用法（在仓库根目录）：
+    python -m benchmarks.bench_chunker
+    python -m benchmarks.bench_chunker --mb 1 4 16 --chunk-size 16
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+from typing import Any, Callable
+
+from app.services.chunker import StreamChunker
+
+_WORDS = [
+    "稀土元素在催化剂中的作用主要体现在储氧能力与热稳定性的提升，",
+    "实验表明当掺杂量为百分之五时性能最佳。",
+    "The doping ratio of CeO2 significantly affects ",
+    "the oxygen vacancy concentration. ",
+    "\n",
+]
+
+
+def build_deltas(total_chars: int, seed: int = 7) -> list[str]:
+    """生成确定性的上游文本增量：整段回答按 1~64 字符随机切分（近似 token 级流式输出）"""
+    rng = random.Random(seed)
+    parts: list[str] = []
+    size = 0
+    while size < total_chars:
+        word = rng.choice(_WORDS)
+        parts.append(word)
+        size += len(word)
+    text = "".join(parts)
+
+    deltas: list[str] = []
+    pos = 0
+    while pos < len(text):
+        step = rng.randint(1, 64)
+        deltas.append(text[pos : pos + step])
+        pos += step
+    return deltas
+
+
+def legacy_split_text(text: str, max_chars: int) -> list[str]:
+    """user-010 之前 app/api/chat.py 中的 split_text（原样保留用于对比）"""
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [text]
+
+    tokens = re.findall(r"\S+\s*", text)
+    if not tokens:
+        return [text[i : i + max_chars] for i in range(0, len(text), max_chars)]
+
+    parts: list[str] = []
+    buf = ""
+    for token in tokens:
+        if not buf:
+            buf = token
+            continue
+        if len(buf) + len(token) <= max_chars:
+            buf += token
+        else:
+            parts.append(buf)
+            buf = token
+
+    if buf:
+        parts.append(buf)
+
+    final_parts: list[str] = []
+    for part in parts:
+        if len(part) <= max_chars:
+            final_parts.append(part)
+            continue
+        final_parts.extend(part[i : i + max_chars] for i in range(0, len(part), max_chars))
+
+    return final_parts
+
+
+def legacy_stream(deltas: list[str], max_chars: int) -> tuple[int, str]:
+    published: list[dict[str, Any]] = []
+    full_answer = ""
+    for content in deltas:
+        chunk = {"type": "text", "content": content}
+        for part in legacy_split_text(content, max_chars):
+            out_chunk = dict(chunk)
+            out_chunk["content"] = part
+            published.append(out_chunk)
+            full_answer += part
+    return len(published), full_answer
+
+
+def chunker_stream(deltas: list[str], max_chars: int) -> tuple[int, str]:
+    published: list[dict[str, Any]] = []
+    answer_parts: list[str] = []
+    chunker = StreamChunker(max_chars)
+    for content in deltas:
+        for part in chunker.feed(content):
+            published.append({"type": "text", "content": part})
+            answer_parts.append(part)
+    for part in chunker.flush():
+        published.append({"type": "text", "content": part})
+        answer_parts.append(part)
+    return len(published), "".join(answer_parts)
+
+
+def _time(fn: Callable[[], tuple[int, str]], repeat: int) -> tuple[float, tuple[int, str]]:
+    best = float("inf")
+    result: tuple[int, str] = (0, "")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, nargs="+", default=[1.0, 4.0])
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--whole", action="store_true", help="额外测试上游一次性返回整段回答的情况")
+    args = parser.parse_args()
+
+    print(f"{'answer':>10} {'upstream':>9} {'impl':>8} {'pieces':>9} {'best (s)':>9} {'MB/s':>7} {'lossless':>9}")
+    for mb in args.mb:
+        total_chars = int(mb * 1024 * 1024 / 2)  # 中英混排约 2 字节 / 字符
+        deltas = build_deltas(total_chars)
+        scenarios = [("deltas", deltas)]
+        if args.whole:
+            scenarios.append(("whole", ["".join(deltas)]))
+        for label, source in scenarios:
+            size_mb = len("".join(source).encode("utf-8")) / 1024 / 1024
+            for name, fn in (("legacy", legacy_stream), ("chunker", chunker_stream)):
+                best, (pieces, answer) = _time(lambda: fn(source, args.chunk_size), args.repeat)
+                # 旧实现用 \S+\s* 分词，超长增量开头的空白会被丢掉
+                lossless = answer == "".join(source)
+                print(
+                    f"{size_mb:>8.1f}MB {label:>9} {name:>8} {pieces:>9} {best:>9.3f} {size_mb / best:>7.1f} {str(lossless):>9}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+消息历史读取微基准：一个会话写入 --messages 条消息（每条 --parts 个 part），对比
+- full：GET /sessions/{id}/messages 原来的读取方式，list_messages 一次取出全部消息与 parts
+- page-first / page-deep：list_messages_page 取最新一页、以及用游标翻到最早一页时的单页耗时
+
+只测仓储层（本地 SQLite 文件库），不含 HTTP 序列化；全量读取的 JSON 体积随消息数线性增长，分页读取不变。
+
+用法（在仓库根目录）：
+    python -m benchmarks.bench_history_page
+    python -m benchmarks.bench_history_page --messages 200 2000 20000 --limit 50
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import create_engine
+
+from app.repositories.messages_repo import MessagesRepo, metadata
+
+
+def timed(fn: Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[200, 2000, 20000])
+    parser.add_argument("--parts", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'messages':>9} {'full ms':>9} {'page-first ms':>14} {'page-deep ms':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.messages:
+            engine = create_engine(f"sqlite:///{Path(tmp) / f'history-{n}.db'}")
+            metadata.create_all(engine)
+            repo = MessagesRepo(engine)
+            parts = [{"type": "text", "content": "稀土掺杂对储氧能力的影响。" * 10} for _ in range(args.parts)]
+            for start in range(0, n, 1000):
+                repo.save_messages(
+                    [{"session_id": "s", "role": "user", "parts": parts} for _ in range(min(1000, n - start))]
+                )
+
+            # 游标翻到最早一页（倒序）
+            _, cursor = repo.list_messages_page("s", max(n - args.limit, 1), newest_first=True)
+
+            full = timed(lambda: repo.list_messages("s"))
+            first = timed(lambda: repo.list_messages_page("s", args.limit, newest_first=True))
+            deep = timed(lambda: repo.list_messages_page("s", args.limit, cursor, newest_first=True))
+            print(f"{n:>9} {full * 1000:>9.2f} {first * 1000:>14.2f} {deep * 1000:>13.2f}")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+消息写入微基准：对比旧的 N+1 写法（每个 part 一条 INSERT）与当前的批量写入（messages 一条 + parts 一次 executemany），
+分别在本地 SQLite 文件库与「PostgreSQL 替身」上统计每条消息的耗时与语句往返次数。
+
+PostgreSQL 替身：仍然是 SQLite，但在每次 cursor execute 前 sleep --rtt-ms，模拟应用与数据库之间的网络往返。
+真实 PostgreSQL 上单条消息走 WITH ... INSERT ... jsonb_to_recordset 的单语句 CTE（1 次往返），
+SQLite 无法执行该语句，表中按 1 次往返 × rtt 给出估算值。
+
+用法（在仓库根目录）：
+    python -m benchmarks.bench_message_insert
+    python -m benchmarks.bench_message_insert --parts 1 10 100 --messages 50 --rtt-ms 0.5
+"""
+from __future__ import annotations
+
+import argparse
+import functools
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.engine import Engine
+
+from app.core.time_utils import now_bjt_naive
+from app.repositories.messages_repo import MessagesRepo, message_parts_table, messages_table, metadata
+
+
+def build_parts(n: int) -> list[dict[str, Any]]:
+    return [
+        {"type": "text", "content": f"第 {i} 段：稀土掺杂对储氧能力的影响。" * 4, "metadata": {"idx": i}}
+        for i in range(n)
+    ]
+
+
+def legacy_save(engine: Engine, session_id: str, role: str, parts: list[dict[str, Any]]) -> None:
+    with engine.begin() as conn:
+        message_id = conn.execute(
+            insert(messages_table)
+            .values(session_id=session_id, role=role, created_at=now_bjt_naive())
+            .returning(messages_table.c.id)
+        ).scalar_one()
+        for idx, part in enumerate(parts):
+            conn.execute(
+                insert(message_parts_table).values(
+                    message_id=message_id,
+                    type=part["type"],
+                    content=part.get("content"),
+                    url=part.get("url"),
+                    metadata=part.get("metadata"),
+                    sort_order=idx,
+                )
+            )
+
+
+def make_engine(path: Path, rtt: float, counter: list[int]) -> Engine:
+    engine = create_engine(f"sqlite:///{path}")
+    metadata.create_all(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _round_trip(*_args: Any) -> None:
+        counter[0] += 1
+        if rtt:
+            time.sleep(rtt)
+
+    return engine
+
+
+def run(save: Callable[[str, str, list[dict[str, Any]]], None], parts: list[dict[str, Any]], messages: int) -> float:
+    start = time.perf_counter()
+    for i in range(messages):
+        save(f"s{i % 4}", "assistant", parts)
+    return (time.perf_counter() - start) / messages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parts", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--messages", type=int, default=50, help="每组写入的消息条数")
+    parser.add_argument("--rtt-ms", type=float, default=0.5, help="PostgreSQL 替身每次往返的模拟延迟")
+    args = parser.parse_args()
+
+    print(f"{'backend':>10} {'parts':>6} {'impl':>8} {'stmts/msg':>10} {'ms/msg':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend, rtt in (("sqlite", 0.0), ("pg-stand", args.rtt_ms / 1000)):
+            for n in args.parts:
+                parts = build_parts(n)
+                baseline = 0.0
+                for impl in ("legacy", "bulk"):
+                    counter = [0]
+                    engine = make_engine(Path(tmp) / f"{backend}-{n}-{impl}.db", rtt, counter)
+                    if impl == "legacy":
+                        save = functools.partial(legacy_save, engine)
+                    else:
+                        save = MessagesRepo(engine).save_message
+                    per_msg = run(save, parts, args.messages)
+                    engine.dispose()
+                    baseline = baseline or per_msg
+                    print(
+                        f"{backend:>10} {n:>6} {impl:>8} {counter[0] / args.messages:>10.1f} "
+                        f"{per_msg * 1000:>9.3f} {baseline / per_msg:>7.1f}x"
+                    )
+                if rtt:
+                    print(f"{backend:>10} {n:>6} {'pg-cte':>8} {1.0:>10.1f} {rtt * 1000:>9.3f} {'(est.)':>8}")
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+对话事件流线上字节数对比：同一份中英混排回答（StreamChunker 分块后的 text 事件，夹杂少量 thought 事件），
+分别按以下格式编码，统计写到 socket 的总字节数：
+
+- sse-ascii：旧格式，json.dumps 默认 ensure_ascii=True，每个汉字 6 字节 \\uXXXX
+- sse-utf8：当前默认 SSE（UTF-8 原样输出）
+- ndjson：Accept: application/x-ndjson
+- *+gzip：CHAT_STREAM_GZIP 打开后，整条流共享一个压缩字典，每次写出 Z_SYNC_FLUSH
+- sse-utf8+gzip-each：对照组，每次写出单独压缩（不共享字典），说明跨块压缩的收益
+
+每种格式分别按「实时」（每个事件一次写出）和「积压」（客户端落后，每次合并 --batch 个事件）两种写出方式统计。
+注意：合成回答由少量句子重复拼成，gzip 的压缩比会比真实回答偏乐观；未压缩格式之间的对比不受影响。
+
+用法（在仓库根目录）：
+    python -m benchmarks.bench_wire_formats
+    python -m benchmarks.bench_wire_formats --kb 4 64 --chunk-size 16 --batch 8
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import zlib
+from typing import Any, Callable
+
+from app.services.chunker import StreamChunker
+from app.services.sse import NDJSON, SSE
+from benchmarks.bench_chunker import build_deltas
+
+
+def build_events(total_chars: int, chunk_size: int) -> list[dict[str, Any]]:
+    events: list[dict[str, Any]] = [{"type": "thought", "content": '{"state": "working"}'}]
+    chunker = StreamChunker(chunk_size)
+    for i, delta in enumerate(build_deltas(total_chars)):
+        events.extend({"type": "text", "content": part} for part in chunker.feed(delta))
+        if i % 200 == 199:
+            events.append({"type": "thought", "content": '{"state": "working", "tool": "search"}'})
+    events.extend({"type": "text", "content": part} for part in chunker.flush())
+    return events
+
+
+def legacy_sse(event_id: int, event: dict[str, Any]) -> str:
+    return f"id: {event_id}\ndata: {json.dumps(event)}\n\n"
+
+
+def writes(events: list[dict[str, Any]], encode: Callable[[int, dict[str, Any]], str], batch: int) -> list[bytes]:
+    out: list[bytes] = []
+    for start in range(0, len(events), batch):
+        group = events[start : start + batch]
+        out.append("".join(encode(start + i + 1, e) for i, e in enumerate(group)).encode("utf-8"))
+    return out
+
+
+def gzip_shared(chunks: list[bytes]) -> int:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    total = sum(len(compressor.compress(c) + compressor.flush(zlib.Z_SYNC_FLUSH)) for c in chunks)
+    return total + len(compressor.flush(zlib.Z_FINISH))
+
+
+def gzip_each(chunks: list[bytes]) -> int:
+    return sum(len(gzip.compress(c, 6)) for c in chunks)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kb", type=float, nargs="+", default=[4.0, 64.0], help="回答长度（UTF-8 KB）")
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--batch", type=int, default=8, help="积压时每次写出合并的事件数")
+    args = parser.parse_args()
+
+    formats: list[tuple[str, Callable[[int, dict[str, Any]], str], Callable[[list[bytes]], int] | None]] = [
+        ("sse-ascii", legacy_sse, None),
+        ("sse-utf8", SSE.encode, None),
+        ("ndjson", NDJSON.encode, None),
+        ("sse-utf8+gzip", SSE.encode, gzip_shared),
+        ("ndjson+gzip", NDJSON.encode, gzip_shared),
+        ("sse-utf8+gzip-each", SSE.encode, gzip_each),
+    ]
+
+    print(f"{'answer':>8} {'events':>7} {'writes':>7} {'format':>19} {'bytes':>10} {'vs ascii':>9}")
+    for kb in args.kb:
+        events = build_events(int(kb * 1024 / 2), args.chunk_size)  # 中英混排约 2 字节 / 字符
+        for label, batch in (("live", 1), ("batched", args.batch)):
+            baseline = 0
+            for name, encode, compress in formats:
+                chunks = writes(events, encode, batch)
+                size = compress(chunks) if compress else sum(len(c) for c in chunks)
+                baseline = baseline or size
+                print(
+                    f"{kb:>6.0f}KB {len(events):>7} {label + ':' + str(len(chunks)):>7} {name:>19} "
+                    f"{size:>10} {size / baseline:>8.0%}"
+                )
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+消息持久化微基准：模拟 --turns 轮对话由 --workers 个线程并发写入，对比
+- direct：当前默认路径，每轮 user save_message + touch_session + assistant save_message + touch_session（4 个事务）
+- write-behind：CHAT_WRITE_BEHIND 打开后的路径，只入队，写线程按间隔 / 批量合并提交，最后 close() 提交剩余消息
+
+统计总耗时（含 write-behind 最后一次提交）与事务提交次数。数据库为本地 SQLite 文件库（每次提交都会 fsync），
+提交开销比网络上的 PostgreSQL 小，实际收益以 commit 次数之比为准。
+
+用法（在仓库根目录）：
+    python -m benchmarks.bench_write_behind
+    python -m benchmarks.bench_write_behind --turns 2000 --workers 16 --interval-ms 20
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+from app.repositories.messages_repo import MessagesRepo
+from app.repositories.messages_repo import metadata as messages_metadata
+from app.repositories.sessions_repo import SessionsRepo
+from app.repositories.sessions_repo import metadata as sessions_metadata
+from app.services.write_behind import WriteBehindQueue
+
+
+def make_engine(path: Path, commits: list[int]) -> tuple[Engine, list[str]]:
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    messages_metadata.create_all(engine)
+    sessions_metadata.create_all(engine)
+    session_ids = [SessionsRepo(engine).create_session(f"u{i}")["session_id"] for i in range(32)]
+    event.listen(engine, "commit", lambda conn: commits.__setitem__(0, commits[0] + 1))
+    return engine, session_ids
+
+
+def turn_parts(i: int) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    question = [{"type": "text", "content": f"问题 {i}：稀土掺杂如何影响储氧能力？"}]
+    answer = [{"type": "text", "content": "掺杂量为百分之五时性能最佳。" * 20, "metadata": None}]
+    return question, answer
+
+
+def run(turns: int, workers: int, persist: Callable[[int], None]) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(persist, range(turns)))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--interval-ms", type=int, default=50)
+    parser.add_argument("--max-batch", type=int, default=256)
+    args = parser.parse_args()
+
+    print(f"{'impl':>13} {'turns':>6} {'seconds':>8} {'turns/s':>9} {'commits':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        commits = [0]
+        engine, session_ids = make_engine(Path(tmp) / "direct.db", commits)
+        messages, sessions = MessagesRepo(engine), SessionsRepo(engine)
+
+        def direct(i: int) -> None:
+            session_id = session_ids[i % len(session_ids)]
+            question, answer = turn_parts(i)
+            messages.save_message(session_id, "user", question)
+            sessions.touch_session(session_id)
+            messages.save_message(session_id, "assistant", answer)
+            sessions.touch_session(session_id)
+
+        commits[0] = 0
+        elapsed = run(args.turns, args.workers, direct)
+        print(f"{'direct':>13} {args.turns:>6} {elapsed:>8.3f} {args.turns / elapsed:>9.0f} {commits[0]:>8}")
+        engine.dispose()
+
+        commits = [0]
+        engine, session_ids = make_engine(Path(tmp) / "write_behind.db", commits)
+        writer = WriteBehindQueue(lambda: engine, interval_seconds=args.interval_ms / 1000, max_batch=args.max_batch)
+
+        def buffered(i: int) -> None:
+            session_id = session_ids[i % len(session_ids)]
+            question, answer = turn_parts(i)
+            writer.put(session_id, "user", question) or writer.write_through(session_id, "user", question)
+            writer.put(session_id, "assistant", answer) or writer.write_through(session_id, "assistant", answer)
+
+        commits[0] = 0
+        start = time.perf_counter()
+        run(args.turns, args.workers, buffered)
+        writer.close()
+        elapsed = time.perf_counter() - start
+        stats = writer.snapshot()
+        print(f"{'write-behind':>13} {args.turns:>6} {elapsed:>8.3f} {args.turns / elapsed:>9.0f} {commits[0]:>8}")
+        print(
+            f"{'':>13} avg batch {stats['flushed_messages'] / max(stats['flushes'], 1):.1f} messages, "
+            f"avg flush {stats['avg_flush_seconds'] * 1000:.2f} ms, max depth {stats['max_depth']}"
+        )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, JSON
@@ -67,9 +68,15 @@ def client_fixture(session):
     db._engine = engine
     
     # Patch the global 'agent' instance in api/chat.py
+    # 测试库是单个 in-memory SQLite 连接（StaticPool）：仓储调用用单线程执行，标题生成同步完成，
+    # 避免多个 db 线程 / 后台标题线程同时使用这一个连接（以及与下一个用例的建表、删表交错）
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
     with pytest.MonkeyPatch.context() as mp:
         mp.setattr("app.api.chat.agent", mock_agent)
+        mp.setattr(db, "_executor", executor)
+        mp.setenv("TITLE_GENERATION_SYNC", "1")
         yield TestClient(app)
+    executor.shutdown(wait=True)
     
     # Restore original engine
     db._engine = original_engine
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from app.core.admission import AdmissionController, AdmissionRejected
+
+
+def test_global_limit_queues_then_rejects_when_queue_full():
+    controller = AdmissionController(max_concurrent=1, max_per_user=0, queue_size=1, wait_timeout=1.0)
+
+    async def scenario():
+        first = await controller.acquire("u1")
+        waiter = asyncio.create_task(controller.acquire("u2"))
+        await asyncio.sleep(0)
+        assert controller.snapshot()["queue_depth"] == 1
+
+        with pytest.raises(AdmissionRejected) as exc:
+            await controller.acquire("u3")
+        assert exc.value.reason == "global queue full"
+        assert exc.value.retry_after == 1
+
+        first.release()
+        second = await waiter
+        second.release()
+        second.release()  # 幂等
+
+    asyncio.run(scenario())
+
+    stats = controller.snapshot()
+    assert stats["active"] == 0
+    assert stats["admitted"] == 2
+    assert stats["queued"] == 1
+    assert stats["rejected"] == {"global queue full": 1}
+    assert stats["active_users"] == 0
+
+
+def test_per_user_limit_does_not_block_other_users():
+    controller = AdmissionController(max_concurrent=10, max_per_user=1, queue_size=4, wait_timeout=0.05)
+
+    async def scenario():
+        lease = await controller.acquire("busy_user")
+        other = await controller.acquire("other_user")
+        with pytest.raises(AdmissionRejected) as exc:
+            await controller.acquire("busy_user")
+        lease.release()
+        other.release()
+        return exc.value
+
+    rejected = asyncio.run(scenario())
+
+    assert rejected.reason == "user wait timeout"
+    stats = controller.snapshot()
+    assert stats["active"] == 0
+    assert stats["rejected"] == {"user wait timeout": 1}
+
+
+def test_chat_returns_429_with_retry_after(client):
+    import app.api.chat as chat_api
+
+    create_resp = client.post("/paperapi/sessions", json={"user_id": "user_busy"})
+    session_id = create_resp.json()["session_id"]
+
+    controller = AdmissionController(max_concurrent=1, max_per_user=1, queue_size=0, wait_timeout=2.0)
+    held = asyncio.run(controller.acquire("someone_else"))
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api, "admission", controller)
+        resp = client.post("/paperapi/chat", json={"session_id": session_id, "text": "Hi"})
+        stats = client.get("/admin/admission").json()
+
+    held.release()
+
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "2"
+    assert stats["rejected"] == {"global queue full": 1}
+
+    # 被拒绝的请求不落库
+    hist = client.get(f"/paperapi/sessions/{session_id}/messages").json()
+    assert hist["messages"] == []
+
+
+def test_chat_releases_admission_after_stream(client):
+    import app.api.chat as chat_api
+
+    create_resp = client.post("/paperapi/sessions", json={"user_id": "user_release"})
+    session_id = create_resp.json()["session_id"]
+
+    controller = AdmissionController(max_concurrent=1, max_per_user=1, queue_size=0, wait_timeout=1.0)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api, "admission", controller)
+        for text in ("Hi", "Hi again"):
+            with client.stream("POST", "/paperapi/chat", json={"session_id": session_id, "text": text}) as response:
+                assert response.status_code == 200
+                list(response.iter_lines())
+
+    assert controller.snapshot()["active"] == 0
+    assert controller.snapshot()["admitted"] == 2
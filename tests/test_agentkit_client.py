@@ -0,0 +1,269 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.core.agentkit_client import AgentKitClient
+from app.core.resilience import CircuitBreaker, RetryPolicy
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """本地 AgentKit 替身：HTTP/1.1 keep-alive；message/stream 返回固定 SSE 流，message/send 返回 JSON"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.peers.append(self.client_address)
+
+        if request.get("method") == "message/send":
+            result = {
+                "kind": "task",
+                "artifacts": [{"parts": [{"kind": "text", "text": " Blocking answer "}]}],
+            }
+            body = json.dumps({"jsonrpc": "2.0", "id": request.get("id"), "result": result}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        events = [
+            {"result": {"kind": "message", "parts": [{"kind": "text", "text": "Hello "}]}},
+            {"result": {"kind": "message", "parts": [{"kind": "text", "text": "World"}]}},
+        ]
+        body = "".join(f"data: {json.dumps(e)}\n\n" for e in events).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(name="stand_in")
+def stand_in_fixture():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+    server.peers = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _base_url(server) -> str:
+    host, port = server.server_address
+    return f"http://{host}:{port}"
+
+
+def test_astream_chat_reuses_connection_across_turns(stand_in):
+    agent = AgentKitClient(base_url=_base_url(stand_in), api_key="test-key")
+
+    async def run_turns():
+        await agent.startup()
+        try:
+            answers = []
+            for i in range(3):
+                chunks = [
+                    c async for c in agent.astream_chat(session_id=f"s{i}", text="hi")
+                ]
+                answers.append("".join(c["content"] for c in chunks if c["type"] == "text"))
+            return answers
+        finally:
+            await agent.aclose()
+
+    answers = asyncio.run(run_turns())
+
+    assert answers == ["Hello World"] * 3
+    assert len(stand_in.peers) == 3
+    # 三轮对话来自同一个客户端端口，即复用了同一条 TCP 连接
+    assert len(set(stand_in.peers)) == 1
+
+
+def test_asend_shares_pool_with_stream(stand_in):
+    agent = AgentKitClient(base_url=_base_url(stand_in), api_key="test-key")
+
+    async def run_turns():
+        await agent.startup()
+        try:
+            first = await agent.asend(session_id="s1", text="hi")
+            chunks = [c async for c in agent.astream_chat(session_id="s1", text="hi")]
+            second = await agent.asend(session_id="s1", text="hi again")
+            return first, chunks, second
+        finally:
+            await agent.aclose()
+
+    first, chunks, second = asyncio.run(run_turns())
+
+    # 与 send 相同的 _extract_text 语义（去除首尾空白）
+    assert first == second == "Blocking answer"
+    assert [c["content"] for c in chunks] == ["Hello ", "World"]
+    assert len(set(stand_in.peers)) == 1
+
+
+def test_send_reuses_requests_session(stand_in):
+    agent = AgentKitClient(base_url=_base_url(stand_in), api_key="test-key")
+    try:
+        assert agent.send(session_id="s1", text="a") == "Blocking answer"
+        assert agent.send(session_id="s1", text="b") == "Blocking answer"
+    finally:
+        agent.close()
+
+    assert len(stand_in.peers) == 2
+    assert len(set(stand_in.peers)) == 1
+
+
+def test_send_reports_missing_config_without_request():
+    agent = AgentKitClient(base_url="", api_key="k")
+    agent.base_url = ""
+
+    assert "AGENTKIT_BASE_URL" in agent.send(session_id="s", text="t")
+    assert "AGENTKIT_BASE_URL" in asyncio.run(agent.asend(session_id="s", text="t"))
+
+
+def test_pool_limits_are_configurable(monkeypatch):
+    monkeypatch.setenv("AGENTKIT_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("AGENTKIT_MAX_KEEPALIVE_CONNECTIONS", "3")
+
+    agent = AgentKitClient(base_url="http://agent", api_key="k", keepalive_expiry=12.5)
+
+    assert agent.limits.max_connections == 7
+    assert agent.limits.max_keepalive_connections == 3
+    assert agent.limits.keepalive_expiry == 12.5
+
+
+def test_aclose_releases_shared_client():
+    agent = AgentKitClient(base_url="http://agent", api_key="k")
+
+    async def open_and_close():
+        await agent.startup()
+        client = agent._client
+        await agent.aclose()
+        return client
+
+    client = asyncio.run(open_and_close())
+
+    assert client.is_closed
+    assert agent._client is None
+
+
+def _unused_port() -> int:
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_circuit_breaker_state_transitions():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10.0, clock=lambda: now[0])
+
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    assert breaker.retry_after() == 10.0
+
+    now[0] = 10.0
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    # half_open 只放行一个探测请求
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] = 20.0
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()["times_opened"] == 2
+
+
+def test_astream_chat_retries_connect_failures_then_fails_fast():
+    agent = AgentKitClient(
+        base_url=f"http://127.0.0.1:{_unused_port()}",
+        api_key="k",
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60.0),
+        retry_policy=RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001),
+    )
+    attempts = []
+    original_backoff = agent.retry_policy.backoff
+
+    async def run_turns():
+        try:
+            first = [c async for c in agent.astream_chat(session_id="s", text="hi")]
+            second = [c async for c in agent.astream_chat(session_id="s", text="hi")]
+            return first, second
+        finally:
+            await agent.aclose()
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(
+            RetryPolicy,
+            "backoff",
+            lambda self, attempt: attempts.append(attempt) or original_backoff(attempt),
+        )
+        first, second = asyncio.run(run_turns())
+
+    assert attempts == [1, 2]
+    assert first[0]["type"] == "error" and "请求失败" in first[0]["content"]
+    assert agent.breaker.state == CircuitBreaker.OPEN
+    assert second == [{"type": "error", "content": second[0]["content"]}]
+    assert "熔断" in second[0]["content"]
+
+
+def test_astream_chat_does_not_retry_mid_stream(stand_in):
+    class _TruncatingHandler(_StandInHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(length)
+            self.server.peers.append(self.client_address)
+            body = 'data: {"result": {"kind": "message", "parts": [{"kind": "text", "text": "Part"}]}}\n\n'
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", str(len(body) + 100))
+            self.end_headers()
+            self.wfile.write(body.encode("utf-8"))
+            self.close_connection = True
+
+    stand_in.RequestHandlerClass = _TruncatingHandler
+    agent = AgentKitClient(
+        base_url=_base_url(stand_in),
+        api_key="k",
+        retry_policy=RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001),
+    )
+
+    async def run_turn():
+        try:
+            return [c async for c in agent.astream_chat(session_id="s", text="hi")]
+        finally:
+            await agent.aclose()
+
+    chunks = asyncio.run(run_turn())
+
+    assert chunks[0] == {"type": "text", "content": "Part"}
+    assert chunks[-1]["type"] == "error"
+    assert len(stand_in.peers) == 1
+    assert agent.breaker.snapshot()["consecutive_failures"] == 1
+
+
+def test_health_agent_reports_breaker_state(client):
+    from app.api import chat as chat_api
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api, "agent", AgentKitClient(base_url="http://agent", api_key="k"))
+        resp = client.get("/health/agent")
+
+    assert resp.status_code == 200
+    assert resp.json()["state"] == "closed"
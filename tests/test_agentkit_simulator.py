@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import uvicorn
+
+from app.core.agentkit_client import AgentKitClient
+from tools.agentkit_simulator import SimulatorConfig, create_app
+
+
+@pytest.fixture(name="simulator")
+def simulator_fixture():
+    servers = []
+
+    def start(**overrides) -> str:
+        config = SimulatorConfig(**{"first_token_ms": 0.0, "token_rate": 0.0, "seed": 7, **overrides})
+        server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=0, log_level="critical"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        servers.append((server, thread))
+        port = server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    yield start
+    for server, thread in servers:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def _collect(agent: AgentKitClient):
+    async def run():
+        try:
+            return [c async for c in agent.astream_chat(session_id="s1", text="稀土是什么")]
+        finally:
+            await agent.aclose()
+
+    return asyncio.run(run())
+
+
+def test_simulator_speaks_stream_and_send_protocols(simulator):
+    base_url = simulator(answer_tokens=40, thoughts=2)
+    chunks = _collect(AgentKitClient(base_url=base_url, api_key="sim"))
+
+    types = [c["type"] for c in chunks]
+    assert "error" not in types
+    # working status-update + 2 个 thought 在前，completed status-update 在最后
+    assert types[:3] == ["thought", "thought", "thought"]
+    assert '"completed"' in chunks[-1]["content"]
+    streamed = "".join(c["content"] for c in chunks if c["type"] == "text")
+
+    # 固定 seed 时 message/send 返回同样的回答
+    blocking = AgentKitClient(base_url=base_url, api_key="sim").send(session_id="s1", text="稀土是什么")
+    assert streamed and blocking == streamed.strip()
+
+
+def test_simulator_paces_tokens_after_first_token_latency(simulator):
+    base_url = simulator(answer_tokens=20, tokens_per_event=1, token_rate=200.0, first_token_ms=100.0, thoughts=0)
+
+    started = time.monotonic()
+    chunks = _collect(AgentKitClient(base_url=base_url, api_key="sim"))
+    elapsed = time.monotonic() - started
+
+    assert len([c for c in chunks if c["type"] == "text"]) == 20
+    assert elapsed >= 0.1 + 19 / 200.0
+
+
+@pytest.mark.parametrize(
+    "overrides, expected",
+    [
+        ({"error_rate": 1.0}, "Agent 服务响应错误: 503"),
+        ({"rpc_error_rate": 1.0}, "simulated agent error"),
+        ({"disconnect_rate": 1.0}, "Agent 服务请求失败"),
+    ],
+)
+def test_simulator_injects_failures(simulator, overrides, expected):
+    base_url = simulator(answer_tokens=40, **overrides)
+    agent = AgentKitClient(base_url=base_url, api_key="sim")
+    chunks = _collect(agent)
+
+    assert chunks[-1]["type"] == "error"
+    assert expected in chunks[-1]["content"]
+    if "error_rate" not in overrides:
+        # 中途失败前已经输出了一部分回答
+        assert any(c["type"] == "text" for c in chunks)
+
+
+def test_simulator_rejects_mistyped_overrides():
+    from fastapi.testclient import TestClient
+
+    client = TestClient(create_app(SimulatorConfig(first_token_ms=0.0, token_rate=0.0, seed=7)))
+
+    def post(overrides):
+        body = {
+            "jsonrpc": "2.0",
+            "id": "1",
+            "method": "message/stream",
+            "params": {"metadata": {"simulator": overrides}},
+        }
+        return client.post("/", json=body, headers={"Authorization": "Bearer sim"})
+
+    resp = post({"token_rate": "fast"})
+    assert resp.status_code == 400
+    assert "token_rate" in resp.json()["detail"]
+    assert post({"text_kind": "tool"}).status_code == 400
+
+    resp = post({"answer_tokens": 4, "thoughts": 0, "status_updates": False})
+    assert resp.status_code == 200
+    assert '"status-update"' not in resp.text
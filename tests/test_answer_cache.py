@@ -0,0 +1,137 @@
+import pytest
+
+from app.services.answer_cache import AnswerCache, answer_cache_key, normalize_question
+
+
+def test_normalize_question():
+    assert normalize_question("  什么是  稀土？ ") == normalize_question("什么是 稀土")
+    assert normalize_question("ＣｅＯ2 Doping!") == "ceo2 doping"
+
+
+def test_lru_ttl_and_memory_budget():
+    now = [0.0]
+    cache = AnswerCache(max_entries=2, ttl_seconds=10.0, max_bytes=10_000, clock=lambda: now[0])
+    events = [{"type": "text", "content": "answer"}]
+
+    cache.put("a", events)
+    cache.put("b", events)
+    assert cache.get("a") == events  # a 变为最近使用
+    cache.put("c", events)
+    assert cache.get("b") is None  # LRU 淘汰 b
+    assert cache.get("a") == events
+
+    now[0] = 10.0
+    assert cache.get("a") is None  # TTL 过期
+
+    small = AnswerCache(max_entries=10, ttl_seconds=10.0, max_bytes=200)
+    small.put("x", [{"type": "text", "content": "x" * 100}])
+    small.put("y", [{"type": "text", "content": "y" * 100}])
+    assert small.get("x") is None  # 超出内存预算，淘汰最旧的
+    assert small.get("y") is not None
+
+    stats = cache.snapshot()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["evictions"] == 1
+
+
+def _text_of(response):
+    import json
+
+    parts = []
+    for line in response.text.splitlines():
+        if line.startswith("data: "):
+            payload = json.loads(line[len("data: "):])
+            if payload.get("type") == "text":
+                parts.append(payload["content"])
+    return "".join(parts)
+
+
+def test_public_paper_answers_are_cached_and_replayed(client):
+    import app.api.chat as chat_api
+
+    calls = []
+
+    async def mock_astream_chat(*args, **kwargs):
+        calls.append(kwargs)
+        yield {"type": "thought", "content": "检索公开论文"}
+        yield {"type": "text", "content": "稀土是一组金属元素。"}
+
+    sessions = [
+        client.post("/paperapi/sessions", json={"user_id": "user_cache"}).json()["session_id"]
+        for _ in range(4)
+    ]
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api, "answer_cache", AnswerCache())
+        mp.setattr(chat_api.agent, "astream_chat", mock_astream_chat)
+
+        miss = client.post("/paperapi/chat", json={"session_id": sessions[0], "text": "什么是稀土？", "use_public_paper": True})
+        hit = client.post("/paperapi/chat", json={"session_id": sessions[1], "text": "什么是稀土", "use_public_paper": True})
+        bypass = client.post(
+            "/paperapi/chat",
+            json={"session_id": sessions[2], "text": "什么是稀土", "use_public_paper": True},
+            headers={"X-Answer-Cache": "bypass"},
+        )
+        private = client.post("/paperapi/chat", json={"session_id": sessions[3], "text": "什么是稀土"})
+        stats = client.get("/admin/answer-cache").json()
+
+    assert miss.headers["X-Answer-Cache"] == "miss"
+    assert hit.headers["X-Answer-Cache"] == "hit"
+    assert bypass.headers["X-Answer-Cache"] == "bypass"
+    assert "X-Answer-Cache" not in private.headers
+    assert _text_of(hit) == _text_of(miss) == "稀土是一组金属元素。"
+    # miss、bypass、私有库各调用一次上游，命中不调用
+    assert len(calls) == 3
+    assert stats["enabled"] is True
+    assert (stats["hits"], stats["misses"], stats["bypassed"]) == (1, 1, 1)
+
+    # 命中时仍然保存助手消息
+    messages = client.get(f"/paperapi/sessions/{sessions[1]}/messages").json()["messages"]
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+    assert messages[1]["parts"][0]["content"] == "稀土是一组金属元素。"
+
+
+def test_non_streaming_response_reports_answer_cache_header(client):
+    import app.api.chat as chat_api
+
+    async def mock_astream_chat(*args, **kwargs):
+        yield {"type": "text", "content": "稀土是一组金属元素。"}
+
+    sessions = [
+        client.post("/paperapi/sessions", json={"user_id": "user_cache_json"}).json()["session_id"]
+        for _ in range(2)
+    ]
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api, "answer_cache", AnswerCache())
+        mp.setattr(chat_api.agent, "astream_chat", mock_astream_chat)
+        results = [
+            client.post(
+                "/paperapi/chat",
+                params={"stream": "false"},
+                json={"session_id": session_id, "text": "什么是稀土？", "use_public_paper": True},
+            )
+            for session_id in sessions
+        ]
+
+    assert [r.headers["X-Answer-Cache"] for r in results] == ["miss", "hit"]
+    assert all(r.headers["X-Chat-Turn-Id"] for r in results)
+    assert [r.json()["answer"] for r in results] == ["稀土是一组金属元素。"] * 2
+
+
+def test_error_answers_are_not_cached(client):
+    import app.api.chat as chat_api
+
+    async def mock_astream_chat(*args, **kwargs):
+        yield {"type": "text", "content": "partial"}
+        yield {"type": "error", "content": "upstream failed"}
+
+    session_id = client.post("/paperapi/sessions", json={"user_id": "user_cache_err"}).json()["session_id"]
+    cache = AnswerCache()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api, "answer_cache", cache)
+        mp.setattr(chat_api.agent, "astream_chat", mock_astream_chat)
+        client.post("/paperapi/chat", json={"session_id": session_id, "text": "q", "use_public_paper": True})
+
+    assert cache.get(answer_cache_key("q", True)) is None
@@ -6,6 +6,7 @@ import json
 from app.core import db
 from app.repositories.messages_repo import MessagesRepo
 from app.repositories.sessions_repo import SessionsRepo
+from app.services.pacing import PacingConfig
 from app.services.session_title import _generate
 
 
@@ -192,9 +193,7 @@ def test_chat_stream_splits_long_text(client, monkeypatch):
     import app.api.chat as chat_api
     chat_api.agent.astream_chat = mock_astream_chat
 
-    monkeypatch.setenv("CHAT_STREAM_CHUNK_SIZE", "8")
-    monkeypatch.setenv("CHAT_STREAM_CHUNK_DELAY_MS", "0")
-    monkeypatch.setenv("CHAT_STREAM_PUNCT_DELAY_MS", "0")
+    monkeypatch.setattr(chat_api, "stream_pacing", PacingConfig(chunk_size=8, chunk_delay_ms=0, punct_delay_ms=0))
 
     with client.stream("POST", "/paperapi/chat", json={"session_id": session_id, "text": "x"}) as response:
         assert response.status_code == 200
@@ -230,6 +229,32 @@ def test_messages_returns_session_title(client):
     assert "messages" in hist_data
 
 
+def test_messages_keyset_pagination(client):
+    session_id = client.post("/paperapi/sessions", json={"user_id": "user_pages"}).json()["session_id"]
+    MessagesRepo(db.get_engine()).save_messages(
+        [{"session_id": session_id, "role": "user", "parts": [{"type": "text", "content": f"q{i}"}]} for i in range(5)]
+    )
+    url = f"/paperapi/sessions/{session_id}/messages"
+
+    # 不传分页参数时保持原行为：全部消息，next_cursor 为 null
+    full = client.get(url).json()
+    assert len(full["messages"]) == 5 and full["next_cursor"] is None
+
+    contents, cursor = [], None
+    while True:
+        params = {"limit": 2, "order": "desc", **({"cursor": cursor} if cursor else {})}
+        page = client.get(url, params=params).json()
+        contents.append([m["parts"][0]["content"] for m in page["messages"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert contents == [["q4", "q3"], ["q2", "q1"], ["q0"]]
+
+    assert client.get(url, params={"cursor": "bogus"}).status_code == 400
+    assert client.get(url, params={"limit": 0}).status_code == 422
+    assert client.get(url, params={"limit": 10_000}).status_code == 422
+
+
 def test_update_title_after_chat(client):
     create_resp = client.post("/paperapi/sessions", json={"user_id": "user_title"})
     session_id = create_resp.json()["session_id"]
@@ -259,3 +284,51 @@ def test_update_title_after_chat(client):
     sessions = resp.json()["sessions"]
     assert sessions[0]["title"] == "稀土改性分析"
     mock_title_agent.generate.assert_called()
+
+
+def test_chat_non_streaming_returns_chat_response(client, monkeypatch):
+    import time
+    import app.api.chat as chat_api
+
+    create_resp = client.post("/paperapi/sessions", json={"user_id": "user_json"})
+    session_id = create_resp.json()["session_id"]
+    # 流式节奏设得很慢：stream=false 不应受影响
+    monkeypatch.setattr(chat_api, "stream_pacing", PacingConfig(chunk_size=2, chunk_delay_ms=200))
+
+    started = time.perf_counter()
+    resp = client.post("/paperapi/chat", params={"stream": "false"}, json={"session_id": session_id, "text": "Hello"})
+    elapsed = time.perf_counter() - started
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/json"
+    assert resp.headers["X-Chat-Turn-Id"] and resp.headers["X-Chat-Coalesced"] == "false"
+    assert resp.json() == {
+        "answer": "Mocked Agent Response",
+        "parts": [{"type": "text", "content": "Mocked Agent Response", "metadata": None}],
+    }
+    assert elapsed < 1.0
+
+    messages = client.get(f"/paperapi/sessions/{session_id}/messages").json()["messages"]
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+    assert messages[1]["parts"][0]["content"] == "Mocked Agent Response"
+
+
+def test_chat_non_streaming_reports_upstream_error(client):
+    create_resp = client.post("/paperapi/sessions", json={"user_id": "user_json_err"})
+    session_id = create_resp.json()["session_id"]
+
+    async def mock_astream_chat(*args, **kwargs):
+        yield {"type": "text", "content": "Partial"}
+        yield {"type": "error", "content": "boom"}
+
+    import app.api.chat as chat_api
+    chat_api.agent.astream_chat = mock_astream_chat
+
+    resp = client.post("/paperapi/chat?stream=false", json={"session_id": session_id, "text": "x"})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["answer"] == "Partial\n[Error: boom]"
+    assert data["parts"][1] == {"type": "error", "content": "boom", "metadata": None}
+
+    messages = client.get(f"/paperapi/sessions/{session_id}/messages").json()["messages"]
+    assert messages[1]["parts"][0]["content"] == data["answer"]
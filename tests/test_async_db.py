@@ -0,0 +1,83 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.api import chat as chat_api
+from app.core import db
+from app.main import app
+from app.repositories.messages_repo import AsyncMessagesRepo, MessagesRepo
+from app.repositories.messages_repo import metadata as messages_metadata
+from app.repositories.sessions_repo import AsyncSessionsRepo, SessionsRepo
+from app.repositories.sessions_repo import metadata as sessions_metadata
+
+
+@pytest.fixture(name="async_client")
+def async_client_fixture(tmp_path):
+    path = tmp_path / "async.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    messages_metadata.create_all(sync_engine)
+    sessions_metadata.create_all(sync_engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+
+    async def mock_astream_chat(*args, **kwargs):
+        yield {"type": "text", "content": "异步"}
+        yield {"type": "text", "content": "回答"}
+
+    mock_agent = MagicMock()
+    mock_agent.astream_chat = mock_astream_chat
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(db, "_engine", sync_engine)
+        mp.setattr(db, "_async_engine", async_engine)
+        mp.setattr(chat_api, "agent", mock_agent)
+        mp.setattr(chat_api, "async_generate", lambda session_id: None)
+        yield TestClient(app), sync_engine
+
+    asyncio.run(async_engine.dispose())
+    sync_engine.dispose()
+
+
+def test_dependencies_pick_async_repos(async_client):
+    assert isinstance(chat_api.get_sessions_repo(), AsyncSessionsRepo)
+    assert isinstance(chat_api.get_messages_repo(), AsyncMessagesRepo)
+
+
+def test_chat_flow_on_async_engine(async_client):
+    client, sync_engine = async_client
+
+    session_id = client.post("/paperapi/sessions", json={"user_id": "user_async"}).json()["session_id"]
+    resp = client.post("/paperapi/chat", json={"session_id": session_id, "text": "你好", "pacing": "off"})
+    assert resp.status_code == 200
+
+    rename = client.patch(f"/paperapi/sessions/{session_id}/title", json={"title": "异步会话"})
+    assert rename.json()["title"] == "异步会话"
+
+    hist = client.get(f"/paperapi/sessions/{session_id}/messages").json()
+    assert hist["title"] == "异步会话"
+    assert [m["role"] for m in hist["messages"]] == ["user", "assistant"]
+    assert hist["messages"][1]["parts"][0]["content"] == "异步回答"
+
+    # 异步仓储写入的数据，同步仓储读出来完全一致
+    assert MessagesRepo(sync_engine).list_messages(session_id) == hist["messages"]
+    assert SessionsRepo(sync_engine).get_session(session_id)["title"] == "异步会话"
+
+    assert client.delete(f"/paperapi/sessions/{session_id}?hard=true").json() == {"ok": True}
+    assert client.get(f"/paperapi/sessions/{session_id}/messages").status_code == 404
+
+
+def test_async_repos_serve_concurrent_sessions(async_client):
+    repo = AsyncSessionsRepo(db._async_engine)
+
+    async def scenario():
+        created = await asyncio.gather(*(repo.create_session("user_many") for _ in range(20)))
+        listed = await repo.list_sessions("user_many")
+        return created, listed
+
+    created, listed = asyncio.run(scenario())
+
+    assert {s["session_id"] for s in created} == {s["session_id"] for s in listed}
@@ -0,0 +1,210 @@
+import asyncio
+import json
+
+import pytest
+
+import app.api.chat as chat_api
+from app.core.admission import AdmissionController
+from app.repositories.messages_repo import MessagesRepo
+from app.repositories.sessions_repo import SessionsRepo
+
+
+def _ndjson(resp):
+    return [json.loads(line) for line in resp.text.splitlines() if line]
+
+
+def _session(client, user_id):
+    return client.post("/paperapi/sessions", json={"user_id": user_id}).json()["session_id"]
+
+
+def test_batch_returns_ndjson_and_persists_each_item(client):
+    s1 = _session(client, "user_batch")
+    s2 = _session(client, "user_batch")
+
+    resp = client.post(
+        "/paperapi/chat/batch",
+        json={
+            "items": [
+                {"session_id": s1, "text": "q1"},
+                {"session_id": "missing", "text": "q2"},
+                {"session_id": s2, "text": "q3"},
+            ]
+        },
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+
+    results = {r["index"]: r for r in _ndjson(resp)}
+    assert set(results) == {0, 1, 2}
+    assert results[0]["status"] == "ok"
+    assert results[0]["answer"] == "Mocked Agent Response"
+    assert results[0]["parts"] == [{"type": "text", "content": "Mocked Agent Response", "metadata": None}]
+    assert results[1] == {
+        "index": 1, "session_id": "missing", "status": "error", "answer": "", "parts": [], "error": "session not found",
+    }
+
+    for session_id, text in [(s1, "q1"), (s2, "q3")]:
+        messages = client.get(f"/paperapi/sessions/{session_id}/messages").json()["messages"]
+        assert [m["role"] for m in messages] == ["user", "assistant"]
+        assert messages[0]["parts"][0]["content"] == text
+        assert messages[1]["parts"][0]["content"] == "Mocked Agent Response"
+
+
+def test_batch_respects_concurrency_cap_and_completion_order(client):
+    session_id = _session(client, "user_batch_cap")
+    running = 0
+    peak = 0
+
+    async def mock_astream_chat(session_id, text, use_public_paper=False):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(float(text))
+            yield {"type": "text", "content": text}
+        finally:
+            running -= 1
+
+    delays = ["0.08", "0.01", "0.05", "0.02", "0.03", "0.01"]
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api.agent, "astream_chat", mock_astream_chat)
+        resp = client.post(
+            "/paperapi/chat/batch",
+            json={"items": [{"session_id": session_id, "text": d} for d in delays], "concurrency": 2},
+        )
+
+    results = _ndjson(resp)
+    assert peak == 2
+    assert sorted(r["index"] for r in results) == list(range(len(delays)))
+    # 按完成顺序输出：最慢的第 0 条不会排在最前
+    assert results[0]["index"] != 0
+    assert all(r["answer"] == delays[r["index"]] for r in results)
+
+
+def test_batch_groups_database_writes(client):
+    session_id = _session(client, "user_batch_group")
+    calls = []
+    original = MessagesRepo.save_messages
+    started = 0
+    release = None
+
+    async def gated_astream_chat(*args, **kwargs):
+        # 8 条全部开始后同时放行：它们在同一轮事件循环内完成，应合并为一次写库
+        nonlocal started, release
+        release = release or asyncio.Event()
+        started += 1
+        if started == 8:
+            release.set()
+        await release.wait()
+        yield {"type": "text", "content": "ok"}
+
+    def counting_save_messages(self, messages):
+        calls.append(len(messages))
+        return original(self, messages)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api.agent, "astream_chat", gated_astream_chat)
+        mp.setattr(MessagesRepo, "save_messages", counting_save_messages)
+        # 8 条同一用户同时进行，单用户并发上限放宽到 8
+        mp.setattr(chat_api, "admission", AdmissionController(max_concurrent=8, max_per_user=8))
+        resp = client.post(
+            "/paperapi/chat/batch",
+            json={"items": [{"session_id": session_id, "text": f"q{i}"} for i in range(8)], "concurrency": 8},
+        )
+
+    assert len(_ndjson(resp)) == 8
+    assert calls == [16]
+
+    messages = client.get(f"/paperapi/sessions/{session_id}/messages").json()["messages"]
+    assert len(messages) == 16
+
+
+def test_batch_items_go_through_admission_control(client):
+    session_id = _session(client, "user_batch_admission")
+    controller = AdmissionController(max_concurrent=1, max_per_user=1, queue_size=0, wait_timeout=1.0)
+    peak = 0
+
+    async def mock_astream_chat(*args, **kwargs):
+        nonlocal peak
+        peak = max(peak, controller.snapshot()["active"])
+        await asyncio.sleep(0.05)
+        yield {"type": "text", "content": "ok"}
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api.agent, "astream_chat", mock_astream_chat)
+        mp.setattr(chat_api, "admission", controller)
+        resp = client.post(
+            "/paperapi/chat/batch",
+            json={"items": [{"session_id": session_id, "text": f"q{i}"} for i in range(3)], "concurrency": 3},
+        )
+
+    results = _ndjson(resp)
+    ok = [r for r in results if r["status"] == "ok"]
+    rejected = [r for r in results if r["status"] == "error"]
+    # 名额为 1、不排队：只有一条调用上游，其余两条按 429 报错
+    assert len(ok) == 1 and len(rejected) == 2
+    assert all(r["error"].startswith("too many concurrent chats") for r in rejected)
+    assert peak == 1
+    assert controller.snapshot()["active"] == 0
+
+    # 被拒的条目不保存用户消息
+    messages = client.get(f"/paperapi/sessions/{session_id}/messages").json()["messages"]
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+
+
+def test_batch_reports_ok_when_only_session_touch_fails(client):
+    session_id = _session(client, "user_batch_touch")
+
+    def failing_touch_sessions(self, session_ids):
+        raise RuntimeError("touch failed")
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(SessionsRepo, "touch_sessions", failing_touch_sessions)
+        resp = client.post("/paperapi/chat/batch", json={"items": [{"session_id": session_id, "text": "q"}]})
+
+    # 消息已经提交：结果行与库里的内容一致
+    assert [r["status"] for r in _ndjson(resp)] == ["ok"]
+    messages = client.get(f"/paperapi/sessions/{session_id}/messages").json()["messages"]
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+
+
+def test_batch_close_waits_for_cancelled_items(client, monkeypatch):
+    session_id = _session(client, "user_batch_close")
+    cancelled = []
+
+    async def mock_astream_chat(session_id, text, use_public_paper=False):
+        try:
+            if text == "slow":
+                await asyncio.sleep(10)
+            yield {"type": "text", "content": text}
+        except asyncio.CancelledError:
+            cancelled.append(text)
+            raise
+
+    monkeypatch.setattr(chat_api.agent, "astream_chat", mock_astream_chat)
+    monkeypatch.setattr(chat_api, "admission", AdmissionController(max_concurrent=2, max_per_user=2))
+    items = [chat_api.ChatBatchItem(session_id=session_id, text=t) for t in ("fast", "slow")]
+
+    async def scenario():
+        batch = chat_api._run_batch(items, 2, chat_api.get_messages_repo(), chat_api.get_sessions_repo())
+        first = await batch.__anext__()
+        # 模拟客户端断开：关闭生成器返回时未完成的条目已经取消完毕
+        await batch.aclose()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        return first, tasks
+
+    first, pending = asyncio.run(scenario())
+    assert json.loads(first)["answer"] == "fast"
+    assert cancelled == ["slow"]
+    assert pending == []
+
+
+def test_batch_rejects_too_many_items(client, monkeypatch):
+    session_id = _session(client, "user_batch_limit")
+    monkeypatch.setattr(chat_api, "settings", chat_api.settings.__class__(chat_batch_max_items=2))
+
+    resp = client.post(
+        "/paperapi/chat/batch",
+        json={"items": [{"session_id": session_id, "text": "q"}] * 3},
+    )
+    assert resp.status_code == 422
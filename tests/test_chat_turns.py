@@ -0,0 +1,299 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.services.chat_turns import ChatTurn, TurnRegistry
+
+
+def _data_events(lines):
+    events = []
+    event_id = None
+    for line in lines:
+        if line.startswith("id: "):
+            event_id = int(line[len("id: "):])
+        elif line.startswith("data: "):
+            events.append((event_id, json.loads(line[len("data: "):])))
+    return events
+
+
+def test_subscribe_replays_then_follows_live_output():
+    turn = ChatTurn("t1", "s1")
+
+    async def scenario():
+        turn.publish({"type": "text", "content": "a"})
+        turn.publish({"type": "text", "content": "b"})
+
+        received = []
+
+        async def consume():
+            async for event_id, event in turn.subscribe(last_event_id=1):
+                received.append((event_id, event["content"]))
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0)
+        turn.publish({"type": "text", "content": "c"})
+        await asyncio.sleep(0)
+        turn.finish()
+        await consumer
+        return received
+
+    assert asyncio.run(scenario()) == [(2, "b"), (3, "c")]
+
+
+def test_ring_buffer_skips_evicted_events():
+    turn = ChatTurn("t1", "s1", buffer_size=2)
+    for c in "abcd":
+        turn.publish({"type": "text", "content": c})
+    turn.finish()
+
+    async def replay():
+        return [(i, e["content"]) async for i, e in turn.subscribe(last_event_id=0)]
+
+    assert turn.first_buffered_id == 3
+    assert asyncio.run(replay()) == [(3, "c"), (4, "d")]
+
+
+def test_registry_evicts_finished_turns_after_ttl():
+    now = [0.0]
+    registry = TurnRegistry(ttl_seconds=10.0, clock=lambda: now[0])
+    running = registry.create("s1")
+    finished = registry.create("s2")
+    finished.finish()
+
+    now[0] = 9.0
+    assert registry.get(finished.turn_id) is finished
+
+    now[0] = 10.0
+    assert registry.get(finished.turn_id) is None
+    assert registry.get(running.turn_id) is running
+
+
+def test_chat_events_have_ids_and_can_be_resumed(client):
+    create_resp = client.post("/paperapi/sessions", json={"user_id": "user_resume"})
+    session_id = create_resp.json()["session_id"]
+
+    with client.stream("POST", "/paperapi/chat", json={"session_id": session_id, "text": "Hello"}) as response:
+        assert response.status_code == 200
+        turn_id = response.headers["X-Chat-Turn-Id"]
+        events = _data_events(response.iter_lines())
+
+    assert [event_id for event_id, _ in events] == list(range(1, len(events) + 1))
+
+    resume = client.get(
+        f"/paperapi/chat/turns/{turn_id}/stream",
+        headers={"Last-Event-ID": "1"},
+    )
+    assert resume.status_code == 200
+    assert _data_events(resume.text.splitlines()) == events[1:]
+
+    missing = client.get("/paperapi/chat/turns/no-such-turn/stream")
+    assert missing.status_code == 404
+
+
+def test_duplicate_submissions_share_one_upstream_turn(client):
+    import app.api.chat as chat_api
+
+    create_resp = client.post("/paperapi/sessions", json={"user_id": "user_dup"})
+    session_id = create_resp.json()["session_id"]
+
+    calls = []
+
+    async def mock_astream_chat(*args, **kwargs):
+        calls.append(kwargs)
+        yield {"type": "text", "content": "Only once"}
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api.agent, "astream_chat", mock_astream_chat)
+        payload = {"session_id": session_id, "text": "Same question"}
+        first = client.post("/paperapi/chat", json=payload)
+        second = client.post("/paperapi/chat", json=payload)
+        keyed = client.post("/paperapi/chat", json={**payload, "text": "Other"}, headers={"Idempotency-Key": "k1"})
+        keyed_retry = client.post("/paperapi/chat", json={**payload, "text": "Other"}, headers={"Idempotency-Key": "k1"})
+
+    assert second.headers["X-Chat-Coalesced"] == "true"
+    assert second.headers["X-Chat-Turn-Id"] == first.headers["X-Chat-Turn-Id"]
+    assert _data_events(second.text.splitlines()) == _data_events(first.text.splitlines())
+    assert keyed_retry.headers["X-Chat-Turn-Id"] == keyed.headers["X-Chat-Turn-Id"]
+    assert len(calls) == 2
+
+    messages = client.get(f"/paperapi/sessions/{session_id}/messages").json()["messages"]
+    assert [m["role"] for m in messages] == ["user", "assistant", "user", "assistant"]
+
+
+def test_dedup_window_expires_for_finished_turns():
+    now = [0.0]
+    registry = TurnRegistry(dedup_window_seconds=5.0, clock=lambda: now[0])
+    turn = registry.create("s1", dedup_key="auto:s1:0:abc")
+    turn.finish()
+
+    assert registry.find_duplicate("auto:s1:0:abc") is turn
+    now[0] = 6.0
+    assert registry.find_duplicate("auto:s1:0:abc") is None
+    assert registry.snapshot()["coalesced"] == 1
+
+
+def test_resubscribe_within_grace_keeps_turn_running():
+    registry = TurnRegistry(abandon_grace_seconds=0.05)
+    turn = registry.create("s1")
+
+    async def scenario():
+        turn.task = asyncio.create_task(asyncio.sleep(1))
+
+        first = turn.subscribe()
+        turn.publish({"type": "text", "content": "a"})
+        await anext(first)
+        await first.aclose()
+        assert turn.subscribers == 0
+
+        # 宽限期内续传接上：放弃计时被取消
+        resumed = turn.subscribe(last_event_id=1)
+        consumer = asyncio.create_task(anext(resumed, None))
+        await asyncio.sleep(0.1)
+        cancelled = turn.task.cancelled()
+        turn.task.cancel()
+        turn.finish()
+        await consumer
+        return cancelled
+
+    assert asyncio.run(scenario()) is False
+    assert registry.aborted == 0
+
+
+def test_disconnect_cancels_upstream_and_saves_truncated_answer(client):
+    from app.api import chat as chat_api
+    from app.core import db
+    from app.repositories.messages_repo import MessagesRepo
+    from app.repositories.sessions_repo import SessionsRepo
+    from app.services.pacing import PACING_OFF
+
+    session_id = client.post("/paperapi/sessions", json={"user_id": "user_abort"}).json()["session_id"]
+    upstream = {"closed": False, "yielded": 0}
+
+    async def slow_astream_chat(*args, **kwargs):
+        try:
+            for piece in ["部分", "回答", "不会", "发出"]:
+                upstream["yielded"] += 1
+                yield {"type": "text", "content": piece}
+                await asyncio.sleep(0.2)
+        finally:
+            upstream["closed"] = True
+
+    registry = TurnRegistry(abandon_grace_seconds=0.05)
+
+    async def scenario():
+        turn = registry.create(session_id)
+        turn.task = asyncio.create_task(
+            chat_api._run_turn(
+                turn,
+                user_text="x",
+                use_public_paper=False,
+                messages_repo=MessagesRepo(db.get_engine()),
+                sessions_repo=SessionsRepo(db.get_engine()),
+                lease=None,
+                pacing=PACING_OFF,
+            )
+        )
+        sub = turn.subscribe()
+        _, event = await anext(sub)
+        await sub.aclose()
+        await asyncio.gather(turn.task, return_exceptions=True)
+        return turn, event
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api, "turns", registry)
+        mp.setattr(chat_api.agent, "astream_chat", slow_astream_chat)
+        turn, first_event = asyncio.run(scenario())
+
+    assert first_event == {"type": "text", "content": "部分"}
+    assert turn.abort_reason == "client_disconnected"
+    assert upstream == {"closed": True, "yielded": 1}
+    assert registry.snapshot()["aborted"] == 1
+
+    messages = client.get(f"/paperapi/sessions/{session_id}/messages").json()["messages"]
+    assistant = messages[-1]
+    assert assistant["role"] == "assistant"
+    assert assistant["parts"][0]["content"] == "部分"
+    assert assistant["parts"][0]["metadata"] == {"truncated": True, "reason": "client_disconnected"}
+
+
+def test_idle_stream_notices_client_disconnect():
+    from app.api import chat as chat_api
+
+    turn = ChatTurn("t1", "s1")
+    response = chat_api._stream_response(turn, last_event_id=0)
+
+    async def scenario():
+        inbox = asyncio.Queue()
+        await inbox.put({"type": "http.request", "body": b"", "more_body": False})
+
+        async def send(message):
+            pass
+
+        scope = {"type": "http", "asgi": {"spec_version": "2.4"}, "method": "POST", "path": "/", "headers": []}
+        served = asyncio.create_task(response(scope, inbox.get, send))
+        turn.publish({"type": "text", "content": "a"})
+        await asyncio.sleep(0.01)
+        before = turn.subscribers
+
+        # 上游没有新输出（没有写出动作）时断开，也要让订阅数归零
+        await inbox.put({"type": "http.disconnect"})
+        await asyncio.wait_for(served, 1)
+        return before, turn.subscribers
+
+    assert asyncio.run(scenario()) == (1, 0)
+
+
+def test_abort_during_final_save_keeps_single_assistant_message(client):
+    import threading
+
+    from app.api import chat as chat_api
+    from app.core import db
+    from app.repositories.messages_repo import MessagesRepo
+    from app.repositories.sessions_repo import SessionsRepo
+    from app.services.pacing import PACING_OFF
+
+    session_id = client.post("/paperapi/sessions", json={"user_id": "user_abort_save"}).json()["session_id"]
+    save_started = threading.Event()
+    save_done = threading.Event()
+
+    class SlowMessagesRepo(MessagesRepo):
+        def save_message(self, *args, **kwargs):
+            save_started.set()
+            time.sleep(0.1)
+            try:
+                return super().save_message(*args, **kwargs)
+            finally:
+                save_done.set()
+
+    registry = TurnRegistry()
+
+    async def scenario():
+        turn = registry.create(session_id)
+        turn.task = asyncio.create_task(
+            chat_api._run_turn(
+                turn,
+                user_text="x",
+                use_public_paper=False,
+                messages_repo=SlowMessagesRepo(db.get_engine()),
+                sessions_repo=SessionsRepo(db.get_engine()),
+                lease=None,
+                pacing=PACING_OFF,
+            )
+        )
+        await asyncio.to_thread(save_started.wait, 1)
+        # 流已结束、最终回答正在落库时被取消
+        assert registry.abort(turn, "client_cancelled")
+        await asyncio.gather(turn.task, return_exceptions=True)
+        await asyncio.to_thread(save_done.wait, 1)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api, "turns", registry)
+        asyncio.run(scenario())
+
+    messages = client.get(f"/paperapi/sessions/{session_id}/messages").json()["messages"]
+    assistant = [m for m in messages if m["role"] == "assistant"]
+    assert len(assistant) == 1
+    assert assistant[0]["parts"][0]["content"] == "Mocked Agent Response"
+    assert assistant[0]["parts"][0]["metadata"] is None
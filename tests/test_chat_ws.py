@@ -0,0 +1,167 @@
+import asyncio
+import time
+
+import pytest
+
+import app.api.chat as chat_api
+from app.services.chat_turns import TurnRegistry
+
+
+def _session(client, user_id):
+    return client.post("/paperapi/sessions", json={"user_id": user_id}).json()["session_id"]
+
+
+def _receive_until(ws, predicate):
+    frames = []
+    while True:
+        frame = ws.receive_json()
+        frames.append(frame)
+        if predicate(frame, frames):
+            return frames
+
+
+def test_ws_multiplexes_turns_for_several_sessions(client):
+    s1 = _session(client, "user_ws")
+    s2 = _session(client, "user_ws")
+
+    with client.websocket_connect("/paperapi/chat/ws") as ws:
+        ws.send_json({"type": "chat", "request_id": "r1", "session_id": s1, "text": "one", "pacing": "off"})
+        ws.send_json({"type": "chat", "request_id": "r2", "session_id": s2, "text": "two", "pacing": "off"})
+        frames = _receive_until(ws, lambda f, fs: sum(x["type"] == "done" for x in fs) == 2)
+
+    by_request = {"r1": [], "r2": []}
+    for frame in frames:
+        by_request[frame["request_id"]].append(frame)
+
+    for request_id, session_id in [("r1", s1), ("r2", s2)]:
+        own = by_request[request_id]
+        assert own[0]["type"] == "turn" and own[0]["session_id"] == session_id
+        turn_id = own[0]["turn_id"]
+        assert all(f["session_id"] == session_id and f["turn_id"] == turn_id for f in own)
+        texts = [f for f in own if f["type"] == "text"]
+        assert [f["id"] for f in texts] == sorted(f["id"] for f in texts)
+        assert "".join(f["content"] for f in texts) == "Mocked Agent Response"
+        assert own[-1]["type"] == "done"
+
+        messages = client.get(f"/paperapi/sessions/{session_id}/messages").json()["messages"]
+        assert [m["role"] for m in messages] == ["user", "assistant"]
+
+
+def test_ws_reports_request_errors_without_closing(client):
+    session_id = _session(client, "user_ws_err")
+
+    with client.websocket_connect("/paperapi/chat/ws") as ws:
+        ws.send_json({"type": "chat", "request_id": "a", "session_id": "missing", "text": "x"})
+        assert ws.receive_json() == {"type": "error", "request_id": "a", "status": 404, "content": "session not found"}
+
+        ws.send_json({"type": "chat", "request_id": "b", "session_id": session_id})
+        frame = ws.receive_json()
+        assert (frame["request_id"], frame["status"]) == ("b", 422)
+
+        ws.send_json({"type": "ping", "request_id": "c"})
+        assert ws.receive_json()["status"] == 400
+
+        ws.send_text("not json")
+        assert ws.receive_json()["content"] == "invalid JSON"
+
+        ws.send_json({"type": "resume", "request_id": "e", "turn_id": "missing"})
+        assert ws.receive_json() == {"type": "error", "request_id": "e", "status": 404, "content": "turn not found"}
+
+        # 出错后连接仍可继续使用
+        ws.send_json({"type": "chat", "request_id": "d", "session_id": session_id, "text": "ok", "pacing": "off"})
+        frames = _receive_until(ws, lambda f, fs: f["type"] == "done")
+        assert "".join(f.get("content", "") for f in frames if f["type"] == "text") == "Mocked Agent Response"
+
+
+def test_ws_resume_rejects_invalid_last_event_id(client):
+    session_id = _session(client, "user_ws_resume")
+
+    with client.websocket_connect("/paperapi/chat/ws") as ws:
+        ws.send_json({"type": "chat", "request_id": "r1", "session_id": session_id, "text": "x", "pacing": "off"})
+        frames = _receive_until(ws, lambda f, fs: f["type"] == "done")
+        turn_id = frames[0]["turn_id"]
+
+        for bad in ["abc", [1]]:
+            ws.send_json({"type": "resume", "request_id": "bad", "turn_id": turn_id, "last_event_id": bad})
+            assert ws.receive_json() == {
+                "type": "error", "request_id": "bad", "status": 400, "content": "invalid last_event_id",
+            }
+
+        ws.send_json({"type": "resume", "request_id": "ok", "turn_id": turn_id, "last_event_id": "1"})
+        replay = _receive_until(ws, lambda f, fs: f["type"] == "done")
+        assert all(f["request_id"] == "ok" for f in replay)
+        assert [f["id"] for f in replay if "id" in f][0] == 2
+
+
+def test_ws_cancel_stops_upstream_and_saves_partial_answer(client):
+    session_id = _session(client, "user_ws_cancel")
+    upstream = {"closed": False}
+    registry = TurnRegistry()
+
+    async def slow_astream_chat(*args, **kwargs):
+        try:
+            yield {"type": "text", "content": "前半"}
+            await asyncio.sleep(5)
+            yield {"type": "text", "content": "后半"}
+        finally:
+            upstream["closed"] = True
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api, "turns", registry)
+        mp.setattr(chat_api.agent, "astream_chat", slow_astream_chat)
+        with client.websocket_connect("/paperapi/chat/ws") as ws:
+            ws.send_json({"type": "chat", "request_id": "r1", "session_id": session_id, "text": "x", "pacing": "off"})
+            _receive_until(ws, lambda f, fs: f["type"] == "text")
+            ws.send_json({"type": "cancel", "request_id": "r1"})
+            frame = _receive_until(ws, lambda f, fs: f["type"] == "cancelled")[-1]
+            assert frame["session_id"] == session_id
+
+            # 取消在生产者任务中异步完成，等它落库
+            for _ in range(100):
+                if registry.snapshot()["in_flight"] == 0:
+                    break
+                ws.send_json({"type": "cancel", "request_id": "noop"})
+                ws.receive_json()
+
+    assert upstream["closed"] is True
+    assert registry.aborted == 1
+    messages = client.get(f"/paperapi/sessions/{session_id}/messages").json()["messages"]
+    assistant = messages[-1]
+    assert assistant["parts"][0]["content"] == "前半"
+    assert assistant["parts"][0]["metadata"] == {"truncated": True, "reason": "client_cancelled"}
+
+
+def test_ws_cancel_right_after_turn_start_aborts_upstream(client):
+    from starlette.websockets import WebSocket
+
+    session_id = _session(client, "user_ws_cancel_early")
+    registry = TurnRegistry()
+
+    async def slow_astream_chat(*args, **kwargs):
+        await asyncio.sleep(5)
+        yield {"type": "text", "content": "不会发出"}
+
+    original_send_text = WebSocket.send_text
+
+    async def slow_turn_frame(self, data):
+        # "turn" 帧写得慢：轮次已启动、转发还没开始时 cancel 先到
+        if '"type":"turn"' in data:
+            await asyncio.sleep(0.2)
+        await original_send_text(self, data)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api, "turns", registry)
+        mp.setattr(chat_api.agent, "astream_chat", slow_astream_chat)
+        mp.setattr(WebSocket, "send_text", slow_turn_frame)
+        with client.websocket_connect("/paperapi/chat/ws") as ws:
+            ws.send_json({"type": "chat", "request_id": "r1", "session_id": session_id, "text": "x", "pacing": "off"})
+            for _ in range(200):
+                if any(t.task is not None for t in registry._turns.values()):
+                    break
+                time.sleep(0.005)
+            ws.send_json({"type": "cancel", "request_id": "r1"})
+            frames = _receive_until(ws, lambda f, fs: f["type"] == "cancelled")
+
+    cancelled = frames[-1]
+    assert cancelled["turn_id"] is not None and cancelled["session_id"] == session_id
+    assert registry.aborted == 1
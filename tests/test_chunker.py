@@ -0,0 +1,52 @@
+import random
+
+from app.services.chunker import StreamChunker
+
+
+def _run(chunker: StreamChunker, deltas):
+    pieces = []
+    for delta in deltas:
+        pieces.extend(chunker.feed(delta))
+    pieces.extend(chunker.flush())
+    return pieces
+
+
+def test_english_words_are_not_split_across_upstream_chunks():
+    pieces = _run(StreamChunker(10), ["Mocked ", "Agent ", "Resp", "onse is rea", "dy."])
+
+    assert "".join(pieces) == "Mocked Agent Response is ready."
+    assert pieces == ["Mocked ", "Agent ", "Response ", "is ", "ready."]
+
+
+def test_cjk_text_breaks_per_character_without_leading_punctuation():
+    text = "稀土元素在催化剂中的作用，主要体现在储氧能力与热稳定性的提升。"
+    pieces = _run(StreamChunker(6), [text])
+
+    assert "".join(pieces) == text
+    assert all(len(p) <= 6 for p in pieces)
+    assert not any(p[0] in "，。" for p in pieces)
+    assert len(pieces) > 1
+
+
+def test_long_tokens_are_hard_sliced():
+    url = "https://example.com/" + "a" * 40
+    pieces = _run(StreamChunker(16), [url, " end"])
+
+    assert "".join(pieces) == url + " end"
+    assert all(len(p) <= 16 for p in pieces)
+
+
+def test_random_split_points_round_trip():
+    rng = random.Random(3)
+    text = "".join(rng.choice(["稀土", "催化剂，", "The ", "doping ", "ratio. ", "\n", "CeO2"]) for _ in range(2000))
+    cuts = sorted(rng.sample(range(1, len(text)), 300))
+    deltas = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+    pieces = _run(StreamChunker(16), deltas)
+
+    assert "".join(pieces) == text
+    assert all(0 < len(p) <= 16 for p in pieces)
+
+
+def test_non_positive_size_disables_chunking():
+    assert _run(StreamChunker(0), ["abc", "def"]) == ["abc", "def"]
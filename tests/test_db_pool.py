@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, StaticPool
+
+from app.core import db
+from app.core.db import POOL_PROFILES, PoolProfile, _connect_args, create_profile_async_engine, create_profile_engine
+from app.core.pool_metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+
+
+def test_profiles_use_dialect_specific_connect_args():
+    server = POOL_PROFILES["server"]
+    assert _connect_args(make_url("postgresql://u:p@db/x"), server) == {"connect_timeout": 5}
+    assert _connect_args(make_url("postgresql+asyncpg://u:p@db/x"), server) == {"timeout": 5}
+    # sqlite3.connect 不接受 connect_timeout
+    assert _connect_args(make_url("sqlite:///./dev.db"), server) == {"check_same_thread": False}
+
+    engine = create_profile_engine("postgresql+psycopg2://u:p@db/x", server)
+    assert isinstance(engine.pool, InstrumentedQueuePool)
+    assert (engine.pool.size(), engine.pool._max_overflow) == (10, 20)
+
+    async_engine = create_profile_async_engine("postgresql+asyncpg://u:p@db/x", POOL_PROFILES["faas"])
+    assert isinstance(async_engine.pool, InstrumentedAsyncQueuePool)
+    assert async_engine.pool.size() == 1
+
+    assert isinstance(create_profile_engine("sqlite://").pool, StaticPool)
+    assert isinstance(create_profile_async_engine("sqlite+aiosqlite:///./x.db").pool, NullPool)
+
+
+def test_pool_records_checkout_waits_and_timeouts(tmp_path, client):
+    profile = PoolProfile(pool_size=1, max_overflow=0, pool_recycle=-1, pool_timeout=0.3, pool_pre_ping=False, connect_timeout=5)
+    engine = create_profile_engine(f"sqlite:///{tmp_path / 'pool.db'}", profile)
+
+    held = engine.connect()
+    waited = []
+
+    def contender():
+        start = time.perf_counter()
+        with engine.connect() as conn:
+            conn.execute(text("select 1"))
+        waited.append(time.perf_counter() - start)
+
+    thread = threading.Thread(target=contender)
+    thread.start()
+    time.sleep(0.1)
+    held.close()
+    thread.join()
+
+    held = engine.connect()
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    held.close()
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(db, "_engine", engine)
+        stats = client.get("/admin/db-pool").json()
+
+    sync = stats["sync"]
+    assert sync["pool_class"] == "InstrumentedQueuePool"
+    assert (sync["pool_size"], sync["checked_out"], sync["overflow"]) == (1, 0, 0)
+    assert sync["checkouts"] == 3
+    assert sync["timeouts"] == 1
+    assert sync["wait_seconds"]["max"] >= 0.25
+    assert waited[0] >= 0.1
+    assert stats["async"] is None
+    assert stats["profile"] == "faas"
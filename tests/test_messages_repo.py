@@ -0,0 +1,186 @@
+import asyncio
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.repositories.messages_repo import (
+    AsyncMessagesRepo,
+    MessagesRepo,
+    _insert_message_with_parts_stmt,
+    decode_cursor,
+    encode_cursor,
+    metadata,
+)
+
+PARTS = [
+    {"type": "text", "content": "第一段"},
+    {"type": "image", "url": "https://example.com/a.png", "metadata": {"w": 1, "tags": ["图"]}},
+    {"type": "text", "content": "第三段"},
+]
+
+
+def _count_statements(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, stmt, *args: statements.append(stmt))
+    return statements
+
+
+def test_save_message_writes_parts_in_one_executemany(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'm.db'}")
+    metadata.create_all(engine)
+    repo = MessagesRepo(engine)
+    statements = _count_statements(engine)
+
+    repo.save_message("s1", "assistant", PARTS * 40)
+
+    inserts = [s for s in statements if s.lstrip().upper().startswith("INSERT")]
+    assert len(inserts) == 2
+    assert [s.split()[2] for s in inserts] == ["messages", "message_parts"]
+
+    (saved,) = repo.list_messages("s1")
+    assert saved["role"] == "assistant"
+    assert saved["parts"][:3] == [
+        {"type": "text", "content": "第一段", "url": None, "metadata": None},
+        {"type": "image", "content": None, "url": "https://example.com/a.png", "metadata": {"w": 1, "tags": ["图"]}},
+        {"type": "text", "content": "第三段", "url": None, "metadata": None},
+    ]
+    assert len(saved["parts"]) == 120
+
+
+def test_save_messages_keeps_order_and_maps_parts_to_their_message(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'm.db'}")
+    metadata.create_all(engine)
+    repo = MessagesRepo(engine)
+
+    repo.save_messages(
+        [
+            {"session_id": "a", "role": "user", "parts": [{"type": "text", "content": "问 a"}]},
+            {"session_id": "b", "role": "user", "parts": []},
+            {"session_id": "a", "role": "assistant", "parts": PARTS},
+        ]
+    )
+    repo.save_messages([])
+
+    a = repo.list_messages("a")
+    assert [m["role"] for m in a] == ["user", "assistant"]
+    assert [p["content"] for p in a[1]["parts"]] == ["第一段", None, "第三段"]
+    assert repo.list_messages("b")[0]["parts"] == []
+
+
+def test_async_repo_bulk_insert(tmp_path):
+    path = tmp_path / "m.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    metadata.create_all(sync_engine)
+
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+        try:
+            repo = AsyncMessagesRepo(engine)
+            await repo.save_message("s1", "assistant", PARTS)
+            await repo.save_messages([{"session_id": "s1", "role": "user", "parts": PARTS[:1]}])
+            return await repo.list_messages("s1")
+        finally:
+            await engine.dispose()
+
+    saved = asyncio.run(run())
+    assert [len(m["parts"]) for m in saved] == [3, 1]
+    assert saved == MessagesRepo(sync_engine).list_messages("s1")
+
+
+def test_postgres_path_is_a_single_cte_statement():
+    sql = " ".join(str(_insert_message_with_parts_stmt("s1", "assistant", PARTS).compile(dialect=postgresql.dialect())).split())
+
+    assert sql.startswith("WITH new_message AS (INSERT INTO messages")
+    assert "RETURNING messages.id" in sql
+    assert "INSERT INTO message_parts (message_id, type, content, url, metadata, sort_order)" in sql
+    assert "jsonb_to_recordset" in sql
+    # conftest 为 SQLite 把 JSONB 换成了 JSON，这里两种写法都接受
+    assert re.search(r"AS p\(type VARCHAR, content TEXT, url TEXT, metadata JSONB?, sort_order INTEGER\) ON true", sql)
+
+
+def _seed_history(repo, count=7):
+    # 前 4 条 created_at 相同：翻页必须靠 id 区分，不能漏也不能重复
+    same = datetime(2026, 1, 18, 12, 0, 0)
+    repo.save_messages(
+        [
+            {
+                "session_id": "s1",
+                "role": "user" if i % 2 == 0 else "assistant",
+                "parts": [{"type": "text", "content": f"m{i}"}, {"type": "text", "content": f"m{i}-2"}],
+                "created_at": same if i < 4 else same + timedelta(seconds=i),
+            }
+            for i in range(count)
+        ]
+        + [{"session_id": "other", "role": "user", "parts": [{"type": "text", "content": "x"}], "created_at": same}]
+    )
+
+
+def _walk(list_page, limit, newest_first):
+    seen, cursor = [], None
+    while True:
+        page, cursor = list_page("s1", limit, cursor, newest_first=newest_first)
+        seen.append([m["parts"][0]["content"] for m in page])
+        if cursor is None:
+            return seen
+
+
+def test_keyset_pages_walk_history_once_in_both_orders(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'm.db'}")
+    metadata.create_all(engine)
+    repo = MessagesRepo(engine)
+    _seed_history(repo)
+
+    assert _walk(repo.list_messages_page, 3, False) == [["m0", "m1", "m2"], ["m3", "m4", "m5"], ["m6"]]
+    assert _walk(repo.list_messages_page, 3, True) == [["m6", "m5", "m4"], ["m3", "m2", "m1"], ["m0"]]
+    # 恰好整页时最后一页之后没有空页
+    assert _walk(repo.list_messages_page, 7, False) == [[f"m{i}" for i in range(7)]]
+
+    page, _ = repo.list_messages_page("s1", 2)
+    assert page == repo.list_messages("s1")[:2]
+    assert page[0]["parts"][1]["content"] == "m0-2"
+
+
+def test_keyset_page_is_two_statements_and_rejects_bad_cursor(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'm.db'}")
+    metadata.create_all(engine)
+    repo = MessagesRepo(engine)
+    _seed_history(repo)
+    statements = _count_statements(engine)
+
+    _, cursor = repo.list_messages_page("s1", 3)
+    repo.list_messages_page("s1", 3, cursor)
+    selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    assert len(selects) == 4
+    assert all("LIMIT" in s for s in selects[::2])
+
+    with pytest.raises(ValueError):
+        repo.list_messages_page("s1", 3, "not-a-cursor")
+    created_at, message_id = decode_cursor(cursor)
+    assert encode_cursor(created_at, message_id) == cursor
+
+
+def test_async_keyset_pages_match_sync(tmp_path):
+    path = tmp_path / "m.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    metadata.create_all(sync_engine)
+    _seed_history(MessagesRepo(sync_engine))
+
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+        try:
+            repo = AsyncMessagesRepo(engine)
+            first, cursor = await repo.list_messages_page("s1", 4, newest_first=True)
+            second, end = await repo.list_messages_page("s1", 4, cursor, newest_first=True)
+            return first + second, end
+        finally:
+            await engine.dispose()
+
+    messages, end = asyncio.run(run())
+    assert end is None
+    assert messages == list(reversed(MessagesRepo(sync_engine).list_messages("s1")))
@@ -0,0 +1,83 @@
+from sqlalchemy import create_engine, inspect, text
+
+from app.core import db
+from app.core.migrations import MIGRATIONS, explain_hot_queries, migrate, migration_status
+from app.core.migrations import metadata as migrations_metadata
+from app.repositories.messages_repo import metadata as messages_metadata
+from app.repositories.sessions_repo import metadata as sessions_metadata
+
+HOT_PATH_INDEXES = {
+    "messages": "ix_messages_session_created_id",
+    "message_parts": "ix_message_parts_message_sort",
+    "sessions": "ix_sessions_user_status_updated",
+}
+
+
+def _index_names(engine, table):
+    return {ix["name"] for ix in inspect(engine).get_indexes(table)}
+
+
+def test_migrate_fresh_database_is_idempotent(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+
+    assert migration_status(engine) == {
+        "version": 0,
+        "latest": MIGRATIONS[-1].version,
+        "pending": [{"version": m.version, "name": m.name} for m in MIGRATIONS],
+    }
+    assert [m["version"] for m in migrate(engine)] == [m.version for m in MIGRATIONS]
+    assert migrate(engine) == []
+    assert migration_status(engine)["pending"] == []
+
+    for table, index in HOT_PATH_INDEXES.items():
+        assert index in _index_names(engine, table)
+    with engine.connect() as conn:
+        assert conn.execute(text("select count(*) from schema_migrations")).scalar_one() == len(MIGRATIONS)
+
+
+def test_migrate_adds_indexes_to_legacy_create_all_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    messages_metadata.create_all(engine)
+    sessions_metadata.create_all(engine)
+    # 早期版本 create_all 建出来的库没有这些索引
+    with engine.begin() as conn:
+        for index in HOT_PATH_INDEXES.values():
+            conn.execute(text(f"DROP INDEX {index}"))
+        conn.execute(text("INSERT INTO messages (session_id, role, created_at) VALUES ('s', 'user', '2026-01-01 00:00:00')"))
+
+    assert [m["name"] for m in migrate(engine)] == ["create_tables", "hot_path_indexes"]
+    for table, index in HOT_PATH_INDEXES.items():
+        assert index in _index_names(engine, table)
+    # 已有数据不受影响
+    with engine.connect() as conn:
+        assert conn.execute(text("select count(*) from messages")).scalar_one() == 1
+
+
+def test_explain_check_flags_missing_index(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'explain.db'}")
+    migrate(engine)
+
+    results = explain_hot_queries(engine)
+    assert {r["name"] for r in results} >= {"list_messages", "list_messages_page", "list_sessions", "delete_by_session_id.parts"}
+    assert all(r["ok"] for r in results), results
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_sessions_user_status_updated"))
+    failed = {r["name"]: r for r in explain_hot_queries(engine) if not r["ok"]}
+    assert list(failed) == ["list_sessions"]
+    assert failed["list_sessions"]["missing_indexes"] == ["ix_sessions_user_status_updated"]
+
+
+def test_admin_init_db_runs_migrations_and_explain(client):
+    try:
+        resp = client.post("/admin/init-db", params={"explain": "true"})
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["ok"] is True
+        assert data["version"] == MIGRATIONS[-1].version and data["pending"] == []
+        assert all(r["ok"] for r in data["explain"])
+
+        again = client.post("/admin/init-db").json()
+        assert again["applied"] == [] and "explain" not in again
+    finally:
+        migrations_metadata.drop_all(db.get_engine())
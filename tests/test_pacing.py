@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.pacing import PACING_OFF, Pacer, PacingConfig
+
+
+class _FakeTime:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 6))
+        self.now += seconds + 0.004  # 模拟定时器超时唤醒
+
+
+def test_deadlines_do_not_accumulate_sleep_overshoot():
+    fake = _FakeTime()
+    pacer = Pacer(PacingConfig(chunk_delay_ms=25, punct_delay_ms=80), clock=fake.clock, sleep=fake.sleep)
+
+    async def run():
+        for piece in ["a", "b。", "c", "d"]:
+            await pacer.pace(piece)
+
+    asyncio.run(run())
+
+    # 第一块立即输出；之后每次只等到截止时间，唤醒误差（4ms）在下一次等待中被扣除
+    assert fake.sleeps == [0.025, 0.101, 0.021]
+    assert pacer.slept == 3
+
+
+def test_slow_upstream_is_not_delayed_further():
+    fake = _FakeTime()
+    pacer = Pacer(PacingConfig(chunk_delay_ms=25, punct_delay_ms=0), clock=fake.clock, sleep=fake.sleep)
+
+    async def run():
+        for _ in range(5):
+            await pacer.pace("x")
+            fake.now += 0.1  # 上游每 100ms 才来一块，比目标速率慢
+
+    asyncio.run(run())
+
+    assert fake.sleeps == []
+    assert pacer.skipped == 4
+
+
+def test_punct_delay_is_capped():
+    pacer = Pacer(PacingConfig(chunk_delay_ms=150, punct_delay_ms=100, max_delay_ms=200))
+    assert pacer.interval("句号。") == pytest.approx(0.2)
+    assert pacer.interval("x") == pytest.approx(0.15)
+    assert Pacer(PACING_OFF).interval("。") == 0.0
+
+
+def test_pacing_off_forwards_upstream_deltas(client):
+    import app.api.chat as chat_api
+
+    long_text = "Hello World, this is a long text for streaming split."
+
+    async def mock_astream_chat(*args, **kwargs):
+        yield {"type": "text", "content": long_text}
+
+    session_id = client.post("/paperapi/sessions", json={"user_id": "user_pacing"}).json()["session_id"]
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(chat_api.agent, "astream_chat", mock_astream_chat)
+        # 默认节奏很慢，pacing=off 时不应受影响
+        mp.setattr(chat_api, "stream_pacing", PacingConfig(chunk_size=4, chunk_delay_ms=5000))
+        resp = client.post("/paperapi/chat", json={"session_id": session_id, "text": "x", "pacing": "off"})
+
+    texts = [
+        json.loads(line[len("data: "):])["content"]
+        for line in resp.text.splitlines()
+        if line.startswith("data: ")
+    ]
+    assert texts == [long_text]
+
+    invalid = client.post("/paperapi/chat", json={"session_id": session_id, "text": "x", "pacing": "turbo"})
+    assert invalid.status_code == 422
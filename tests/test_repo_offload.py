@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.core.db import call_repo
+from app.main import app
+from app.repositories.messages_repo import MessagesRepo
+from app.repositories.sessions_repo import SessionsRepo
+
+SLOW_DB_SECONDS = 0.15
+
+
+def _slow(fn):
+    def wrapper(*args, **kwargs):
+        time.sleep(SLOW_DB_SECONDS)
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def test_call_repo_runs_in_worker_thread():
+    import threading
+
+    async def run():
+        return await call_repo(lambda: threading.current_thread().name)
+
+    assert asyncio.run(run()).startswith("db")
+
+
+def test_slow_database_does_not_stall_other_streams(client):
+    """
+    模拟每次仓储调用耗时 150ms：一轮对话共 3 次数据库往返，
+    期间事件循环上的其它协程（代表其它连接的 SSE 输出）间隔应保持平稳。
+    """
+    session_id = client.post("/paperapi/sessions", json={"user_id": "user_slow_db"}).json()["session_id"]
+
+    async def scenario():
+        gaps = []
+        stop = asyncio.Event()
+
+        async def ticker():
+            last = time.perf_counter()
+            while not stop.is_set():
+                await asyncio.sleep(0.005)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        tick_task = asyncio.create_task(ticker())
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            started = time.perf_counter()
+            resp = await http.post("/paperapi/chat", json={"session_id": session_id, "text": "slow", "pacing": "off"})
+            elapsed = time.perf_counter() - started
+        stop.set()
+        await tick_task
+        return resp, elapsed, max(gaps)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(SessionsRepo, "get_session", _slow(SessionsRepo.get_session))
+        mp.setattr(MessagesRepo, "save_message", _slow(MessagesRepo.save_message))
+        mp.setattr("app.api.chat.async_generate", lambda session_id: None)
+        resp, elapsed, max_gap = asyncio.run(scenario())
+
+    assert resp.status_code == 200
+    assert "Mocked " in resp.text
+    assert elapsed >= 3 * SLOW_DB_SECONDS
+    # 同步调用会让事件循环整整卡住一次数据库往返（>=150ms）
+    assert max_gap < SLOW_DB_SECONDS / 2
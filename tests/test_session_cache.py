@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core import session_cache as session_cache_module
+from app.core.session_cache import LocalInvalidationChannel, SessionCache
+from app.repositories.sessions_repo import AsyncSessionsRepo, SessionsRepo
+from app.repositories.sessions_repo import metadata as sessions_metadata
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(name="engine")
+def engine_fixture(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sessions.db'}", connect_args={"check_same_thread": False})
+    sessions_metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def _count_selects(engine):
+    selects = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            selects.append(statement)
+
+    return selects
+
+
+def test_lru_ttl_and_hit_rate():
+    clock = FakeClock()
+    cache = SessionCache(max_entries=2, ttl_seconds=10, clock=clock)
+
+    cache.put("a", {"title": "A"})
+    cache.put("b", {"title": "B"})
+    assert cache.get("a") == {"title": "A"}
+    cache.put("c", {"title": "C"})  # b 最久未使用，被淘汰
+    assert cache.get("b") is None
+
+    clock.now = 10
+    assert cache.get("a") is None  # 过期
+
+    # 返回副本，调用方修改不影响缓存
+    cache.put("d", {"title": "D"})
+    cache.get("d")["title"] = "changed"
+    assert cache.get("d") == {"title": "D"}
+
+    stats = cache.snapshot()
+    assert stats["evictions"] == 1 and stats["entries"] == 2
+    assert (stats["hits"], stats["misses"]) == (3, 2) and stats["hit_rate"] == 0.6
+
+
+def test_put_is_dropped_when_invalidated_during_load():
+    cache = SessionCache()
+    token = cache.load_token()
+    # 查库期间另一个请求改了标题
+    cache.invalidate("s")
+    cache.put("s", {"title": "旧标题"}, token)
+    assert cache.get("s") is None
+
+    cache.put("s", {"title": "新标题"}, cache.load_token())
+    assert cache.get("s") == {"title": "新标题"}
+
+
+def test_repo_serves_reads_from_cache_and_invalidates_on_writes(engine):
+    cache = SessionCache()
+    repo = SessionsRepo(engine, cache=cache)
+    session_id = repo.create_session("u")["session_id"]
+    selects = _count_selects(engine)
+
+    assert repo.get_session(session_id)["title"] == "新对话"
+    assert repo.get_session(session_id)["status"] == "active"
+    assert selects == []
+
+    repo.update_title(session_id, "稀土储氧")
+    assert repo.get_session(session_id)["title"] == "稀土储氧"
+    repo.archive_session(session_id)
+    assert repo.get_session(session_id)["status"] == "archived"
+    assert len(selects) == 2
+
+    repo.delete_session(session_id)
+    assert repo.get_session(session_id) is None
+    assert cache.snapshot()["invalidations"] == 3
+
+
+def test_touch_writes_through_updated_at(engine):
+    cache = SessionCache()
+    repo = SessionsRepo(engine, cache=cache)
+    session_id = repo.create_session("u")["session_id"]
+    before = repo.get_session(session_id)["updated_at"]
+
+    repo.touch_session(session_id)
+    cached = repo.get_session(session_id)
+    assert cached["updated_at"] >= before
+    # 缓存里的 updated_at 与库里一致，且没有因为 touch 丢掉缓存
+    assert SessionsRepo(engine).get_session(session_id) == cached
+    assert cache.snapshot()["misses"] == 0
+
+
+def test_local_channel_invalidates_other_workers(engine):
+    channel = LocalInvalidationChannel()
+    worker_a = SessionsRepo(engine, cache=SessionCache(channel=channel))
+    worker_b = SessionsRepo(engine, cache=SessionCache(channel=channel))
+    session_id = worker_a.create_session("u")["session_id"]
+    assert worker_b.get_session(session_id)["title"] == "新对话"
+
+    worker_a.update_title(session_id, "来自 worker a")
+    assert worker_b.get_session(session_id)["title"] == "来自 worker a"
+    assert worker_b.cache.snapshot()["remote_invalidations"] == 1
+    # 自己发出的通知不会再失效一次
+    assert worker_a.cache.snapshot()["remote_invalidations"] == 0
+
+    worker_a.touch_session(session_id)
+    assert worker_b.get_session(session_id)["updated_at"] == worker_a.get_session(session_id)["updated_at"]
+
+
+def test_async_repo_uses_cache(tmp_path):
+    pytest.importorskip("aiosqlite")
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(sessions_metadata.create_all)
+        cache = SessionCache()
+        repo = AsyncSessionsRepo(engine, cache=cache)
+        try:
+            session_id = (await repo.create_session("u"))["session_id"]
+            assert (await repo.get_session(session_id))["title"] == "新对话"
+            await repo.update_title(session_id, "异步标题")
+            assert (await repo.get_session(session_id))["title"] == "异步标题"
+            await repo.delete_session(session_id)
+            assert await repo.get_session(session_id) is None
+        finally:
+            await engine.dispose()
+        return cache.snapshot()
+
+    stats = asyncio.run(scenario())
+    assert stats["hits"] == 1 and stats["invalidations"] == 2
+
+
+def test_admin_session_cache_stats(client, monkeypatch):
+    monkeypatch.setattr(session_cache_module, "_cache", SessionCache(channel=LocalInvalidationChannel()))
+    session_id = client.post("/paperapi/sessions", json={"user_id": "user_cache"}).json()["session_id"]
+    # 改标题：先读（命中）→ 更新并失效 → 重新读库（未命中）；随后读历史再次命中
+    assert client.patch(f"/paperapi/sessions/{session_id}/title", json={"title": "缓存"}).json()["title"] == "缓存"
+    assert client.get(f"/paperapi/sessions/{session_id}/messages").status_code == 200
+
+    stats = client.get("/admin/session-cache").json()
+    assert stats["enabled"] is True and stats["channel"] == "LocalInvalidationChannel"
+    assert (stats["hits"], stats["misses"], stats["invalidations"]) == (2, 1, 1)
+
+    monkeypatch.setattr("app.main.get_session_cache", lambda: None)
+    assert client.get("/admin/session-cache").json() == {"enabled": False}
@@ -0,0 +1,186 @@
+import asyncio
+import dataclasses
+import json
+import zlib
+from contextlib import aclosing
+
+from app.services.chat_turns import ChatTurn
+from app.services.sse import (
+    HEARTBEAT,
+    NDJSON,
+    SSE,
+    accepts_gzip,
+    event_stream,
+    format_event,
+    gzip_stream,
+    negotiate_format,
+)
+
+
+def test_idle_stream_sends_comment_heartbeats():
+    turn = ChatTurn("t1", "s1")
+
+    async def scenario():
+        writes = []
+
+        async def consume():
+            async for data in event_stream(turn, heartbeat_seconds=0.02):
+                writes.append(data)
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0.07)
+        turn.publish({"type": "text", "content": "a"})
+        turn.finish()
+        await consumer
+        return writes
+
+    writes = asyncio.run(scenario())
+    assert writes[0] == HEARTBEAT
+    assert writes.count(HEARTBEAT) >= 2
+    assert writes[-1].startswith("id: 1\n")
+
+
+def test_pending_events_are_coalesced_into_one_write():
+    turn = ChatTurn("t1", "s1")
+    for i in range(10):
+        turn.publish({"type": "text", "content": str(i)})
+    turn.finish()
+
+    async def collect(max_batch_events):
+        return [data async for data in event_stream(turn, max_batch_events=max_batch_events)]
+
+    single = asyncio.run(collect(64))
+    assert len(single) == 1
+    assert single[0].count("data: ") == 10
+
+    batched = asyncio.run(collect(4))
+    assert [w.count("data: ") for w in batched] == [4, 4, 2]
+    assert "".join(batched) == single[0]
+
+
+def test_producer_is_bounded_by_slow_subscriber():
+    turn = ChatTurn("t1", "s1", max_lag=3)
+    max_ahead = 0
+
+    async def scenario():
+        nonlocal max_ahead
+        received = []
+
+        async def produce():
+            for i in range(20):
+                await turn.drain()
+                turn.publish({"type": "text", "content": str(i)})
+            turn.finish()
+
+        async def slow_consume():
+            nonlocal max_ahead
+            async with aclosing(turn.subscribe()) as events:
+                async for event_id, event in events:
+                    max_ahead = max(max_ahead, turn.last_event_id - event_id)
+                    received.append(event["content"])
+                    await asyncio.sleep(0.001)
+
+        consumer = asyncio.create_task(slow_consume())
+        await asyncio.sleep(0)
+        await produce()
+        await consumer
+        return received
+
+    received = asyncio.run(scenario())
+    assert received == [str(i) for i in range(20)]
+    assert max_ahead <= 3
+    assert turn.backpressure_waits > 0
+
+
+def test_disconnected_subscriber_releases_backpressure():
+    turn = ChatTurn("t1", "s1", max_lag=2)
+
+    async def scenario():
+        stalled = turn.subscribe()
+        turn.publish({"type": "text", "content": "a"})
+        await anext(stalled)
+        turn.publish({"type": "text", "content": "b"})
+        turn.publish({"type": "text", "content": "c"})
+
+        producer = asyncio.create_task(turn.drain())
+        await asyncio.sleep(0.01)
+        blocked = not producer.done()
+        await stalled.aclose()
+        await asyncio.wait_for(producer, 1)
+        return blocked
+
+    assert asyncio.run(scenario()) is True
+
+
+def test_events_are_utf8_without_unicode_escapes():
+    data = format_event(3, {"type": "text", "content": "稀土催化"})
+    assert "稀土催化" in data
+    assert "\\u" not in data
+    assert json.loads(data.split("data: ", 1)[1]) == {"type": "text", "content": "稀土催化"}
+
+
+def test_format_negotiation():
+    assert negotiate_format(None) is SSE
+    assert negotiate_format("*/*") is SSE
+    assert negotiate_format("application/x-ndjson") is NDJSON
+    assert negotiate_format("application/x-ndjson, text/event-stream") is SSE
+    assert accepts_gzip("gzip, deflate, br")
+    assert not accepts_gzip("gzip;q=0, br")
+    assert not accepts_gzip(None)
+
+
+def test_gzip_stream_is_decodable_after_every_write():
+    pieces = ["id: 1\ndata: 一\n\n", "id: 2\ndata: 二\n\n", HEARTBEAT]
+
+    async def source():
+        for piece in pieces:
+            yield piece
+
+    async def collect():
+        return [chunk async for chunk in gzip_stream(source())]
+
+    compressed = asyncio.run(collect())
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # 每次写出都 sync flush：客户端收到一块就能解出对应的完整事件
+    for piece, chunk in zip(pieces, compressed):
+        assert decoder.decompress(chunk).decode("utf-8") == piece
+    assert decoder.decompress(compressed[-1]) == b""
+    assert decoder.eof
+
+
+def test_chat_stream_as_ndjson(client):
+    session_id = client.post("/paperapi/sessions", json={"user_id": "user_ndjson"}).json()["session_id"]
+
+    with client.stream(
+        "POST",
+        "/paperapi/chat",
+        json={"session_id": session_id, "text": "x", "pacing": "off"},
+        headers={"Accept": "application/x-ndjson"},
+    ) as response:
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        events = [json.loads(line) for line in response.iter_lines() if line]
+
+    assert [e["id"] for e in events] == list(range(1, len(events) + 1))
+    assert "".join(e["content"] for e in events if e["type"] == "text") == "Mocked Agent Response"
+
+
+def test_chat_stream_gzip_when_enabled(client, monkeypatch):
+    import app.api.chat as chat_api
+
+    monkeypatch.setattr(chat_api, "settings", dataclasses.replace(chat_api.settings, chat_stream_gzip=True))
+    session_id = client.post("/paperapi/sessions", json={"user_id": "user_gzip"}).json()["session_id"]
+
+    resp = client.post(
+        "/paperapi/chat",
+        json={"session_id": session_id, "text": "x", "pacing": "off"},
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert resp.headers["content-encoding"] == "gzip"
+    assert "Mocked " in resp.text
+
+    plain = client.post(
+        "/paperapi/chat",
+        json={"session_id": session_id, "text": "y", "pacing": "off"},
+        headers={"Accept-Encoding": "identity"},
+    )
+    assert "content-encoding" not in plain.headers
@@ -0,0 +1,104 @@
+import json
+
+from app.core.sse_decoder import AgentStreamDecoder, SSEDecoder, SSEEvent
+
+
+def _feed(decoder, lines):
+    out = []
+    for line in lines:
+        out.extend(decoder.feed_line(line))
+    out.extend(decoder.finish())
+    return out
+
+
+def test_sse_decoder_fields_and_multiline_data():
+    decoder = SSEDecoder()
+    lines = [
+        ": keep-alive comment",
+        "event: update",
+        "id: 42",
+        "retry: 1500",
+        "data: first line",
+        "data:second line",
+        "",
+        "data: next",
+        "",
+    ]
+    events = [e for e in (decoder.feed_line(line) for line in lines) if e is not None]
+
+    assert events == [
+        SSEEvent(data="first line\nsecond line", event="update", id="42"),
+        SSEEvent(data="next", event="message", id="42"),
+    ]
+    assert decoder.retry_ms == 1500
+
+
+def test_sse_decoder_flushes_last_event_without_blank_line():
+    decoder = SSEDecoder()
+    assert decoder.feed_line("data: tail") is None
+    assert decoder.flush() == SSEEvent(data="tail")
+    assert decoder.flush() is None
+
+
+def test_agent_decoder_dispatches_by_kind():
+    events = [
+        {"result": {"kind": "message", "parts": [{"kind": "text", "text": "你好"}, {"kind": "file"}]}},
+        {"result": {"kind": "artifact-update", "artifact": {"parts": [{"type": "text", "text": "世界"}]}}},
+        {"result": {"kind": "thought", "text": "检索中"}},
+        {"result": {"kind": "unknown-kind", "text": "ignored"}},
+        {"error": {"code": -32000, "message": "boom"}},
+    ]
+    lines = []
+    for e in events:
+        lines += [f"data: {json.dumps(e, ensure_ascii=False)}", ""]
+
+    chunks = _feed(AgentStreamDecoder(), lines)
+
+    assert chunks == [
+        {"type": "text", "content": "你好"},
+        {"type": "text", "content": "世界"},
+        {"type": "thought", "content": "检索中"},
+        {"type": "error", "content": "boom"},
+    ]
+
+
+def test_agent_decoder_forwards_status_update():
+    status = {"kind": "status-update", "status": {"state": "working"}, "final": False}
+    raw = json.dumps(status, ensure_ascii=False)
+
+    wrapped = _feed(AgentStreamDecoder(), [f"data: {json.dumps({'result': status})}", ""])
+    unwrapped = _feed(AgentStreamDecoder(), [f"data: {raw}", ""])
+
+    assert wrapped[0]["type"] == "thought"
+    assert json.loads(wrapped[0]["content"]) == status
+    # 未被 JSON-RPC 包裹时原样转发，不再重新序列化
+    assert unwrapped == [{"type": "thought", "content": raw}]
+
+
+def test_agent_decoder_tolerates_data_lines_without_separator():
+    a = json.dumps({"result": {"kind": "message", "parts": [{"kind": "text", "text": "A"}]}})
+    b = json.dumps({"result": {"kind": "message", "parts": [{"kind": "text", "text": "B"}]}})
+
+    chunks = _feed(AgentStreamDecoder(), [f"data: {a}", f"data: {b}", "data: not-json", ""])
+
+    assert [c["content"] for c in chunks] == ["A", "B"]
+
+
+def test_stdlib_loads_matches_json_module():
+    import pytest
+
+    from app.core.sse_decoder import _std_loads
+
+    for data in ['{"kind": "thought", "text": "思考"}', ' {"a": [1, 2]} ', '"x"', "3"]:
+        assert _std_loads(data) == json.loads(data)
+    for bad in ['{"a":', "", '{"a": 1} extra', "nope"]:
+        with pytest.raises(json.JSONDecodeError):
+            _std_loads(bad)
+
+
+def test_agent_decoder_keeps_sse_state_between_events():
+    decoder = AgentStreamDecoder()
+    event = json.dumps({"kind": "thought", "text": "t"})
+    lines = ["event: custom", "id: 7", f"data: {event}", "", "data:" + event, ""]
+    assert _feed(decoder, lines) == [{"type": "thought", "content": "t"}] * 2
+    assert decoder.sse.last_event_id == "7"
@@ -0,0 +1,182 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, event
+
+from app.core import db
+from app.core import session_cache as session_cache_module
+from app.core.session_cache import LocalInvalidationChannel, SessionCache
+from app.repositories.messages_repo import MessagesRepo
+from app.repositories.messages_repo import metadata as messages_metadata
+from app.repositories.sessions_repo import SessionsRepo
+from app.repositories.sessions_repo import metadata as sessions_metadata
+from app.services import write_behind as write_behind_module
+from app.services.write_behind import WriteBehindQueue
+
+
+@pytest.fixture(name="engine")
+def engine_fixture(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'wb.db'}", connect_args={"check_same_thread": False})
+    messages_metadata.create_all(engine)
+    sessions_metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def _text(content):
+    return [{"type": "text", "content": content}]
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_flush_commits_many_messages_in_one_transaction_then_touches_once(engine):
+    sessions = SessionsRepo(engine)
+    a = sessions.create_session("u")["session_id"]
+    b = sessions.create_session("u")["session_id"]
+    before = sessions.get_session(a)["updated_at"]
+
+    titled = []
+    writer = WriteBehindQueue(lambda: engine, interval_seconds=60, on_committed=titled.extend)
+    commits = []
+    try:
+        assert writer.put(a, "user", _text("问 1"))
+        assert writer.put(b, "user", _text("问 2"))
+        assert writer.put(a, "assistant", _text("答 1"), generate_title=True)
+        assert writer.has_pending(a) and writer.has_pending(b)
+        assert MessagesRepo(engine).list_messages(a) == []
+
+        event.listen(engine, "commit", lambda conn: commits.append(1))
+        assert writer.flush() == 3
+        # 消息一个事务 + 会话 touch 一条 UPDATE，与消息条数无关
+        assert commits == [1, 1]
+        assert not writer.has_pending(a) and not writer.has_pending(b)
+        assert [m["parts"][0]["content"] for m in MessagesRepo(engine).list_messages(a)] == ["问 1", "答 1"]
+        assert sessions.get_session(a)["updated_at"] >= before
+        assert titled == [a]
+
+        snapshot = writer.snapshot()
+        assert snapshot["flushes"] == 1 and snapshot["flushed_messages"] == 3
+        assert snapshot["depth"] == 0 and snapshot["max_depth"] == 3
+    finally:
+        writer.close()
+
+
+def test_flush_updates_session_cache_and_notifies_other_workers(engine, monkeypatch):
+    channel = LocalInvalidationChannel()
+    local, remote = SessionCache(channel=channel), SessionCache(channel=channel)
+    monkeypatch.setattr(session_cache_module, "_cache", local)
+    session_id = SessionsRepo(engine, cache=local).create_session("u")["session_id"]
+    SessionsRepo(engine, cache=remote).get_session(session_id)
+
+    writer = WriteBehindQueue(lambda: engine, interval_seconds=60)
+    try:
+        writer.put(session_id, "user", _text("问"))
+        writer.flush()
+    finally:
+        writer.close()
+
+    stored = SessionsRepo(engine).get_session(session_id)["updated_at"]
+    # 本进程缓存写穿新的 updated_at，其它进程收到通知后失效
+    assert local.get(session_id)["updated_at"] == stored
+    assert remote.snapshot()["remote_invalidations"] == 1 and remote.get(session_id) is None
+
+
+def test_failed_touch_does_not_requeue_committed_messages(engine, monkeypatch):
+    def broken_touch(self, session_ids):
+        raise RuntimeError("db gone")
+
+    monkeypatch.setattr(SessionsRepo, "touch_sessions", broken_touch)
+    writer = WriteBehindQueue(lambda: engine, interval_seconds=60)
+    try:
+        writer.put("s", "user", _text("1"))
+        assert writer.flush() == 1
+        assert writer.flush() == 0
+        assert writer.snapshot()["touch_errors"] == 1 and writer.snapshot()["flush_errors"] == 0
+    finally:
+        writer.close()
+    assert len(MessagesRepo(engine).list_messages("s")) == 1
+
+
+def test_writer_thread_flushes_on_interval_and_on_batch_size(engine):
+    timed = WriteBehindQueue(lambda: engine, interval_seconds=0.02)
+    sized = WriteBehindQueue(lambda: engine, interval_seconds=60, max_batch=3)
+    try:
+        timed.put("s1", "user", _text("定时"))
+        _wait_until(lambda: not timed.has_pending("s1"))
+
+        for i in range(3):
+            sized.put("s2", "user", _text(str(i)))
+        _wait_until(lambda: not sized.has_pending("s2"))
+        assert sized.snapshot()["last_batch_size"] == 3
+    finally:
+        timed.close()
+        sized.close()
+
+    assert len(MessagesRepo(engine).list_messages("s1")) == 1
+    assert len(MessagesRepo(engine).list_messages("s2")) == 3
+
+
+def test_full_queue_falls_back_to_write_through_in_order(engine):
+    writer = WriteBehindQueue(lambda: engine, interval_seconds=60, max_queue=2)
+    try:
+        assert writer.put("s", "user", _text("1"))
+        assert writer.put("s", "assistant", _text("2"))
+        assert not writer.put("s", "user", _text("3"))
+
+        writer.write_through("s", "user", _text("3"))
+        assert writer.depth == 0
+        assert writer.snapshot()["write_through"] == 1
+        assert [m["parts"][0]["content"] for m in MessagesRepo(engine).list_messages("s")] == ["1", "2", "3"]
+    finally:
+        writer.close()
+
+
+def test_failed_flush_requeues_batch_and_close_flushes_the_rest(engine):
+    calls = []
+
+    def flaky_engine():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("db down")
+        return engine
+
+    writer = WriteBehindQueue(flaky_engine, interval_seconds=60)
+    writer.put("s", "user", _text("1"))
+    writer.put("s", "assistant", _text("2"))
+
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    assert writer.depth == 2 and writer.has_pending("s")
+    assert writer.snapshot()["flush_errors"] == 1
+
+    writer.close()
+    assert not writer.put("s", "user", _text("3"))
+    assert [m["parts"][0]["content"] for m in MessagesRepo(engine).list_messages("s")] == ["1", "2"]
+
+
+def test_chat_history_reads_its_own_buffered_writes(client, monkeypatch):
+    writer = WriteBehindQueue(db.get_engine, interval_seconds=60)
+    monkeypatch.setattr(write_behind_module, "_writer", writer)
+    try:
+        session_id = client.post("/paperapi/sessions", json={"user_id": "user_wb"}).json()["session_id"]
+        resp = client.post("/paperapi/chat", json={"session_id": session_id, "text": "你好", "pacing": "off"})
+        assert resp.status_code == 200
+
+        # 还在缓冲里：直接查库看不到，读历史接口先提交再读
+        assert writer.has_pending(session_id)
+        assert MessagesRepo(db.get_engine()).list_messages(session_id) == []
+
+        hist = client.get(f"/paperapi/sessions/{session_id}/messages").json()
+        assert [m["role"] for m in hist["messages"]] == ["user", "assistant"]
+        assert hist["messages"][1]["parts"][0]["content"] == "Mocked Agent Response"
+
+        stats = client.get("/admin/write-behind").json()
+        assert stats["enabled"] is True
+        assert stats["flushes"] == 1 and stats["flushed_messages"] == 2 and stats["depth"] == 0
+    finally:
+        writer.close()
@@ -0,0 +1,247 @@
+"""
+本地 AgentKit 模拟服务：实现 AgentKitClient 使用的 JSON-RPC `message/stream` / `message/send` 协议，
+用于在没有外网的情况下对 `app.main:app` 做压测与延迟测试。
+
+启动（在仓库根目录）：
+    python -m tools.agentkit_simulator --port 8000 --token-rate 40 --first-token-ms 800
+
+然后让后端指向它：
+    AGENTKIT_BASE_URL=http://127.0.0.1:8000 AGENTKIT_API_KEY=sim python run.py
+
+单个请求可以通过 `params.metadata.simulator` 覆盖任意配置项，例如
+    {"answer_tokens": 2000, "disconnect_rate": 1.0}
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Any, AsyncIterator
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_TOKENS = (
+    "稀土", "元素", "在", "催化剂", "中", "的", "作用", "主要", "体现", "为", "储氧", "能力",
+    "与", "热稳定性", "。", "实验", "表明", "，", "掺杂", "比例", "显著", "影响", "氧空位",
+    "浓度", "；", "The ", "doping ", "ratio ", "of ", "CeO2 ", "affects ", "the ", "lattice. ",
+)
+
+
+@dataclass(frozen=True)
+class SimulatorConfig:
+    token_rate: float = 40.0  # 每秒输出的 token 数，0 表示不限速
+    first_token_ms: float = 500.0  # 首 token 延迟
+    answer_tokens: int = 200  # 回答长度（token 数）
+    tokens_per_event: int = 4  # 每个文本事件包含的 token 数
+    text_kind: str = "artifact-update"  # 文本事件的 kind：artifact-update / message
+    thoughts: int = 2  # 首 token 前输出的 thought 事件数
+    status_updates: bool = True  # 是否输出开始 / 结束的 status-update
+    error_rate: float = 0.0  # 直接返回 HTTP 503 的概率
+    rpc_error_rate: float = 0.0  # 流中途返回 JSON-RPC error 事件的概率
+    disconnect_rate: float = 0.0  # 流中途直接断开连接的概率
+    disconnect_after: float = 0.5  # 中途失败发生在回答的哪个位置（0~1）
+    seed: int | None = None
+
+    def override(self, values: Any) -> "SimulatorConfig":
+        """按请求覆盖配置；未知键忽略，值的类型与字段不符时抛出 ValueError（接口返回 400）"""
+        if values is None:
+            return self
+        if not isinstance(values, dict):
+            raise ValueError("simulator overrides must be an object")
+        updates = {f.name: _coerce(f.name, f.type, values[f.name]) for f in fields(self) if f.name in values}
+        return replace(self, **updates) if updates else self
+
+
+_TEXT_KINDS = ("artifact-update", "message")
+
+
+def _coerce(name: str, annotation: str, value: Any) -> Any:
+    # from __future__ import annotations 下 Field.type 是字符串；bool 是 int 的子类，需单独排除
+    if annotation == "int | None" and value is None:
+        return None
+    if annotation == "bool" and isinstance(value, bool):
+        return value
+    if annotation in ("int", "int | None") and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if annotation == "float" and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if annotation == "str" and isinstance(value, str) and (name != "text_kind" or value in _TEXT_KINDS):
+        return value
+    raise ValueError(f"invalid simulator override {name}={value!r} (expected {annotation})")
+
+
+class SimulatedDisconnect(Exception):
+    pass
+
+
+def _rpc(request_id: Any, result: dict[str, Any]) -> str:
+    return json.dumps({"jsonrpc": "2.0", "id": request_id, "result": result}, ensure_ascii=False)
+
+
+def _status(task_id: str, state: str, final: bool) -> dict[str, Any]:
+    return {"kind": "status-update", "taskId": task_id, "status": {"state": state}, "final": final}
+
+
+def _text_event(config: SimulatorConfig, task_id: str, text: str) -> dict[str, Any]:
+    part = {"kind": "text", "text": text}
+    if config.text_kind == "message":
+        return {"kind": "message", "role": "agent", "messageId": str(uuid.uuid4()), "parts": [part]}
+    return {
+        "kind": "artifact-update",
+        "taskId": task_id,
+        "artifact": {"artifactId": f"{task_id}-answer", "parts": [part]},
+        "append": True,
+    }
+
+
+def generate_answer(config: SimulatorConfig, rng: random.Random) -> list[str]:
+    return [rng.choice(_TOKENS) for _ in range(max(0, config.answer_tokens))]
+
+
+async def stream_events(
+    config: SimulatorConfig, request_id: Any, rng: random.Random
+) -> AsyncIterator[str]:
+    task_id = str(uuid.uuid4())
+    tokens = generate_answer(config, rng)
+    fail_at = int(len(tokens) * min(max(config.disconnect_after, 0.0), 1.0))
+    disconnect = rng.random() < config.disconnect_rate
+    rpc_error = not disconnect and rng.random() < config.rpc_error_rate
+
+    if config.status_updates:
+        yield f"data: {_rpc(request_id, _status(task_id, 'working', False))}\n\n"
+    for i in range(config.thoughts):
+        yield f"data: {_rpc(request_id, {'kind': 'thought', 'text': f'步骤 {i + 1}：检索相关论文'})}\n\n"
+
+    await asyncio.sleep(config.first_token_ms / 1000.0)
+
+    start = time.monotonic()
+    step = max(1, config.tokens_per_event)
+    for emitted in range(0, len(tokens), step):
+        if emitted >= fail_at and (disconnect or rpc_error):
+            if disconnect:
+                raise SimulatedDisconnect("simulated mid-stream disconnect")
+            error = {"code": -32603, "message": "simulated agent error"}
+            yield f"data: {json.dumps({'jsonrpc': '2.0', 'id': request_id, 'error': error})}\n\n"
+            return
+
+        if config.token_rate > 0:
+            # 按目标速率对齐到绝对时间，避免 sleep 误差累积
+            delay = start + emitted / config.token_rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        text = "".join(tokens[emitted : emitted + step])
+        yield f"data: {_rpc(request_id, _text_event(config, task_id, text))}\n\n"
+
+    if config.status_updates:
+        yield f"data: {_rpc(request_id, _status(task_id, 'completed', True))}\n\n"
+
+
+def create_app(config: SimulatorConfig | None = None) -> FastAPI:
+    base_config = config or SimulatorConfig()
+    app = FastAPI(title="AgentKit simulator")
+    app.state.stats = {"requests": 0, "streams": 0, "sends": 0, "errors": 0}
+    seed_rng = random.Random(base_config.seed)
+
+    @app.get("/stats")
+    def stats():
+        return {"config": asdict(base_config), **app.state.stats}
+
+    @app.post("/")
+    async def rpc(request: Request):
+        app.state.stats["requests"] += 1
+        body = await request.json()
+        params = body.get("params") or {}
+        metadata = params.get("metadata") or {}
+        request_id = body.get("id")
+
+        if not request.headers.get("authorization", "").startswith("Bearer "):
+            return JSONResponse({"detail": "missing bearer token"}, status_code=401)
+        try:
+            cfg = base_config.override(metadata.get("simulator"))
+        except ValueError as e:
+            return JSONResponse({"detail": str(e)}, status_code=400)
+        rng = random.Random(seed_rng.random() if cfg.seed is None else cfg.seed)
+        if rng.random() < cfg.error_rate:
+            app.state.stats["errors"] += 1
+            return JSONResponse({"detail": "simulated upstream failure"}, status_code=503)
+
+        method = body.get("method")
+        if method == "message/stream":
+            app.state.stats["streams"] += 1
+            return StreamingResponse(
+                stream_events(cfg, request_id, rng), media_type="text/event-stream"
+            )
+
+        if method == "message/send":
+            app.state.stats["sends"] += 1
+            await asyncio.sleep(cfg.first_token_ms / 1000.0)
+            tokens = generate_answer(cfg, rng)
+            if cfg.token_rate > 0:
+                await asyncio.sleep(len(tokens) / cfg.token_rate)
+            text = "".join(tokens)
+            result = {
+                "kind": "task",
+                "id": str(uuid.uuid4()),
+                "status": {"state": "completed"},
+                "artifacts": [{"artifactId": "answer", "parts": [{"kind": "text", "text": text}]}],
+                "history": [
+                    params.get("message") or {},
+                    {"kind": "message", "role": "agent", "parts": [{"kind": "text", "text": text}]},
+                ],
+            }
+            return JSONResponse({"jsonrpc": "2.0", "id": request_id, "result": result})
+
+        error = {"code": -32601, "message": f"method not found: {method}"}
+        return JSONResponse({"jsonrpc": "2.0", "id": request_id, "error": error})
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    defaults = SimulatorConfig()
+    parser.add_argument("--token-rate", type=float, default=defaults.token_rate)
+    parser.add_argument("--first-token-ms", type=float, default=defaults.first_token_ms)
+    parser.add_argument("--answer-tokens", type=int, default=defaults.answer_tokens)
+    parser.add_argument("--tokens-per-event", type=int, default=defaults.tokens_per_event)
+    parser.add_argument("--text-kind", choices=_TEXT_KINDS, default=defaults.text_kind)
+    parser.add_argument("--thoughts", type=int, default=defaults.thoughts)
+    parser.add_argument(
+        "--no-status-updates", dest="status_updates", action="store_false", help="不输出开始 / 结束的 status-update"
+    )
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--rpc-error-rate", type=float, default=defaults.rpc_error_rate)
+    parser.add_argument("--disconnect-rate", type=float, default=defaults.disconnect_rate)
+    parser.add_argument("--disconnect-after", type=float, default=defaults.disconnect_after)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = SimulatorConfig(
+        token_rate=args.token_rate,
+        first_token_ms=args.first_token_ms,
+        answer_tokens=args.answer_tokens,
+        tokens_per_event=args.tokens_per_event,
+        text_kind=args.text_kind,
+        thoughts=args.thoughts,
+        status_updates=args.status_updates,
+        error_rate=args.error_rate,
+        rpc_error_rate=args.rpc_error_rate,
+        disconnect_rate=args.disconnect_rate,
+        disconnect_after=args.disconnect_after,
+        seed=args.seed,
+    )
+
+    import uvicorn
+
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()